@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the cost of each update of the cache file in ``cache_time_series``
+against the previous implementation (concatenating the whole cache with each
+new year, sorting it and rewriting the file), on a synthetic monthly time
+series.  With the append-only cache, the time per update stays roughly
+constant as the cache grows; with the previous implementation, it grows
+with the number of years already cached.
+
+Usage:
+    python benchmarks/benchmark_cache_time_series.py --years 100 --cells 20000
+
+Authors
+-------
+Xylar Asay-Davis
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+import numpy
+import xarray as xr
+
+from mpas_analysis.shared.time_series import cache_time_series
+from mpas_analysis.shared.constants import constants
+
+
+def get_times(yearCount):  # {{{
+    """
+    The middle of each month in days since 0001-01-01 on a noleap calendar
+    """
+    daysInMonth = numpy.array(constants.daysInMonth, float)
+    monthStarts = numpy.cumsum(daysInMonth) - daysInMonth
+    years = numpy.arange(1, yearCount+1)
+    return (365.*(years[:, numpy.newaxis]-1) + monthStarts +
+            0.5*daysInMonth).ravel()  # }}}
+
+
+def make_calc_function(times, cellCount, updateTimes):  # {{{
+    """
+    Make a function that "computes" a time series at the given times and
+    records the time since it was last called (i.e. the time spent updating
+    the cache)
+    """
+    random = numpy.random.RandomState(seed=0)
+    lastCall = [None]
+
+    def compute(timeIndices, firstCall):
+        now = time.time()
+        if lastCall[0] is not None:
+            updateTimes.append(now - lastCall[0])
+        ds = xr.Dataset()
+        ds['Time'] = ('Time', times[timeIndices])
+        ds['field'] = (('Time', 'nCells'),
+                       random.rand(len(timeIndices), cellCount))
+        lastCall[0] = time.time()
+        return ds
+
+    return compute, lastCall  # }}}
+
+
+def cache_time_series_with_concat(timesInDataSet, timeSeriesCalcFunction,
+                                  cacheFileName):  # {{{
+    """
+    The previous implementation of updating the cache in
+    ``cache_time_series`` with one year per update
+    """
+    years = numpy.floor(timesInDataSet/365.).astype(int)
+    dsCache = None
+    firstCall = True
+    for year in numpy.unique(years):
+        timeIndices = numpy.nonzero(years == year)[0]
+        ds = timeSeriesCalcFunction(timeIndices, firstCall)
+        firstCall = False
+        if dsCache is not None:
+            dsCache = xr.concat([dsCache, ds], dim='Time')
+            dsCache = dsCache.loc[{'Time': sorted(dsCache.Time.values)}]
+        else:
+            dsCache = ds
+        dsCache.to_netcdf(cacheFileName)
+    return dsCache  # }}}
+
+
+def run(function, times, cellCount, cacheFileName, *args):  # {{{
+    """
+    Run one implementation, returning the time of each cache update
+    """
+    updateTimes = []
+    compute, lastCall = make_calc_function(times, cellCount, updateTimes)
+    function(times, compute, cacheFileName, *args)
+    # the last update happens after the last call to compute
+    updateTimes.append(time.time() - lastCall[0])
+    return numpy.array(updateTimes)  # }}}
+
+
+def main():  # {{{
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--years', dest='years', type=int, default=50,
+                        help='The number of years in the time series')
+    parser.add_argument('--cells', dest='cells', type=int, default=10000,
+                        help='The number of cells in each time entry')
+    args = parser.parse_args()
+
+    times = get_times(args.years)
+    tempDirectory = tempfile.mkdtemp()
+    try:
+        previous = run(cache_time_series_with_concat, times, args.cells,
+                       '{}/previous.nc'.format(tempDirectory))
+
+        # the returned data set is read back from the cache, which isn't part
+        # of the cost of an update, so it is measured separately
+        updateTimes = run(cache_time_series, times, args.cells,
+                          '{}/appended.nc'.format(tempDirectory),
+                          'gregorian_noleap', 1)
+    finally:
+        shutil.rmtree(tempDirectory)
+
+    print 'years: {}, cells: {}'.format(args.years, args.cells)
+    print 'seconds per update   first 5 years   last 5 years   total'
+    for name, seconds in [('previous', previous),
+                          ('append-only', updateTimes[:-1])]:
+        print '{:20s} {:13.4f} {:14.4f} {:7.2f}'.format(
+            name, seconds[:5].mean(), seconds[-5:].mean(), seconds.sum())
+    print 'reading back the append-only cache: {:.3f} s'.format(
+        updateTimes[-1])
+    # }}}
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
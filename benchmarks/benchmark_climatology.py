@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the single-pass climatology kernel used by
+``compute_monthly_climatology`` and ``compute_climatology`` against the
+previous implementation (one ``where(..., drop=True)`` subset of the data set
+per month or season) on a synthetic monthly data set.
+
+Usage:
+    python benchmarks/benchmark_climatology.py --years 50 --cells 20000
+
+Authors
+-------
+Xylar Asay-Davis
+"""
+
+import argparse
+import time
+import numpy
+import xarray as xr
+
+from mpas_analysis.shared.climatology import compute_monthly_climatology, \
+    compute_climatology, add_years_months_days_in_month
+from mpas_analysis.shared.constants import constants
+
+
+def make_data_set(yearCount, cellCount, maskVaries):  # {{{
+    """
+    Make a synthetic data set with one time per month and, if
+    ``maskVaries``, a mask that changes with time
+    """
+    timeCount = 12*yearCount
+    random = numpy.random.RandomState(seed=0)
+    ds = xr.Dataset()
+    ds.coords['year'] = ('Time', numpy.repeat(numpy.arange(1, yearCount+1),
+                                              12))
+    ds.coords['month'] = ('Time', numpy.tile(numpy.arange(1, 13), yearCount))
+    ds.coords['daysInMonth'] = ('Time', numpy.tile(
+        numpy.array(constants.daysInMonth, float), yearCount))
+    for variableName in ['sst', 'sss', 'mld']:
+        values = random.rand(timeCount, cellCount)
+        if maskVaries:
+            values[random.rand(timeCount, cellCount) < 0.2] = numpy.nan
+        else:
+            values[:, random.rand(cellCount) < 0.2] = numpy.nan
+        ds[variableName] = (('Time', 'nCells'), values)
+    return ds  # }}}
+
+
+def compute_climatology_with_where(ds, monthValues, maskVaries):  # {{{
+    """
+    The previous implementation of ``compute_climatology``, copying the
+    months to be averaged out of ``ds``
+    """
+    ds = add_years_months_days_in_month(ds)
+
+    mask = xr.zeros_like(ds.month, bool)
+    for month in monthValues:
+        mask = xr.ufuncs.logical_or(mask, ds.month == month)
+
+    ds = ds.where(mask, drop=True)
+
+    dsWeightedSum = (ds * ds.daysInMonth).sum(dim='Time', keep_attrs=True)
+    if maskVaries:
+        weights = ds.copy(deep=True)
+        for var in ds.data_vars:
+            weights[var] = ds[var].notnull()
+        weightSum = (weights * ds.daysInMonth).sum(dim='Time')
+        return dsWeightedSum / weightSum.where(weightSum > 0.)
+    else:
+        days = ds.daysInMonth.sum(dim='Time')
+        return dsWeightedSum / days.where(days > 0.)  # }}}
+
+
+def compute_monthly_climatology_with_where(ds, maskVaries):  # {{{
+    """
+    The previous implementation of ``compute_monthly_climatology``
+    """
+    def compute_one_month_climatology(ds):
+        monthValues = list(ds.month.values)
+        return compute_climatology_with_where(ds, monthValues, maskVaries)
+
+    return ds.groupby('month').apply(compute_one_month_climatology)  # }}}
+
+
+def time_call(function, *args):  # {{{
+    """
+    Time a function call, returning the result and the time in seconds
+    """
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start  # }}}
+
+
+def main():  # {{{
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--years', dest='years', type=int, default=30,
+                        help='The number of years in the data set')
+    parser.add_argument('--cells', dest='cells', type=int, default=10000,
+                        help='The number of cells in the data set')
+    args = parser.parse_args()
+
+    print 'years: {}, cells: {}'.format(args.years, args.cells)
+    for maskVaries in [False, True]:
+        ds = make_data_set(args.years, args.cells, maskVaries).load()
+
+        old, oldTime = time_call(compute_monthly_climatology_with_where, ds,
+                                 maskVaries)
+        new, newTime = time_call(compute_monthly_climatology, ds, None,
+                                 maskVaries)
+        maxDiff = max([float(abs(new[var] - old[var]).max())
+                       for var in ds.data_vars])
+        print 'monthly, maskVaries={}: previous {:.3f} s, single-pass ' \
+              '{:.3f} s, speedup {:.1f}x, max difference {:g}'.format(
+                  maskVaries, oldTime, newTime, oldTime/newTime, maxDiff)
+
+        oldTime = 0.
+        newTime = 0.
+        maxDiff = 0.
+        for season in constants.abrevMonthNames + ['JFM', 'JAS', 'DJF',
+                                                   'ANN']:
+            monthValues = constants.monthDictionary[season]
+            old, elapsed = time_call(compute_climatology_with_where, ds,
+                                     monthValues, maskVaries)
+            oldTime += elapsed
+            new, elapsed = time_call(compute_climatology, ds, monthValues,
+                                     None, maskVaries)
+            newTime += elapsed
+            maxDiff = max([maxDiff] +
+                          [float(abs(new[var] - old[var]).max())
+                           for var in ds.data_vars])
+        print 'seasonal, maskVaries={}: previous {:.3f} s, single-pass ' \
+              '{:.3f} s, speedup {:.1f}x, max difference {:g}'.format(
+                  maskVaries, oldTime, newTime, oldTime/newTime, maxDiff)
+    # }}}
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
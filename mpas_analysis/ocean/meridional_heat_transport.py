@@ -99,6 +99,8 @@ class MeridionalHeatTransport(AnalysisTask):  # {{{
                           'one ')
 
         self.mhtFile = mhtFiles[0]
+        # the file read while the task runs, so it runs again if it changes
+        self.inputFiles = [self.mhtFile]
 
         self.sectionName = 'meridionalHeatTransport'
 
@@ -105,6 +105,19 @@ class StreamfunctionMOC(AnalysisTask):  # {{{
         self.startYearTseries = config.getint('timeSeries', 'startYear')
         self.endYearTseries = config.getint('timeSeries', 'endYear')
 
+        # the files read while the task runs, so it runs again if they change
+        # (e.g. when output for more years becomes available)
+        self.inputFiles = []
+        try:
+            self.inputFiles.append(self.runStreams.readpath('restart')[0])
+            self.inputFiles.extend(sorted(self.historyStreams.readpath(
+                'timeSeriesStatsMonthlyOutput',
+                startDate=self.startDateTseries,
+                endDate=self.endDateTseries, calendar=self.calendar)))
+        except ValueError:
+            # missing files are reported when the task runs
+            pass
+
         self.sectionName = 'streamfunctionMOC'
 
         self.variableList = ['timeMonthly_avg_normalVelocity',
@@ -1,6 +1,6 @@
 from ..shared.analysis_task import AnalysisTask
 
-from ..shared.io import StreamsFile
+from ..shared.io import get_streams_file
 from ..shared.io.utility import build_config_full_path
 
 from ..shared.timekeeping.utility import get_simulation_start_time
@@ -42,8 +42,8 @@ class SeaIceAnalysisTask(AnalysisTask):  # {{{
                                                   'runSubdirectory')
             oceanStreamsFileName = build_config_full_path(
                 self.config, 'input', 'oceanStreamsFileName')
-            oceanStreams = StreamsFile(oceanStreamsFileName,
-                                       streamsdir=runDirectory)
+            oceanStreams = get_streams_file(oceanStreamsFileName,
+                                            streamsdir=runDirectory)
             self.simulationStartTime = get_simulation_start_time(oceanStreams)
 
         try:
@@ -55,14 +55,18 @@ class SeaIceAnalysisTask(AnalysisTask):  # {{{
                                                       'runSubdirectory')
                 oceanStreamsFileName = build_config_full_path(
                     self.config, 'input', 'oceanStreamsFileName')
-                oceanStreams = StreamsFile(oceanStreamsFileName,
-                                           streamsdir=runDirectory)
+                oceanStreams = get_streams_file(oceanStreamsFileName,
+                                                streamsdir=runDirectory)
                 self.restartFileName = oceanStreams.readpath('restart')[0]
             except ValueError:
                 raise IOError('No MPAS-O or MPAS-Seaice restart file found: '
                               'need at least one restart file \n'
                               'for sea ice analysis tasks')
 
+        # the mesh file read while the task runs, so it runs again if the
+        # file changes
+        self.inputFiles = [self.restartFileName]
+
         # }}}
 
 
@@ -1,4 +1,7 @@
+import os
+import numpy
 import xarray as xr
+from collections import OrderedDict
 
 from .sea_ice_analysis_task import SeaIceAnalysisTask
 
@@ -6,7 +9,7 @@ from ..shared.plot.plotting import timeseries_analysis_plot, \
     timeseries_analysis_plot_polar
 
 from ..shared.io.utility import build_config_full_path, check_path_exists, \
-    make_directories
+    make_directories, write_atomically
 
 from ..shared.timekeeping.utility import date_to_days, days_to_datetime, \
     datetime_to_days
@@ -34,6 +37,9 @@ class TimeSeriesSeaIce(SeaIceAnalysisTask):
     Xylar Asay-Davis, Milena Veneziani
     """
 
+    # the regions in the mask file used to compute hemispheric totals
+    _hemispheres = ['NH', 'SH']
+
     def __init__(self, config, mpasTimeSeriesTask):  # {{{
         """
         Construct the analysis task.
@@ -88,9 +94,21 @@ class TimeSeriesSeaIce(SeaIceAnalysisTask):
         self.startDate = self.config.get('timeSeries', 'startDate')
         self.endDate = self.config.get('timeSeries', 'endDate')
 
-        self.variableList = ['timeMonthly_avg_iceAreaCell',
-                             'timeMonthly_avg_iceVolumeCell']
-        self.mpasTimeSeriesTask.add_variables(variableList=self.variableList)
+        # the hemispheric totals are computed as the time series is
+        # extracted, so the full fields are never stored
+        variables = OrderedDict([('iceArea', 'timeMonthly_avg_iceAreaCell'),
+                                 ('iceVolume',
+                                  'timeMonthly_avg_iceVolumeCell')])
+        self.variableList = variables.keys()
+
+        maskFileName = '{}/seaIceHemisphereMasks.nc'.format(
+            build_config_full_path(config, 'output',
+                                   'timeSeriesSubdirectory'))
+        self._write_hemisphere_masks(maskFileName)
+        self.mpasTimeSeriesTask.add_regional_reduction(
+            reductionName='seaIceHemispheres', variables=variables,
+            maskFileName=maskFileName, meshFileName=self.restartFileName,
+            operation='sum')
 
         self.inputFile = self.mpasTimeSeriesTask.outputFile
 
@@ -558,22 +576,38 @@ class TimeSeriesSeaIce(SeaIceAnalysisTask):
 
         return dsShift  # }}}
 
-    def _compute_area_vol(self, ds, hemisphere):  # {{{
+    def _write_hemisphere_masks(self, maskFileName):  # {{{
         '''
-        Compute part of the time series of sea ice volume and area, given time
-        indices to process.
+        Write a file with the masks of cells in the northern and southern
+        hemispheres (the regions in ``_hemispheres``), unless it already
+        exists and is newer than the restart file it was made from.  The file
+        is written under a temporary name and then moved, so a write that was
+        interrupted doesn't leave a corrupt mask behind.
         '''
+        if os.path.exists(maskFileName) and \
+                os.path.getmtime(maskFileName) > \
+                os.path.getmtime(self.restartFileName):
+            return
 
-        if hemisphere == 'NH':
-            mask = self.dsMesh.latCell > 0
-        else:
-            mask = self.dsMesh.latCell < 0
-        ds = ds.where(mask)
+        make_directories(os.path.dirname(maskFileName))
+        with xr.open_dataset(self.restartFileName) as dsMesh:
+            latCell = dsMesh.latCell.values
+
+        masks = numpy.zeros((len(latCell), len(self._hemispheres)), 'i4')
+        masks[:, self._hemispheres.index('NH')] = latCell > 0
+        masks[:, self._hemispheres.index('SH')] = latCell < 0
+
+        dsMask = xr.Dataset()
+        dsMask['regionCellMasks'] = (('nCells', 'nRegions'), masks)
+        write_atomically(dsMask, maskFileName)  # }}}
+
+    def _compute_area_vol(self, ds, hemisphere):  # {{{
+        '''
+        Compute the time series of sea ice volume, area and mean thickness
+        for a hemisphere from the hemispheric totals.
+        '''
 
-        dsAreaSum = (ds*self.dsMesh.areaCell).sum('nCells')
-        dsAreaSum = dsAreaSum.rename(
-                {'timeMonthly_avg_iceAreaCell': 'iceArea',
-                 'timeMonthly_avg_iceVolumeCell': 'iceVolume'})
+        dsAreaSum = ds.isel(nRegions=self._hemispheres.index(hemisphere))
         dsAreaSum['iceThickness'] = (dsAreaSum.iceVolume /
                                      self.dsMesh.areaCell.sum('nCells'))
 
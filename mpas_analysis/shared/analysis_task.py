@@ -8,14 +8,18 @@ Xylar Asay-Davis
 '''
 
 import warnings
-from multiprocessing import Process, Value
-import time
+from multiprocessing import Process, Value, Array
+from collections import OrderedDict
+import numpy
 import traceback
 import logging
 import sys
 
-from .io import NameList, StreamsFile
+from .io import get_namelist, get_streams_file
 from .io.utility import build_config_full_path, make_directories
+from .resource_usage import ResourceMonitor, resourceUsageNames
+from .trace import start_phase_recording, stop_phase_recording, \
+    write_phases
 
 
 class AnalysisTask(Process):  # {{{
@@ -78,6 +82,15 @@ class AnalysisTask(Process):  # {{{
     logger : ``logging.Logger``
         A logger for output during the run phase of an analysis task
 
+    memoryEstimate : float
+        An estimate of the peak memory (in GB) used by the task, or ``None``
+        if unknown.  The scheduler uses the peak memory measured in previous
+        runs in preference to this estimate, when available.
+
+    cpuCount : int
+        The number of cores the task uses while running (e.g. because it
+        launches several processes of its own), 1 by default
+
     Authors
     -------
     Xylar Asay-Davis
@@ -146,13 +159,21 @@ class AnalysisTask(Process):  # {{{
         self.logger = None
         self.runAfterTasks = []
         self.xmlFileNames = []
+        self.memoryEstimate = None
+        self.cpuCount = 1
 
         # non-public attributes related to multiprocessing and logging
         self.daemon = True
         self._setupStatus = None
+        self._setupDuration = None
+        self._setupError = None
+        self._setupLock = None
         self._runStatus = Value('i', AnalysisTask.UNSET)
         self._stackTrace = None
         self._logFileName = None
+        self._completionQueue = None
+        # the resources used while running, NaN if not measured
+        self._resourceUsage = Array('d', [numpy.nan]*len(resourceUsageNames))
         # }}}
 
     def setup_and_check(self):  # {{{
@@ -193,15 +214,15 @@ class AnalysisTask(Process):  # {{{
         namelistFileName = build_config_full_path(
             self.config,  'input',
             '{}NamelistFileName'.format(self.componentName))
-        self.namelist = NameList(namelistFileName)
+        self.namelist = get_namelist(namelistFileName)
 
         streamsFileName = build_config_full_path(
             self.config, 'input',
             '{}StreamsFileName'.format(self.componentName))
-        self.runStreams = StreamsFile(streamsFileName,
-                                      streamsdir=self.runDirectory)
-        self.historyStreams = StreamsFile(streamsFileName,
-                                          streamsdir=self.historyDirectory)
+        self.runStreams = get_streams_file(streamsFileName,
+                                           streamsdir=self.runDirectory)
+        self.historyStreams = get_streams_file(
+            streamsFileName, streamsdir=self.historyDirectory)
 
         self.calendar = self.namelist.get('config_calendar_type')
 
@@ -232,6 +253,39 @@ class AnalysisTask(Process):  # {{{
         '''
         return  # }}}
 
+    def get_output_files(self):  # {{{
+        '''
+        Get the files this task produces, used to check whether the task
+        needs to run again.  By default, these are the XML files describing
+        the task's plots.  Tasks that produce other files (e.g. climatologies
+        or time series) should override this method.
+
+        Returns
+        -------
+        outputFiles : list of str
+            The paths of the files produced by this task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return list(self.xmlFileNames)  # }}}
+
+    def _get_resource_usage(self):  # {{{
+        '''
+        Get the resources used while the task ran (see
+        ``shared.resource_usage.resourceUsageNames``), with ``None`` for
+        those that weren't measured (e.g. because the task ran as a separate
+        command)
+        '''
+        resourceUsage = OrderedDict()
+        for index, name in enumerate(resourceUsageNames):
+            value = self._resourceUsage[index]
+            if numpy.isnan(value):
+                value = None
+            resourceUsage[name] = value
+        return resourceUsage  # }}}
+
     def run_after(self, task):  # {{{
         '''
         Only run this task after the given task has completed.  This allows a
@@ -318,7 +372,8 @@ class AnalysisTask(Process):  # {{{
             sys.stdout = StreamToLogger(self.logger, logging.INFO)
             sys.stderr = StreamToLogger(self.logger, logging.ERROR)
 
-        startTime = time.time()
+        monitor = ResourceMonitor()
+        start_phase_recording()
         try:
             self.run_task()
             self._runStatus.value = AnalysisTask.SUCCESS
@@ -330,7 +385,13 @@ class AnalysisTask(Process):  # {{{
                               "{}".format(self.fullTaskName, self._stackTrace))
             self._runStatus.value = AnalysisTask.FAIL
 
-        runDuration = time.time() - startTime
+        write_phases(logsDirectory, self.fullTaskName, stop_phase_recording())
+
+        resourceUsage = monitor.stop()
+        for index, name in enumerate(resourceUsageNames):
+            if resourceUsage[name] is not None:
+                self._resourceUsage[index] = resourceUsage[name]
+        runDuration = resourceUsage['wallTime']
         m, s = divmod(runDuration, 60)
         h, m = divmod(int(m), 60)
         self.logger.info('Execution time: {}:{:02d}:{:05.2f}'.format(h, m, s))
@@ -344,6 +405,11 @@ class AnalysisTask(Process):  # {{{
         # writeLogFile==False)
         self.logger.handlers = []
 
+        if self._completionQueue is not None:
+            # let the scheduler know this task is done so it can launch any
+            # tasks that were waiting on it
+            self._completionQueue.put((self.taskName, self.subtaskName))
+
         # }}}
 
     def check_generate(self):
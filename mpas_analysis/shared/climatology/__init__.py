@@ -4,6 +4,8 @@ from .climatology import get_remapper, \
     add_years_months_days_in_month, remap_and_write_climatology
 
 from .mpas_climatology_task import MpasClimatologyTask
+from .mpas_climatology_shard_subtask import MpasClimatologyShardSubtask
+from .monthly_accumulator import MonthlyAccumulator
 from .remap_mpas_climatology_subtask import RemapMpasClimatologySubtask
 from .comparison_descriptors import get_comparison_descriptor, \
     get_antarctic_stereographic_projection
@@ -19,8 +19,15 @@ from ..io.utility import build_config_full_path, make_directories, \
 from ..io import write_netcdf
 
 from ..interpolation import Remapper
+from ..trace import traced
 from ..grid import LatLonGridDescriptor, ProjectionGridDescriptor
 
+from .monthly_accumulator import _update_moments, _get_std
+
+# the maximum number of values of a variable read at once when computing
+# climatologies, so memory use is bounded for data sets with many times
+_maxChunkElements = 10000000
+
 
 def get_remapper(config, sourceDescriptor, comparisonDescriptor,
                  mappingFilePrefix, method, logger=None):  # {{{
@@ -170,6 +177,7 @@ def get_observation_climatology_file_names(config, fieldName, monthNames,
     return (climatologyFileName, remappedFileName)  # }}}
 
 
+@traced('compute')
 def compute_monthly_climatology(ds, calendar=None, maskVaries=True):  # {{{
     """
     Compute monthly climatologies from a data set.  The mean is weighted but
@@ -207,20 +215,25 @@ def compute_monthly_climatology(ds, calendar=None, maskVaries=True):  # {{{
     Xylar Asay-Davis
     """
 
-    def compute_one_month_climatology(ds):
-        monthValues = list(ds.month.values)
-        return compute_climatology(ds, monthValues, calendar, maskVaries)
-
     ds = add_years_months_days_in_month(ds, calendar)
 
-    monthlyClimatology = \
-        ds.groupby('month').apply(compute_one_month_climatology)
+    # a row of weights for each month present in the data set, with the
+    # number of days in each time that falls in that month and zero otherwise
+    months = numpy.unique(ds.month.values)
+    daysInMonth = ds.daysInMonth.values
+    weights = xr.DataArray(
+        numpy.where(ds.month.values == months[:, numpy.newaxis],
+                    daysInMonth, 0.),
+        dims=('month', 'Time'), coords={'month': months})
+
+    monthlyClimatology = _compute_weighted_mean(ds, weights, maskVaries)
 
     return monthlyClimatology  # }}}
 
 
+@traced('compute')
 def compute_climatology(ds, monthValues, calendar=None,
-                        maskVaries=True):  # {{{
+                        maskVaries=True, computeVariability=False):  # {{{
     """
     Compute a monthly, seasonal or annual climatology data set from a data
     set.  The mean is weighted but the number of days in each month of
@@ -249,6 +262,13 @@ def compute_climatology(ds, monthValues, calendar=None,
         time, whereas observations may sometimes be present only at some
         times and not at others, requiring ``maskVaries = True``.
 
+    computeVariability : bool, optional
+        Whether to also compute the interannual standard deviation of the
+        mean over the months in each year (``<var>_std``) and the number of
+        years with data (``<var>_count``) of each variable, in the same pass
+        through the data as the mean.  Only supported if ``ds`` is an
+        ``xarray.Dataset``.
+
     Returns
     -------
     climatology : object of same type as ``ds``
@@ -256,21 +276,60 @@ def compute_climatology(ds, monthValues, calendar=None,
         of ds over all months in monthValues, weighted by the number of days
         in each month.
 
+    Raises
+    ------
+    TypeError
+        If ``computeVariability == True`` and ``ds`` is not an
+        ``xarray.Dataset``
+
     Authors
     -------
     Xylar Asay-Davis
     """
 
-    ds = add_years_months_days_in_month(ds, calendar)
-
-    mask = xr.zeros_like(ds.month, bool)
-
-    for month in monthValues:
-        mask = xr.ufuncs.logical_or(mask, ds.month == month)
+    if computeVariability and not isinstance(ds, xr.core.dataset.Dataset):
+        raise TypeError('computeVariability is only supported for '
+                        'xarray.Dataset objects')
 
-    climatologyMonths = ds.where(mask, drop=True)
+    ds = add_years_months_days_in_month(ds, calendar)
 
-    climatology = _compute_masked_mean(climatologyMonths, maskVaries)
+    # index (rather than mask) the times in the season, so only those times
+    # are read or copied
+    timeIndices = numpy.nonzero(numpy.in1d(
+        ds.month.values, numpy.atleast_1d(monthValues)))[0]
+    ds = ds.isel(Time=timeIndices)
+    daysInMonth = ds.daysInMonth.values
+
+    if not computeVariability:
+        weights = xr.DataArray(daysInMonth, dims=('Time',))
+        return _compute_weighted_mean(ds, weights, maskVaries)
+
+    # the first set of weights is for the climatology and the others for the
+    # mean in each year, all of which are computed in one pass
+    years = numpy.unique(ds.year.values)
+    yearWeights = numpy.where(ds.year.values == years[:, numpy.newaxis],
+                              daysInMonth, 0.)
+    weights = xr.DataArray(
+        numpy.concatenate([daysInMonth[numpy.newaxis, :], yearWeights]),
+        dims=('weights', 'Time'))
+
+    means = _compute_weighted_mean(ds, weights, maskVaries)
+    climatology = means.isel(weights=0)
+    for variableName in ds.data_vars:
+        if 'Time' not in ds[variableName].dims:
+            continue
+        yearlyMeans = means[variableName].values[1:]
+        count = numpy.zeros(yearlyMeans.shape[1:])
+        mean = numpy.zeros(count.shape)
+        m2 = numpy.zeros(count.shape)
+        for yearlyMean in yearlyMeans:
+            _update_moments(count, mean, m2, yearlyMean)
+        dims = climatology[variableName].dims
+        climatology['{}_std'.format(variableName)] = xr.DataArray(
+            _get_std(count, m2), dims=dims,
+            attrs=climatology[variableName].attrs)
+        climatology['{}_count'.format(variableName)] = xr.DataArray(
+            count.astype(numpy.int32), dims=dims)
 
     return climatology  # }}}
 
@@ -413,45 +472,103 @@ def remap_and_write_climatology(config, climatologyDataSet,
     return remappedClimatology  # }}}
 
 
-def _compute_masked_mean(ds, maskVaries):  # {{{
-    '''
-    Compute the time average of data set, masked out where the variables in ds
-    are NaN and, if ``maskVaries == True``, weighting by the number of days
-    used to compute each monthly mean time in ds.
-
-    Authors
-    -------
-    Xylar Asay-Davis
+def _compute_weighted_mean(ds, weights, maskVaries):  # {{{
     '''
-    def ds_to_weights(ds):
-        # make an identical data set to ds but replacing all data arrays with
-        # nonnull applied to that data array
-        weights = ds.copy(deep=True)
-        if isinstance(ds, xr.core.dataarray.DataArray):
-            weights = ds.notnull()
-        elif isinstance(ds, xr.core.dataset.Dataset):
-            for var in ds.data_vars:
-                weights[var] = ds[var].notnull()
-        else:
-            raise TypeError('ds must be an instance of either xarray.Dataset '
-                            'or xarray.DataArray.')
-
-        return weights
+    Compute time averages of a data set weighted by one or more sets of
+    weights (e.g. the number of days in each time that falls in a given month
+    or season), in a single pass over the data.
 
-    if maskVaries:
-        dsWeightedSum = (ds * ds.daysInMonth).sum(dim='Time', keep_attrs=True)
+    The data are read a chunk of times at a time and the weighted sums (and,
+    if ``maskVaries == True``, the sums of weights where the data are valid)
+    are accumulated with a tensor dot product over ``Time``, so neither a
+    copy of the data set nor a data set of weights is ever made.
 
-        weights = ds_to_weights(ds)
+    Parameters
+    ----------
+    ds : ``xarray.Dataset`` or ``xarray.DataArray`` object
+        A data set with a ``Time`` dimension
 
-        weightSum = (weights * ds.daysInMonth).sum(dim='Time')
+    weights : ``xarray.DataArray``
+        The weights for each time, with dimension ``Time`` and optionally
+        another dimension (e.g. ``month``) over which sets of weights are
+        given
 
-        timeMean = dsWeightedSum / weightSum.where(weightSum > 0.)
-    else:
-        days = ds.daysInMonth.sum(dim='Time')
+    maskVaries : bool
+        If the mask (where variables in ``ds`` are ``NaN``) varies with time,
+        in which case weights are only summed where each variable is valid
 
-        dsWeightedSum = (ds * ds.daysInMonth).sum(dim='Time', keep_attrs=True)
+    Returns
+    -------
+    timeMean : object of same type as ``ds``
+        The weighted mean, without a ``Time`` dimension but with the other
+        dimension of ``weights`` (if any) as the first dimension
 
-        timeMean = dsWeightedSum / days.where(days > 0.)
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    weightDims = [dim for dim in weights.dims if dim != 'Time']
+    weights = weights.transpose(*(weightDims + ['Time']))
+    weightValues = weights.values
+    weightCoords = {dim: weights.coords[dim] for dim in weightDims
+                    if dim in weights.coords}
+    totalWeight = weightValues.sum(axis=-1)
+
+    def mean_of_array(da):
+        if 'Time' not in da.dims:
+            return da
+
+        otherDims = [dim for dim in da.dims if dim != 'Time']
+        da = da.transpose(*(['Time'] + otherDims))
+        shape = weightValues.shape[:-1] + da.shape[1:]
+
+        weightedSum = numpy.zeros(shape)
+        if maskVaries:
+            weightSum = numpy.zeros(shape)
+
+        timeCount = da.shape[0]
+        timesPerChunk = max(1, _maxChunkElements //
+                            max(1, int(numpy.prod(da.shape[1:]))))
+        for startIndex in range(0, timeCount, timesPerChunk):
+            endIndex = min(startIndex + timesPerChunk, timeCount)
+            chunkWeights = weightValues[..., startIndex:endIndex]
+            values = numpy.asarray(
+                da.isel(Time=slice(startIndex, endIndex)).values, float)
+            valid = numpy.logical_not(numpy.isnan(values))
+            values[numpy.logical_not(valid)] = 0.
+            weightedSum += numpy.tensordot(chunkWeights, values, axes=1)
+            if maskVaries:
+                weightSum += numpy.tensordot(chunkWeights, valid, axes=1)
+
+        if not maskVaries:
+            weightSum = totalWeight.reshape(
+                totalWeight.shape + (1,)*len(otherDims))
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            timeMean = numpy.where(weightSum > 0., weightedSum/weightSum,
+                                   numpy.nan)
+
+        # coordinates like year, month and daysInMonth are averaged away
+        coords = dict(weightCoords)
+        for coord in da.coords:
+            if 'Time' not in da.coords[coord].dims:
+                coords[coord] = da.coords[coord]
+
+        return xr.DataArray(timeMean, dims=weightDims + otherDims,
+                            coords=coords, attrs=da.attrs, name=da.name)
+
+    if isinstance(ds, xr.core.dataarray.DataArray):
+        return mean_of_array(ds)
+    elif not isinstance(ds, xr.core.dataset.Dataset):
+        raise TypeError('ds must be an instance of either xarray.Dataset '
+                        'or xarray.DataArray.')
+
+    timeMean = xr.Dataset(attrs=ds.attrs)
+    for coord in ds.coords:
+        if 'Time' not in ds.coords[coord].dims:
+            timeMean.coords[coord] = ds.coords[coord]
+    for variableName in ds.data_vars:
+        timeMean[variableName] = mean_of_array(ds[variableName])
 
     return timeMean  # }}}
 
@@ -0,0 +1,530 @@
+"""
+A class for accumulating day-weighted sums of MPAS output for each month of
+the year, from which monthly, seasonal and annual climatologies are derived
+without reading the output more than once.
+
+Authors
+-------
+Xylar Asay-Davis
+"""
+
+import xarray
+import numpy
+from collections import OrderedDict
+
+from ..constants import constants
+from ..mpas_xarray import mpas_xarray
+from ..trace import traced
+
+
+class MonthlyAccumulator(object):  # {{{
+    """
+    Day-weighted sums of variables for each of the 12 months of the year.
+
+    The climatology over any set of months (a season) is the sum over those
+    months divided by the total number of days, so every season can be
+    computed from the same sums.  Like ``ncclimo -a sdd``, December is
+    averaged with January and February of the same year in ``DJF``.
+
+    Optionally, the interannual variability of the mean over each of a list
+    of seasons is also accumulated, using Welford's online algorithm as each
+    year is added (see ``add_year``) and Chan et al.'s pairwise algorithm
+    when accumulators are merged, so it is computed in the same pass as the
+    climatology.
+
+    Attributes
+    ----------
+    variableList : list of str
+        The variables to accumulate
+
+    sums : ``OrderedDict`` of ``numpy.ndarray``
+        The day-weighted sum of each variable for each month, with the month
+        (0-11) as the first dimension
+
+    days : ``numpy.ndarray``
+        The total number of days accumulated for each month
+
+    monthCount : int
+        The number of months of data accumulated
+
+    seasons : list of str
+        The seasons (keys in ``constants.monthDictionary``) for which
+        interannual variability is accumulated
+
+    moments : ``OrderedDict`` of tuple of ``numpy.ndarray``
+        The number of years, the mean and the sum of squared differences from
+        the mean of the yearly seasonal means of each variable, with the
+        season as the first dimension
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    """
+
+    def __init__(self, variableList, seasons=None):  # {{{
+        """
+        Construct an empty accumulator
+
+        Parameters
+        ----------
+        variableList : list of str
+            The variables to accumulate
+
+        seasons : list of str, optional
+            The seasons for which to accumulate interannual variability
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        self.variableList = list(variableList)
+        self.sums = OrderedDict()
+        self.days = numpy.zeros(12)
+        self.monthCount = 0
+        if seasons is None:
+            seasons = []
+        self.seasons = list(seasons)
+        self.moments = OrderedDict()
+
+        # the dimensions, data type and attributes of each variable, used to
+        # write climatologies that look like the monthly output
+        self._templates = OrderedDict()  # }}}
+
+    def add(self, ds, month, days=None):  # {{{
+        """
+        Add one month of data to the sums
+
+        Parameters
+        ----------
+        ds : ``xarray.Dataset``
+            A data set with the variables for a single month (without a
+            ``Time`` dimension)
+
+        month : int
+            The month of the year (1-12) of the data
+
+        days : float, optional
+            The number of days in the month, by default the number in
+            ``constants.daysInMonth``
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        if days is None:
+            days = constants.daysInMonth[month-1]
+
+        for variableName in self.variableList:
+            da = ds[variableName]
+            if variableName not in self.sums:
+                self.sums[variableName] = numpy.zeros((12,) + da.shape)
+                self._templates[variableName] = (da.dims, da.dtype,
+                                                 da.attrs)
+            self.sums[variableName][month-1] += days*da.values
+
+        self.days[month-1] += days
+        self.monthCount += 1  # }}}
+
+    @traced('load')
+    def add_file(self, fileName, month, days=None):  # {{{
+        """
+        Read the variables from a monthly MPAS output file with a single time
+        index and add them to the sums
+
+        Parameters
+        ----------
+        fileName : str
+            The ``timeSeriesStatsMonthly`` output file to read
+
+        month : int
+            The month of the year (1-12) of the data in the file
+
+        days : float, optional
+            The number of days in the month, by default the number in
+            ``constants.daysInMonth``
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        ds = xarray.open_dataset(fileName, decode_times=False)
+        try:
+            ds = mpas_xarray.subset_variables(ds, self.variableList)
+            if 'Time' in ds.dims:
+                ds = ds.isel(Time=0)
+            self.add(ds.load(), month, days)
+        finally:
+            ds.close()  # }}}
+
+    def add_year(self, other):  # {{{
+        """
+        Add the sums from an accumulator with the data from a single year
+        and, for each season with data for all of its months in that year,
+        update the interannual variability with the mean over the season
+
+        Parameters
+        ----------
+        other : ``MonthlyAccumulator``
+            An accumulator with (at least) the same variables and data from
+            only one year
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        self._merge_sums(other)
+
+        for seasonIndex, season in enumerate(self.seasons):
+            monthIndices = [month-1 for month in
+                            constants.monthDictionary[season]]
+            if numpy.any(other.days[monthIndices] == 0.):
+                continue
+            totalDays = other.days[monthIndices].sum()
+            for variableName in self.variableList:
+                seasonalMean = \
+                    other.sums[variableName][monthIndices].sum(axis=0) / \
+                    totalDays
+                if variableName not in self.moments:
+                    shape = (len(self.seasons),) + seasonalMean.shape
+                    self.moments[variableName] = \
+                        tuple(numpy.zeros(shape) for index in range(3))
+                count, mean, m2 = self.moments[variableName]
+                # indexing with an ellipsis gives views, even of scalars
+                _update_moments(count[seasonIndex, ...],
+                                mean[seasonIndex, ...],
+                                m2[seasonIndex, ...], seasonalMean)
+        # }}}
+
+    def merge(self, other):  # {{{
+        """
+        Add the sums and interannual variability from another accumulator
+        (e.g. for other years) to these
+
+        Parameters
+        ----------
+        other : ``MonthlyAccumulator``
+            An accumulator with (at least) the same variables and, if this
+            accumulator has seasons, the same seasons
+
+        Raises
+        ------
+        ValueError
+            If the two accumulators have different seasons
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        self._merge_sums(other)
+
+        if len(self.seasons) == 0:
+            return
+
+        if other.seasons != self.seasons:
+            raise ValueError('Cannot merge variability for seasons {} into '
+                             'seasons {}'.format(other.seasons,
+                                                 self.seasons))
+
+        for variableName in self.variableList:
+            if variableName not in other.moments:
+                continue
+            if variableName not in self.moments:
+                self.moments[variableName] = tuple(
+                    moment.copy() for moment in other.moments[variableName])
+            else:
+                self.moments[variableName] = _merge_moments(
+                    self.moments[variableName], other.moments[variableName])
+        # }}}
+
+    def subtract(self, other):  # {{{
+        """
+        Remove the sums and interannual variability of another accumulator
+        that was previously added to this one (e.g. the first year of a
+        sliding window of years)
+
+        Parameters
+        ----------
+        other : ``MonthlyAccumulator``
+            An accumulator with (at least) the same variables and, if this
+            accumulator has seasons, the same seasons
+
+        Raises
+        ------
+        ValueError
+            If the two accumulators have different seasons
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        for variableName in self.variableList:
+            self.sums[variableName] -= other.sums[variableName]
+
+        self.days -= other.days
+        self.monthCount -= other.monthCount
+
+        if len(self.seasons) == 0:
+            return
+
+        if other.seasons != self.seasons:
+            raise ValueError('Cannot remove variability for seasons {} from '
+                             'seasons {}'.format(other.seasons,
+                                                 self.seasons))
+
+        for variableName in self.variableList:
+            if variableName in other.moments:
+                self.moments[variableName] = _remove_moments(
+                    self.moments[variableName], other.moments[variableName])
+        # }}}
+
+    def _merge_sums(self, other):  # {{{
+        """
+        Add the sums from another accumulator to these sums
+        """
+        for variableName in self.variableList:
+            if variableName not in self.sums:
+                self.sums[variableName] = other.sums[variableName].copy()
+                self._templates[variableName] = \
+                    other._templates[variableName]
+            else:
+                self.sums[variableName] += other.sums[variableName]
+
+        self.days += other.days
+        self.monthCount += other.monthCount  # }}}
+
+    def to_dataset(self):  # {{{
+        """
+        Get the sums as a data set that can be written to a file and read
+        back in with ``from_dataset``
+
+        Returns
+        -------
+        ds : ``xarray.Dataset``
+            A data set with the sum of each variable and the number of days
+            (``daysInMonth``) for each month, and the total number of days
+            and months in the ``totalDays`` and ``totalMonths`` attributes
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        ds = xarray.Dataset()
+        ds.coords['month'] = ('month', numpy.arange(1, 13))
+        ds['daysInMonth'] = ('month', self.days)
+        for variableName in self.sums:
+            dims, dtype, attrs = self._templates[variableName]
+            attrs = dict(attrs)
+            # the sums are stored in double precision, so keep track of the
+            # type of the variable itself
+            attrs['climatologyDtype'] = numpy.dtype(dtype).str
+            ds[variableName] = xarray.DataArray(
+                self.sums[variableName], dims=('month',) + tuple(dims),
+                attrs=attrs)
+        if len(self.moments) > 0:
+            ds.coords['season'] = ('season', self.seasons)
+        for variableName in self.moments:
+            dims = ('season',) + tuple(self._templates[variableName][0])
+            for suffix, moment in zip(_momentSuffixes,
+                                      self.moments[variableName]):
+                ds['{}{}'.format(variableName, suffix)] = (dims, moment)
+        ds.attrs['totalDays'] = self.days.sum()
+        ds.attrs['totalMonths'] = self.monthCount
+        return ds  # }}}
+
+    @classmethod
+    def from_dataset(cls, ds, variableList):  # {{{
+        """
+        Make an accumulator from sums written by ``to_dataset``
+
+        Parameters
+        ----------
+        ds : ``xarray.Dataset``
+            A data set produced by ``to_dataset``
+
+        variableList : list of str
+            The variables to read, all of which must be in ``ds``.  Their
+            interannual variability is also read if it is in ``ds``.
+
+        Returns
+        -------
+        accumulator : ``MonthlyAccumulator``
+            The accumulator with the sums from ``ds``
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        seasons = None
+        if 'season' in ds.coords:
+            seasons = [str(season) for season in ds.season.values]
+        accumulator = cls(variableList, seasons)
+        for variableName in variableList:
+            da = ds[variableName]
+            attrs = dict(da.attrs)
+            dtype = numpy.dtype(attrs.pop('climatologyDtype', 'f8'))
+            accumulator.sums[variableName] = da.values.astype(float)
+            accumulator._templates[variableName] = (da.dims[1:], dtype,
+                                                    attrs)
+            momentNames = ['{}{}'.format(variableName, suffix) for suffix in
+                           _momentSuffixes]
+            if all([name in ds for name in momentNames]):
+                accumulator.moments[variableName] = tuple(
+                    ds[name].values.astype(float) for name in momentNames)
+        accumulator.days = ds.daysInMonth.values.astype(float)
+        accumulator.monthCount = int(ds.attrs['totalMonths'])
+        return accumulator  # }}}
+
+    def get_climatology(self, monthValues):  # {{{
+        """
+        Get the climatology over the given months
+
+        Parameters
+        ----------
+        monthValues : list of int
+            The months (1-12) to average over
+
+        Returns
+        -------
+        climatology : ``xarray.Dataset``
+            The day-weighted mean of each variable over the months, with a
+            ``Time`` dimension of size 1 like climatologies from ``ncclimo``
+
+        Raises
+        ------
+        ValueError
+            If no data has been added for one of the months
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        monthIndices = [month-1 for month in monthValues]
+        totalDays = self.days[monthIndices].sum()
+        missing = [month for month in monthValues
+                   if self.days[month-1] == 0.]
+        if len(missing) > 0:
+            raise ValueError('No data was found for month(s) {}'.format(
+                ', '.join([str(month) for month in missing])))
+
+        climatology = xarray.Dataset()
+        for variableName in self.variableList:
+            dims, dtype, attrs = self._templates[variableName]
+            mean = self.sums[variableName][monthIndices].sum(axis=0) / \
+                totalDays
+            climatology[variableName] = xarray.DataArray(
+                mean[numpy.newaxis, ...].astype(dtype),
+                dims=('Time',) + tuple(dims), attrs=attrs)
+        return climatology  # }}}
+
+    def get_variability(self, season):  # {{{
+        """
+        Get the interannual standard deviation of the mean over a season and
+        the number of years it was computed from
+
+        Parameters
+        ----------
+        season : str
+            One of ``seasons``
+
+        Returns
+        -------
+        variability : ``xarray.Dataset``
+            The standard deviation (``<var>_std``) and number of years
+            (``<var>_count``) of each variable, with a ``Time`` dimension of
+            size 1.  The standard deviation is ``NaN`` where there are fewer
+            than 2 years, including when no year had all the months of any
+            season (e.g. June of one year through May of the next).
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        seasonIndex = self.seasons.index(season)
+        variability = xarray.Dataset()
+        for variableName in self.variableList:
+            dims, dtype, attrs = self._templates[variableName]
+            dims = ('Time',) + tuple(dims)
+            if variableName in self.moments:
+                count, mean, m2 = [moment[seasonIndex] for moment in
+                                   self.moments[variableName]]
+            else:
+                # no year had all the months of a season
+                shape = self.sums[variableName].shape[1:]
+                count = numpy.zeros(shape)
+                m2 = numpy.zeros(shape)
+            std = _get_std(count, m2)
+            variability['{}_std'.format(variableName)] = xarray.DataArray(
+                std[numpy.newaxis, ...].astype(dtype), dims=dims,
+                attrs=attrs)
+            variability['{}_count'.format(variableName)] = xarray.DataArray(
+                count[numpy.newaxis, ...].astype(numpy.int32), dims=dims)
+        return variability  # }}}
+
+    # }}}
+
+
+# the suffixes of the variables in which the interannual count, mean and sum
+# of squared differences from the mean are stored by ``to_dataset``
+_momentSuffixes = ['_yearCount', '_yearMean', '_yearM2']
+
+
+def _update_moments(count, mean, m2, values):  # {{{
+    """
+    Update the count, mean and sum of squared differences from the mean
+    (in place) with a new sample using Welford's online algorithm, skipping
+    values that are NaN
+    """
+    valid = numpy.isfinite(values)
+    values = numpy.where(valid, values, 0.)
+    count += valid
+    delta = numpy.where(valid, values - mean, 0.)
+    mean += delta/numpy.maximum(count, 1)
+    m2 += delta*numpy.where(valid, values - mean, 0.)  # }}}
+
+
+def _merge_moments(moments, otherMoments):  # {{{
+    """
+    Merge the count, mean and sum of squared differences from the mean of two
+    sets of samples using the pairwise algorithm of Chan et al. (1979)
+    """
+    count, mean, m2 = moments
+    otherCount, otherMean, otherM2 = otherMoments
+    totalCount = count + otherCount
+    fraction = otherCount/numpy.maximum(totalCount, 1)
+    delta = otherMean - mean
+    mean = mean + delta*fraction
+    m2 = m2 + otherM2 + delta**2*count*fraction
+    return totalCount, mean, m2  # }}}
+
+
+def _remove_moments(moments, otherMoments):  # {{{
+    """
+    Remove the count, mean and sum of squared differences from the mean of a
+    subset of samples, reversing ``_merge_moments``
+    """
+    count, mean, m2 = moments
+    otherCount, otherMean, otherM2 = otherMoments
+    remainingCount = count - otherCount
+    remainingMean = numpy.where(
+        remainingCount > 0,
+        (count*mean - otherCount*otherMean)/numpy.maximum(remainingCount, 1),
+        0.)
+    delta = otherMean - remainingMean
+    remainingM2 = m2 - otherM2 - \
+        delta**2*remainingCount*otherCount/numpy.maximum(count, 1)
+    # avoid small negative values from round-off
+    remainingM2 = numpy.maximum(remainingM2, 0.)
+    return remainingCount, remainingMean, remainingM2  # }}}
+
+
+def _get_std(count, m2):  # {{{
+    """
+    Get the sample standard deviation from the count and sum of squared
+    differences from the mean, which is NaN where there are fewer than 2
+    samples
+    """
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(count > 1, numpy.sqrt(m2/(count - 1)),
+                           numpy.nan)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,128 @@
+from ..analysis_task import AnalysisTask
+
+
+class MpasClimatologyShardSubtask(AnalysisTask):  # {{{
+    '''
+    An analysis subtask for computing the monthly sums of MPAS output over
+    a range of the climatology years (a shard), so the shards can be computed
+    in parallel.  The sums are cached by the parent ``MpasClimatologyTask``,
+    which runs after its shards and merges the cached sums into the
+    climatologies.
+
+    Attributes
+    ----------
+    mpasClimatologyTask : ``MpasClimatologyTask``
+        The task that this subtask computes sums for
+
+    yearGroups : list of list of int
+        The groups of years (one for each cache file) in this shard
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def __init__(self, mpasClimatologyTask, shardIndex, yearGroups):  # {{{
+        '''
+        Construct the analysis task and adds it as a subtask of the
+        ``mpasClimatologyTask``.
+
+        Parameters
+        ----------
+        mpasClimatologyTask : ``MpasClimatologyTask``
+            The task that this subtask computes sums for
+
+        shardIndex : int
+            The index of the shard, used to name the subtask
+
+        yearGroups : list of list of int
+            The groups of years (one for each cache file) in this shard
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        tags = ['climatology']
+
+        # call the constructor from the base class (AnalysisTask)
+        super(MpasClimatologyShardSubtask, self).__init__(
+            config=mpasClimatologyTask.config,
+            taskName=mpasClimatologyTask.taskName,
+            subtaskName='shard{}'.format(shardIndex),
+            componentName=mpasClimatologyTask.componentName,
+            tags=tags)
+
+        self.mpasClimatologyTask = mpasClimatologyTask
+        self.yearGroups = yearGroups
+
+        mpasClimatologyTask.add_subtask(self)
+
+        # }}}
+
+    @property
+    def variableList(self):  # {{{
+        '''
+        The variables of the climatology task, which are only all known once
+        every task has been set up
+        '''
+        return self.mpasClimatologyTask.variableList  # }}}
+
+    @property
+    def inputFiles(self):  # {{{
+        '''
+        The input files in the years of this shard
+        '''
+        filesByYear = self.mpasClimatologyTask._get_files_by_year()
+        inputFiles = []
+        for years in self.yearGroups:
+            for year in years:
+                inputFiles.extend([fileName for fileName, month in
+                                   filesByYear.get(year, [])])
+        return inputFiles  # }}}
+
+    def run_task(self):  # {{{
+        '''
+        Compute and cache the monthly sums for the years in this shard
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        mpasClimatologyTask = self.mpasClimatologyTask
+        variableList = mpasClimatologyTask._get_variables_to_sum()
+        if len(variableList) == 0:
+            # nothing to do
+            return
+
+        self.logger.info('\nComputing monthly sums for years {:04d}-{:04d} '
+                         'of:\n    {}'.format(self.yearGroups[0][0],
+                                              self.yearGroups[-1][-1],
+                                              ', '.join(variableList)))
+
+        filesByYear = mpasClimatologyTask._get_files_by_year()
+        seasons = mpasClimatologyTask._get_variability_seasons()
+        for years in self.yearGroups:
+            mpasClimatologyTask._get_partial_sums(years, filesByYear,
+                                                  variableList, seasons)
+
+        # }}}
+
+    def get_output_files(self):  # {{{
+        '''
+        Get the cache files of monthly sums this subtask produces
+
+        Returns
+        -------
+        outputFiles : list of str
+            The paths of the cache files
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return [self.mpasClimatologyTask._get_partial_sums_file_name(years)
+                for years in self.yearGroups]  # }}}
+
+    # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -1,14 +1,31 @@
 import xarray
 import os
 import warnings
-import subprocess
+import threading
+import tempfile
+import shutil
+from collections import OrderedDict
 from distutils.spawn import find_executable
 
 from ..analysis_task import AnalysisTask
 
 from ..constants import constants
 
-from ..io.utility import build_config_full_path, make_directories
+from ..io.utility import build_config_full_path, make_directories, \
+    write_atomically
+from ..io import write_netcdf
+from ..io.manifest import write_manifest, read_manifest, \
+    get_missing_variables, get_fingerprint
+from ..trace import traced
+from ..subprocess_runner import run_command
+
+from .monthly_accumulator import MonthlyAccumulator
+from .mpas_climatology_shard_subtask import MpasClimatologyShardSubtask
+from .climatology import _get_year_string
+
+# tasks that depend on this task add variables while they are being set up,
+# possibly in several threads at once
+_variableLock = threading.Lock()
 
 
 class MpasClimatologyTask(AnalysisTask):  # {{{
@@ -40,6 +57,29 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
     startYear, endYear : int
         The start and end years of the climatology
 
+    useNcclimo : bool
+        Whether climatologies are computed with ``ncclimo`` or directly in
+        MPAS-Analysis, reading each input file only once.  In the latter
+        case, the monthly sums for every ``yearsPerCacheFile`` years are
+        cached, so only new years need to be read when the climatology is
+        extended.
+
+    computeVariability : bool
+        Whether the interannual standard deviation (``<var>_std``) and the
+        number of years (``<var>_count``) of each variable are written to the
+        climatology files along with the mean (only if ``useNcclimo`` is
+        ``False``)
+
+    windows : list of tuple of int
+        The first and last years of each sliding-window climatology (e.g.
+        each decade of the climatology years), computed in addition to the
+        climatology over all years (only if ``useNcclimo`` is ``False``)
+
+    shardCount : int
+        The number of ``MpasClimatologyShardSubtask`` subtasks that compute
+        the monthly sums over parts of the climatology years in parallel
+        before this task merges them (only if ``useNcclimo`` is ``False``)
+
     Authors
     -------
     Xylar Asay-Davis
@@ -65,6 +105,7 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
         '''
         self.variableList = []
         self.seasons = []
+        self.windows = []
 
         tags = ['climatology']
 
@@ -110,16 +151,17 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
         Xylar Asay-Davis
         '''
 
-        for variable in variableList:
-            if variable not in self.variableList:
-                self.variableList.append(variable)
+        with _variableLock:
+            for variable in variableList:
+                if variable not in self.variableList:
+                    self.variableList.append(variable)
 
-        if seasons is not None:
-            for season in seasons:
-                if season not in self.seasons:
-                    self.seasons.append(season)
+            if seasons is not None:
+                for season in seasons:
+                    if season not in self.seasons:
+                        self.seasons.append(season)
 
-        self._setup_file_names()
+            self._setup_file_names()
 
         # }}}
 
@@ -165,6 +207,49 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
 
         self._update_climatology_bounds_from_file_names()
 
+        self.useNcclimo = self.config.getWithDefault('climatology',
+                                                     'useNcclimo',
+                                                     default=True)
+
+        self.computeVariability = self.config.getWithDefault(
+            'climatology', 'computeVariability', default=False)
+
+        if self.computeVariability and self.useNcclimo:
+            raise ValueError('computeVariability requires the climatology '
+                             'to be computed without ncclimo.  Set '
+                             'useNcclimo = False in the climatology section '
+                             'of the config file.')
+
+        windowLength = self.config.getWithDefault(
+            'climatology', 'windowLengthYears', default=0)
+        if windowLength > 0:
+            if self.useNcclimo:
+                raise ValueError('Sliding-window climatologies require the '
+                                 'climatology to be computed without '
+                                 'ncclimo.  Set useNcclimo = False in the '
+                                 'climatology section of the config file.')
+            windowStride = self.config.getWithDefault(
+                'climatology', 'windowStrideYears', default=windowLength)
+            self.windows = [
+                (firstYear, firstYear + windowLength - 1) for firstYear in
+                range(self.startYear, self.endYear - windowLength + 2,
+                      windowStride)]
+
+        self.shardCount = self.config.getWithDefault(
+            'climatology', 'shardCount', default=1)
+        if self.shardCount > 1:
+            if self.useNcclimo:
+                raise ValueError('Sharding climatologies requires the '
+                                 'climatology to be computed without '
+                                 'ncclimo.  Set useNcclimo = False in the '
+                                 'climatology section of the config file.')
+            self._add_shard_subtasks()
+
+        if self.useNcclimo and \
+                self.config.get('execute', 'ncclimoParallelMode') == 'bck':
+            # ncclimo runs one process for each monthly climatology
+            self.cpuCount = 12
+
         # }}}
 
     def run_task(self):  # {{{
@@ -185,37 +270,71 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
                                  os.path.basename(self.inputFiles[0]),
                                  os.path.basename(self.inputFiles[-1])))
 
-        if self.seasons[0] is 'none':
-            seasonsToCheck = ['{:02d}'.format(month) for month in range(1, 13)]
-        else:
-            seasonsToCheck = self.seasons
+        if len(self.windows) > 0:
+            self._compute_window_climatologies()
 
-        allExist = True
-        for season in seasonsToCheck:
+        variableList, staleSeasons, sourceFingerprint = \
+            self._find_missing_variables()
 
-            climatologyFileName, climatologyDirectory = \
-                self.get_file_name(season, returnDir=True)
+        if len(variableList) == 0:
+            return
 
-            if not os.path.exists(climatologyFileName):
-                allExist = False
-                break
+        self.logger.info('  Variables to compute: {}'.format(
+            ', '.join(variableList)))
+
+        # compute the climatologies in a temporary directory and then merge
+        # them into any existing files
+        climatologyFileName, climatologyDirectory = \
+            self.get_file_name(self._get_seasons_to_check()[0],
+                               returnDir=True)
+        tempDirectory = tempfile.mkdtemp(dir=climatologyDirectory,
+                                         prefix='tmp_')
+        try:
+            if self.useNcclimo:
+                self._compute_climatologies_with_ncclimo(
+                        inDirectory=self.historyDirectory,
+                        outDirectory=tempDirectory,
+                        variableList=variableList)
+            else:
+                self._compute_climatologies_with_python(
+                    outDirectory=tempDirectory, variableList=variableList)
+
+            for season in self._get_seasons_to_check():
+                climatologyFileName = self.get_file_name(season)
+                newFileName = '{}/{}'.format(
+                    tempDirectory, os.path.basename(climatologyFileName))
+                self._merge_climatology(
+                    newFileName, climatologyFileName,
+                    self._get_output_variables(variableList),
+                    sourceFingerprint, season,
+                    replace=(season in staleSeasons))
+        finally:
+            shutil.rmtree(tempDirectory)
 
-        if allExist:
-            # make sure all the necessary variables are also present
-            ds = xarray.open_dataset(self.get_file_name(seasonsToCheck[0],
-                                                        returnDir=False))
+        # }}}
 
-            for variableName in self.variableList:
-                if variableName not in ds.variables:
-                    allExist = False
-                    break
+    def get_output_files(self):  # {{{
+        '''
+        Get the climatology files this task produces
 
-        if not allExist:
-            self._compute_climatologies_with_ncclimo(
-                    inDirectory=self.historyDirectory,
-                    outDirectory=climatologyDirectory)
+        Returns
+        -------
+        outputFiles : list of str
+            The paths of the climatology files
 
-        # }}}
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if len(self.variableList) == 0:
+            # nothing to do, so no file names were set up
+            return []
+        outputFiles = list(self._outputFiles.values())
+        for season in self._outputFiles:
+            for startYear, endYear in self.windows:
+                outputFiles.append(self.get_window_file_name(
+                    season, startYear, endYear))
+        return sorted(outputFiles)  # }}}
 
     def get_file_name(self, season, returnDir=False):  # {{{
         """
@@ -252,6 +371,203 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
         else:
             return fileName  # }}}
 
+    def get_window_file_name(self, season, startYear, endYear):  # {{{
+        """
+        Get the path to a sliding-window climatology file
+
+        Parameters
+        ----------
+        season : str
+            One of the seasons in ``constants.monthDictionary``
+
+        startYear, endYear : int
+            The first and last years of the window (one of ``windows``)
+
+        Returns
+        -------
+        fileName : str
+            The path to the climatology file for the specified season and
+            years.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        fileName, directory = self._get_file_name_for_years(
+            season, startYear, endYear)
+        return fileName  # }}}
+
+    def _get_seasons_to_check(self):  # {{{
+        '''
+        Get the keys of the climatology files this task produces
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        if self.seasons[0] is 'none':
+            return ['{:02d}'.format(month) for month in range(1, 13)]
+        else:
+            return self.seasons  # }}}
+
+    def _find_missing_variables(self):  # {{{
+        '''
+        Find the variables missing from any of the climatology files, using
+        the manifest of each file.  Files without a valid manifest (e.g.
+        because they were only partly written) or computed from different
+        input files are computed again from scratch.
+
+        Returns
+        -------
+        variableList : list of str
+            The variables to compute, in the order they were added
+
+        staleSeasons : list of str
+            The seasons whose files must be replaced, rather than having
+            variables added to them
+
+        sourceFingerprint : str
+            The fingerprint of the input files
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        sourceFingerprint = self._get_source_fingerprint()
+        outputVariables = self._get_output_variables(self.variableList)
+        missingVariables = set()
+        staleSeasons = []
+        for season in self._get_seasons_to_check():
+
+            climatologyFileName = self.get_file_name(season)
+
+            seasonMissing = get_missing_variables(
+                climatologyFileName, outputVariables, sourceFingerprint)
+            if len(seasonMissing) == len(outputVariables):
+                staleSeasons.append(season)
+            # a variable is missing if its mean or variability is missing
+            missingVariables.update(
+                [variableName for variableName in self.variableList
+                 if any([outputName in seasonMissing for outputName in
+                         self._get_output_variables([variableName])])])
+
+        if len(missingVariables) > 0 and len(staleSeasons) > 0:
+            # any variables in the other files are also needed for these
+            missingVariables.update(self.variableList)
+
+        # compute only the missing variables, keeping their order
+        variableList = [variableName for variableName in self.variableList
+                        if variableName in missingVariables]
+
+        return variableList, staleSeasons, sourceFingerprint  # }}}
+
+    def _get_variables_to_sum(self):  # {{{
+        '''
+        Get the variables whose monthly sums are needed, either because they
+        are missing from the climatology files or because sliding-window
+        climatologies are computed
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        if len(self.variableList) == 0:
+            return []
+        if len(self.windows) > 0:
+            return list(self.variableList)
+        variableList, staleSeasons, sourceFingerprint = \
+            self._find_missing_variables()
+        return variableList  # }}}
+
+    def _add_shard_subtasks(self):  # {{{
+        '''
+        Divide the groups of years with cached sums as evenly as possible
+        between ``shardCount`` subtasks
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        yearGroups = self._get_year_groups()
+        shardCount = min(self.shardCount, len(yearGroups))
+        firstIndex = 0
+        for shardIndex in range(shardCount):
+            lastIndex = firstIndex + (len(yearGroups) - firstIndex) // \
+                (shardCount - shardIndex)
+            MpasClimatologyShardSubtask(self, shardIndex,
+                                        yearGroups[firstIndex:lastIndex])
+            firstIndex = lastIndex  # }}}
+
+    def _get_year_groups(self):  # {{{
+        '''
+        Get the groups of years whose monthly sums are cached together.
+        Groups start at multiples of ``yearsPerCacheFile`` (plus one), so
+        they don't change when the start year does.
+
+        Returns
+        -------
+        yearGroups : list of list of int
+            The years in each group
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        yearsPerCacheFile = self._get_years_per_cache_file()
+        yearGroups = []
+        firstYear = self.startYear
+        while firstYear <= self.endYear:
+            lastYear = min(firstYear - (firstYear-1) % yearsPerCacheFile +
+                           yearsPerCacheFile - 1, self.endYear)
+            yearGroups.append(range(firstYear, lastYear+1))
+            firstYear = lastYear + 1
+        return yearGroups  # }}}
+
+    def _get_partial_sums_file_name(self, years):  # {{{
+        '''
+        Get the name of the cache file with the monthly sums over the given
+        years
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        climatologyBaseDirectory = build_config_full_path(
+            self.config, 'output', 'mpasClimatologySubdirectory')
+        mpasMeshName = self.config.get('input', 'mpasMeshName')
+        directory = '{}/partial_{}'.format(climatologyBaseDirectory,
+                                           mpasMeshName)
+        _, fileSuffix = _get_year_string(years[0], years[-1])
+        return '{}/{}_{}.nc'.format(directory, self.ncclimoModel,
+                                    fileSuffix)  # }}}
+
+    def _get_output_variables(self, variableList):  # {{{
+        """
+        Get the names of the variables written to the climatology files for
+        the given variables, including their variability if it is computed
+
+        Parameters
+        ----------
+        variableList : list of str
+            Variable names in ``timeSeriesStatsMonthly``
+
+        Returns
+        -------
+        outputVariables : list of str
+            The variable names in the climatology files
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        outputVariables = []
+        for variableName in variableList:
+            outputVariables.append(variableName)
+            if self.computeVariability:
+                outputVariables.extend(['{}_std'.format(variableName),
+                                        '{}_count'.format(variableName)])
+        return outputVariables  # }}}
+
     def _update_climatology_bounds_from_file_names(self):  # {{{
         """
         Update the start and end years and dates for climatologies based on the
@@ -320,40 +636,440 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
         Xylar Asay-Davis
         """
 
+        self._outputDirs = {}
+        self._outputFiles = {}
+
+        for season in self.seasons:
+            fileName, directory = self._get_file_name_for_years(
+                season, self.startYear, self.endYear)
+            make_directories(directory)
+
+            if season in constants.abrevMonthNames:
+                monthValues = constants.monthDictionary[season]
+                season = '{:02d}'.format(monthValues[0])
+
+            self._outputDirs[season] = directory
+            self._outputFiles[season] = fileName
+
+        # }}}
+
+    def _get_file_name_for_years(self, season, startYear, endYear):  # {{{
+        """
+        Get the name and directory of the climatology file for a season and
+        range of years
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+
         config = self.config
         climatologyBaseDirectory = build_config_full_path(
             config, 'output', 'mpasClimatologySubdirectory')
 
         mpasMeshName = config.get('input', 'mpasMeshName')
 
-        self._outputDirs = {}
-        self._outputFiles = {}
-
         directory = '{}/unmasked_{}'.format(climatologyBaseDirectory,
                                             mpasMeshName)
 
-        make_directories(directory)
+        monthValues = sorted(constants.monthDictionary[season])
+        startMonth = monthValues[0]
+        endMonth = monthValues[-1]
+
+        suffix = '{:04d}{:02d}_{:04d}{:02d}_climo'.format(
+                startYear, startMonth, endYear, endMonth)
+
+        if season in constants.abrevMonthNames:
+            season = '{:02d}'.format(monthValues[0])
+        fileName = '{}/{}_{}_{}.nc'.format(directory, self.ncclimoModel,
+                                           season, suffix)
+
+        return fileName, directory  # }}}
+
+    def _merge_climatology(self, newFileName, climatologyFileName,
+                           variableList, sourceFingerprint, season,
+                           replace):  # {{{
+        '''
+        Add the variables in a newly computed climatology file to an existing
+        climatology file (or move the new file into place if there is no
+        existing file) and update the manifest of the climatology file.  The
+        existing file is replaced in a single step, so it is never seen half
+        written.
+
+        Parameters
+        ----------
+        newFileName : str
+            The newly computed climatology file
+
+        climatologyFileName : str
+            The climatology file to merge into
+
+        variableList : list of str
+            The variables in the new file
+
+        sourceFingerprint : str
+            The fingerprint of the input files
+
+        season : str
+            The season of the climatology
+
+        replace : bool
+            Whether to replace the existing file rather than merging into it
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        if replace or not os.path.exists(climatologyFileName):
+            os.rename(newFileName, climatologyFileName)
+            variables = list(variableList)
+        else:
+            variables = read_manifest(climatologyFileName)['variables']
+            with xarray.open_dataset(climatologyFileName) as ds:
+                ds = ds.load()
+            with xarray.open_dataset(newFileName) as dsNew:
+                for variableName in dsNew.data_vars:
+                    ds[variableName] = dsNew[variableName].load()
+
+            write_atomically(ds, climatologyFileName)
+            variables.extend([variableName for variableName in variableList
+                              if variableName not in variables])
+
+        write_manifest(climatologyFileName, variables, sourceFingerprint,
+                       season=season, startYear=self.startYear,
+                       endYear=self.endYear)  # }}}
+
+    def _get_files_by_year(self):  # {{{
+        '''
+        Get the input files in the years of the climatology
+
+        Returns
+        -------
+        filesByYear : ``OrderedDict`` of list
+            The input files (and their months) for each year
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        filesByYear = OrderedDict()
+        for fileName in self.inputFiles:
+            # the date is at the end of the file name: YYYY-MM-DD.nc
+            date = fileName[-13:-6]
+            year = int(date[0:4])
+            month = int(date[5:7])
+            if year < self.startYear or year > self.endYear:
+                continue
+            filesByYear.setdefault(year, []).append((fileName, month))
+        return filesByYear  # }}}
+
+    def _get_source_fingerprint(self):  # {{{
+        '''
+        Get a fingerprint of the input files the climatologies are computed
+        from, used to tell if existing climatologies are up to date
+
+        Returns
+        -------
+        fingerprint : str
+            A hash of the input files and the years of the climatology
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        fileNames = []
+        for files in self._get_files_by_year().values():
+            fileNames.extend([fileName for fileName, month in files])
+        return get_fingerprint(fileNames, startYear=self.startYear,
+                               endYear=self.endYear)  # }}}
+
+    @traced('compute')
+    def _compute_climatologies_with_python(self, outDirectory,
+                                           variableList):  # {{{
+        '''
+        Computes monthly, seasonal and/or annual climatologies in a single
+        pass through the input files: day-weighted sums for each month of
+        the year are accumulated as each file is read and all seasons are
+        computed from these sums.
+
+        The sums for every ``yearsPerCacheFile`` years are cached, so when
+        the climatology is extended to later years, only the files from the
+        new years are read.
+
+        If ``computeVariability`` is ``True``, the interannual variability
+        of each season is accumulated in the same pass.
+
+        Parameters
+        ----------
+        outDirectory : str
+            The output directory where climatologies will be written
+
+        variableList : list of str
+            The variables to compute climatologies of
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        filesByYear = self._get_files_by_year()
+
+        seasons = self._get_variability_seasons()
+        accumulator = MonthlyAccumulator(variableList, seasons)
+        cachedYears = []
+        for years in self._get_year_groups():
+            partial, cached = self._get_partial_sums(years, filesByYear,
+                                                     variableList, seasons)
+            if partial is None:
+                continue
+            if cached:
+                cachedYears.extend(years)
+            accumulator.merge(partial)
+
+        self.logger.info('  Used cached sums for {} of {} years'.format(
+            len(cachedYears), self.endYear - self.startYear + 1))
+
         for season in self.seasons:
             monthValues = sorted(constants.monthDictionary[season])
-            startMonth = monthValues[0]
-            endMonth = monthValues[-1]
+            climatology = accumulator.get_climatology(monthValues)
+            if self.computeVariability:
+                variability = accumulator.get_variability(season)
+                for variableName in variability.data_vars:
+                    climatology[variableName] = variability[variableName]
+            fileName = '{}/{}'.format(
+                outDirectory, os.path.basename(self.get_file_name(season)))
+            write_netcdf(climatology, fileName)
 
-            suffix = '{:04d}{:02d}_{:04d}{:02d}_climo'.format(
-                    self.startYear, startMonth, self.endYear, endMonth)
+        # }}}
 
-            if season in constants.abrevMonthNames:
-                season = '{:02d}'.format(monthValues[0])
-            fileName = '{}/{}_{}_{}.nc'.format(directory, self.ncclimoModel,
-                                               season, suffix)
+    @traced('compute')
+    def _compute_window_climatologies(self):  # {{{
+        '''
+        Computes the sliding-window climatologies that are missing or out of
+        date.  The sums over each window are found from the sums over the
+        previous window by adding the sums for the years that enter the
+        window and subtracting those for the years that leave it, using the
+        cached sums for each year.  Each year's sums are therefore read at
+        most twice, however many windows there are.
 
-            self._outputDirs[season] = directory
-            self._outputFiles[season] = fileName
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        variableList = self.variableList
+        outputVariables = self._get_output_variables(variableList)
+        filesByYear = self._get_files_by_year()
+
+        windows = []
+        fingerprints = {}
+        for startYear, endYear in self.windows:
+            fileNames = []
+            for year in range(startYear, endYear+1):
+                fileNames.extend([fileName for fileName, month in
+                                  filesByYear.get(year, [])])
+            fingerprint = get_fingerprint(fileNames, startYear=startYear,
+                                          endYear=endYear)
+            fingerprints[(startYear, endYear)] = fingerprint
+            for season in self.seasons:
+                fileName = self.get_window_file_name(season, startYear,
+                                                     endYear)
+                if len(get_missing_variables(fileName, outputVariables,
+                                             fingerprint)) > 0:
+                    windows.append((startYear, endYear))
+                    break
+
+        if len(windows) == 0:
+            return
+
+        self.logger.info('  Computing {} sliding-window climatologies'.format(
+            len(windows)))
+
+        seasons = self._get_variability_seasons()
+
+        def get_year_sums(year):
+            partial, cached = self._get_partial_sums(
+                [year], filesByYear, variableList, seasons)
+            return partial
+
+        accumulator = None
+        for startYear, endYear in windows:
+            if accumulator is None or startYear > lastYear:
+                # this window doesn't overlap the previous one, so start over
+                accumulator = MonthlyAccumulator(variableList, seasons)
+                firstYear = startYear
+                lastYear = startYear - 1
+            for year in range(firstYear, startYear):
+                yearSums = get_year_sums(year)
+                if yearSums is not None:
+                    accumulator.subtract(yearSums)
+            for year in range(lastYear+1, endYear+1):
+                yearSums = get_year_sums(year)
+                if yearSums is not None:
+                    accumulator.merge(yearSums)
+            firstYear = startYear
+            lastYear = endYear
+
+            for season in self.seasons:
+                monthValues = sorted(constants.monthDictionary[season])
+                climatology = accumulator.get_climatology(monthValues)
+                if self.computeVariability:
+                    variability = accumulator.get_variability(season)
+                    for variableName in variability.data_vars:
+                        climatology[variableName] = variability[variableName]
+                fileName = self.get_window_file_name(season, startYear,
+                                                     endYear)
+                write_atomically(climatology, fileName)
+                write_manifest(fileName, outputVariables,
+                               fingerprints[(startYear, endYear)],
+                               season=season, startYear=startYear,
+                               endYear=endYear)
 
         # }}}
 
+    def _get_years_per_cache_file(self):  # {{{
+        '''
+        Get the number of years in each file of cached monthly sums, which
+        is always 1 if sliding-window climatologies are computed
+
+        Returns
+        -------
+        yearsPerCacheFile : int
+            The number of years per cache file
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        if len(self.windows) > 0:
+            return 1
+        return self.config.getWithDefault('climatology', 'yearsPerCacheFile',
+                                          default=1)  # }}}
+
+    def _get_variability_seasons(self):  # {{{
+        '''
+        Get the seasons for which interannual variability is computed, in an
+        order that doesn't depend on the order tasks added them
+
+        Returns
+        -------
+        seasons : list of str
+            The seasons or an empty list if ``computeVariability`` is
+            ``False``
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        if self.computeVariability:
+            return sorted(self.seasons)
+        else:
+            return []  # }}}
+
+    def _get_partial_sums(self, years, filesByYear, variableList,
+                          seasons):  # {{{
+        '''
+        Get the monthly sums over the given years, either from the cache
+        file for these years if it has all the variables and months, or by
+        reading the input files (and then caching the result).  The cache
+        file is only used if it was computed from the same input files (with
+        the same sizes and modification times).  If the cache file has all
+        the months but not all the variables, only the missing variables are
+        read and added to the cache file.
+
+        Parameters
+        ----------
+        years : list of int
+            The years to sum over
+
+        filesByYear : dict of list
+            The input files (and their months) for each year
+
+        variableList : list of str
+            The variables to sum
+
+        seasons : list of str
+            The seasons for which to accumulate interannual variability, if
+            any.  A cache file with variability for other seasons is
+            recomputed.
+
+        Returns
+        -------
+        partial : ``MonthlyAccumulator``
+            The sums over the years, or ``None`` if there are no input files
+            in these years
+
+        cached : bool
+            Whether the sums came from the cache
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+        files = []
+        for year in years:
+            files.extend(filesByYear.get(year, []))
+        if len(files) == 0:
+            return None, False
+
+        fileName = self._get_partial_sums_file_name(years)
+        make_directories(os.path.dirname(fileName))
+        fingerprint = get_fingerprint(
+            [inFileName for inFileName, month in files], years=list(years))
+
+        dsCached = None
+        missingVariables = variableList
+        if os.path.exists(fileName):
+            with xarray.open_dataset(fileName) as ds:
+                cachedSeasons = []
+                if 'season' in ds.coords:
+                    cachedSeasons = [str(season) for season in
+                                     ds.season.values]
+                if ds.attrs.get('sourceFingerprint') == fingerprint and \
+                        ds.attrs['totalMonths'] == len(files) and \
+                        (len(seasons) == 0 or cachedSeasons == seasons):
+                    dsCached = ds.load()
+                    cachedVariables = [variableName for variableName in
+                                       variableList
+                                       if variableName in dsCached]
+                    cached = MonthlyAccumulator.from_dataset(
+                        dsCached, cachedVariables)
+                    missingVariables = [
+                        variableName for variableName in variableList
+                        if variableName not in cachedVariables or
+                        (len(seasons) > 0 and
+                         variableName not in cached.moments)]
+
+        if len(missingVariables) == 0:
+            return MonthlyAccumulator.from_dataset(dsCached,
+                                                   variableList), True
+
+        # the sums for each year are added separately, so the variability of
+        # the seasonal means from year to year can be accumulated
+        partial = MonthlyAccumulator(missingVariables, seasons)
+        for year in years:
+            yearly = MonthlyAccumulator(missingVariables)
+            for inFileName, month in filesByYear.get(year, []):
+                yearly.add_file(inFileName, month)
+            if yearly.monthCount > 0:
+                partial.add_year(yearly)
+        dsPartial = partial.to_dataset()
+
+        if dsCached is not None:
+            # keep the variables that were already cached
+            for variableName in dsCached.data_vars:
+                if variableName not in dsPartial:
+                    dsPartial[variableName] = dsCached[variableName]
+
+        dsPartial.attrs['sourceFingerprint'] = fingerprint
+        write_atomically(dsPartial, fileName)
+        return MonthlyAccumulator.from_dataset(dsPartial,
+                                               variableList), False  # }}}
+
+    @traced('compute')
     def _compute_climatologies_with_ncclimo(self, inDirectory, outDirectory,
                                             remapper=None,
-                                            remappedDirectory=None):  # {{{
+                                            remappedDirectory=None,
+                                            variableList=None):  # {{{
         '''
         Uses ncclimo to compute monthly, seasonal and/or annual climatologies.
 
@@ -375,6 +1091,10 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
             directory as the climatologies on the source grid.  Has no effect
             if ``remapper`` is ``None``.
 
+        variableList : list of str, optional
+            The variables to compute climatologies of, by default all those
+            in ``self.variableList``
+
         Raises
         ------
         OSError
@@ -392,6 +1112,9 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
                           'Note: this presumes use of the conda-forge '
                           'channel.')
 
+        if variableList is None:
+            variableList = self.variableList
+
         parallelMode = self.config.get('execute', 'ncclimoParallelMode')
 
         args = ['ncclimo',
@@ -399,7 +1122,7 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
                 '-a', 'sdd',
                 '-m', self.ncclimoModel,
                 '-p', parallelMode,
-                '-v', ','.join(self.variableList),
+                '-v', ','.join(variableList),
                 '--seasons={}'.format(','.join(self.seasons)),
                 '-s', '{:04d}'.format(self.startYear),
                 '-e', '{:04d}'.format(self.endYear),
@@ -411,28 +1134,12 @@ class MpasClimatologyTask(AnalysisTask):  # {{{
             if remappedDirectory is not None:
                 args.extend(['-O', remappedDirectory])
 
-        self.logger.info('running: {}'.format(' '.join(args)))
-        for handler in self.logger.handlers:
-            handler.flush()
-
         # set an environment variable to make sure we're not using czender's
         # local version of NCO instead of one we have intentionally loaded
         env = os.environ.copy()
         env['NCO_PATH_OVERRIDE'] = 'No'
 
-        process = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, env=env)
-        stdout, stderr = process.communicate()
-
-        if stdout:
-            self.logger.info(stdout)
-        if stderr:
-            for line in stderr.split('\n'):
-                self.logger.error(line)
-
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode,
-                                                ' '.join(args))
+        run_command(args, logger=self.logger, env=env)
 
         # }}}
     # }}}
@@ -5,8 +5,11 @@ from ..analysis_task import AnalysisTask
 
 from ..constants import constants
 
-from ..io.utility import build_config_full_path, make_directories
+from ..io.utility import build_config_full_path, make_directories, \
+    write_atomically
 from ..io import write_netcdf
+from ..io.manifest import write_manifest, read_manifest, \
+    get_missing_variables, get_fingerprint
 
 from .climatology import get_remapper
 from .comparison_descriptors import get_comparison_descriptor
@@ -205,13 +208,50 @@ class RemapMpasClimatologySubtask(AnalysisTask):  # {{{
                 remappedFileName = self.get_file_name(
                         season, 'remapped', comparisonGridName)
 
-                if not os.path.exists(remappedFileName):
+                remapper = self.remappers[comparisonGridName]
+                if remapper.mappingFileName is None:
+                    # no remapping is needed
+                    continue
+
+                # the remapped file is up to date if it was remapped with
+                # the same mapping file from the current masked file
+                maskedManifest = read_manifest(maskedClimatologyFileName)
+                sourceFingerprint = get_fingerprint(
+                    [remapper.mappingFileName],
+                    maskedFingerprint=maskedManifest['sourceFingerprint'],
+                    renormalizationThreshold=self.config.getfloat(
+                        'climatology', 'renormalizationThreshold'))
+
+                if len(get_missing_variables(remappedFileName,
+                                             self.variableList,
+                                             sourceFingerprint)) > 0:
+                    # remap to a temporary file so the remapped file is never
+                    # seen half written
+                    tempFileName = '{}.tmp'.format(remappedFileName)
                     self._remap(inFileName=maskedClimatologyFileName,
-                                outFileName=remappedFileName,
-                                remapper=self.remappers[comparisonGridName],
+                                outFileName=tempFileName,
+                                remapper=remapper,
                                 comparisonGridName=comparisonGridName)
+                    os.rename(tempFileName, remappedFileName)
+                    write_manifest(remappedFileName, self.variableList,
+                                   sourceFingerprint, season=season)
         # }}}
 
+    def get_output_files(self):  # {{{
+        '''
+        Get the masked and remapped climatology files this task produces
+
+        Returns
+        -------
+        outputFiles : list of str
+            The paths of the masked and remapped climatology files
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return sorted(self._outputFiles.values())  # }}}
+
     def get_file_name(self, season, stage, comparisonGridName=None):  # {{{
         """
         Given config options, the name of a field and a string identifying the
@@ -374,7 +414,24 @@ class RemapMpasClimatologySubtask(AnalysisTask):  # {{{
 
         maskedClimatologyFileName = self.get_file_name(season, 'masked')
 
-        if not os.path.exists(maskedClimatologyFileName):
+        # the masked file is up to date if it was made from a climatology
+        # computed from the same input files
+        climatologyManifest = read_manifest(climatologyFileName)
+        if climatologyManifest is None:
+            climatologyFingerprint = None
+        else:
+            climatologyFingerprint = climatologyManifest['sourceFingerprint']
+        if self.iselValues is None:
+            iselValues = None
+        else:
+            iselValues = repr(sorted(self.iselValues.items()))
+        sourceFingerprint = get_fingerprint(
+            climatologyFingerprint=climatologyFingerprint,
+            iselValues=iselValues)
+
+        if len(get_missing_variables(maskedClimatologyFileName,
+                                     self.variableList,
+                                     sourceFingerprint)) > 0:
             # slice and mask the data set
             climatology = xr.open_dataset(climatologyFileName)
             climatology = mpas_xarray.subset_variables(climatology,
@@ -392,7 +449,9 @@ class RemapMpasClimatologySubtask(AnalysisTask):  # {{{
                     climatology[variableName].where(
                         dsMask[variableName] != self._fillValue)
 
-            write_netcdf(climatology, maskedClimatologyFileName)
+            write_atomically(climatology, maskedClimatologyFileName)
+            write_manifest(maskedClimatologyFileName, self.variableList,
+                           sourceFingerprint, season=season)
         # }}}
 
     def _remap(self, inFileName, outFileName, remapper, comparisonGridName):
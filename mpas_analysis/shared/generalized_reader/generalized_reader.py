@@ -19,8 +19,10 @@ import resource
 
 from ..mpas_xarray import mpas_xarray
 from ..timekeeping.utility import string_to_days_since_date, days_to_datetime
+from ..trace import traced
 
 
+@traced('load')
 def open_multifile_dataset(fileNames, calendar, config,
                            simulationStartTime=None,
                            timeVariableName='Time',
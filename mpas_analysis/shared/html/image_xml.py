@@ -8,8 +8,10 @@ from lxml import etree
 from PIL import Image
 
 from ..io.utility import build_config_full_path
+from ..trace import traced
 
 
+@traced('write XML')
 def write_image_xml(config, filePrefix, componentName, componentSubdirectory,
                     galleryGroup, groupLink, groupSubtitle=None, gallery=None,
                     thumbnailDescription='', imageDescription='',
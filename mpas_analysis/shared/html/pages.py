@@ -5,6 +5,8 @@ from lxml import etree
 from collections import OrderedDict
 
 from ..io.utility import build_config_full_path
+from ..scheduler.performance_report import read_performance_report
+from ..resource_usage import toolTimeNames
 
 
 def generate_html(config, analyses):  # {{{
@@ -70,7 +72,7 @@ class MainPage(object):
     config : ``MpasAnalysisConfigParser`` object
         contains config options
 
-    pageTemplate, componentTemplate : str
+    pageTemplate, componentTemplate, performanceTemplate : str
         The contents of templates used to construct the page
 
     components : OrederdDict of dict
@@ -111,6 +113,12 @@ class MainPage(object):
         with open(fileName, 'r') as templateFile:
             self.componentTemplate = templateFile.read()
 
+        fileName = \
+            pkg_resources.resource_filename(__name__,
+                                            "templates/main_performance.html")
+        with open(fileName, 'r') as templateFile:
+            self.performanceTemplate = templateFile.read()
+
         # start with no components
         self.components = OrderedDict()
 
@@ -166,7 +174,8 @@ class MainPage(object):
                 _replace_tempate_text(self.componentTemplate, replacements)
 
         replacements = {'@runName': runName,
-                        '@components': componentsText}
+                        '@components': componentsText,
+                        '@performanceTable': self._get_performance_text()}
 
         pageText = _replace_tempate_text(self.pageTemplate, replacements)
 
@@ -200,6 +209,69 @@ class MainPage(object):
                                             "templates/mpas_logo.png")
         copyfile(fileName, '{}/mpas_logo.png'.format(htmlBaseDirectory))
 
+    def _get_performance_text(self):
+        """
+        Make a table of the resources used by each task in the most recent
+        run, or an empty string if there is no performance report
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        records = read_performance_report(self.config)
+        if records is None or len(records) == 0:
+            return ''
+
+        def format_time(value):
+            if value is None:
+                return '-'
+            m, s = divmod(value, 60)
+            h, m = divmod(int(m), 60)
+            return '{}:{:02d}:{:04.1f}'.format(h, m, s)
+
+        def format_memory(value):
+            if value is None:
+                return '-'
+            return '{:.2f} GB'.format(value)
+
+        def format_bytes(value):
+            if value is None:
+                return '-'
+            return '{:.1f} MB'.format(value/1024.**2)
+
+        # the time of each external tool is the sum of the wall-clock times
+        # of its invocations
+        formats = [('wallTime', format_time), ('cpuTime', format_time),
+                   ('peakMemory', format_memory),
+                   ('bytesRead', format_bytes),
+                   ('bytesWritten', format_bytes)] + \
+            [(name, format_time) for name in toolTimeNames.values()] + \
+            [('otherToolTime', format_time)]
+
+        # the total of each resource over all tasks (the maximum for peak
+        # memory), skipping unmeasured values and those missing from reports
+        # written by older versions
+        total = {'taskName': 'Total', 'status': ''}
+        for name, _ in formats:
+            values = [record.get(name) for record in records
+                      if record.get(name) is not None]
+            if len(values) == 0:
+                total[name] = None
+            elif name == 'peakMemory':
+                total[name] = max(values)
+            else:
+                total[name] = sum(values)
+
+        rowsText = ''
+        for record in records + [total]:
+            cells = [record['taskName'], record['status']] + \
+                [formatter(record.get(name)) for name, formatter in formats]
+            rowsText = rowsText + '      <tr>{}</tr>\n'.format(
+                ''.join(['<td>{}</td>'.format(cell) for cell in cells]))
+
+        return _replace_tempate_text(self.performanceTemplate,
+                                     {'@rows': rowsText})
+
 
 class ComponentPage(object):
     """
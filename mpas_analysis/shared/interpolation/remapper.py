@@ -13,9 +13,10 @@ Authors
 Xylar Asay-Davis
 '''
 
-import subprocess
 import tempfile
 import os
+import threading
+from collections import OrderedDict
 from distutils.spawn import find_executable
 import numpy
 from scipy.sparse import csr_matrix
@@ -24,6 +25,17 @@ import sys
 
 from ..grid import MpasMeshDescriptor, LatLonGridDescriptor, \
     ProjectionGridDescriptor
+from ..trace import traced
+from ..subprocess_runner import run_command
+
+# weights and indices from the most recently used mapping files (at most
+# Remapper.mappingCacheSize of them), with the mapping file name and its
+# modification time as keys, from least to most recently used
+_mappingCache = OrderedDict()
+
+# ESMF_RegridWeightGen has trouble running several times at once, so mapping
+# files are built one at a time even if tasks are set up in several threads
+_esmfLock = threading.Lock()
 
 
 class Remapper(object):
@@ -32,11 +44,22 @@ class Remapper(object):
     indices from the mapping file can be loaded once and reused multiple times
     to map several fields between the same source and destination grids.
 
+    If the class attribute ``mappingCacheSize`` is more than 0, the weights
+    and indices loaded from up to that many of the most recently used mapping
+    files are also kept for the rest of the process, so other remappers using
+    the same mapping file (e.g. in later tasks run by the same worker
+    process) don't need to read it again.  The cache is bounded because the
+    mapping files of high-resolution meshes can take hundreds of MB each.
+
     Authors
     -------
     Xylar Asay-Davis
     '''
 
+    # the number of mapping files whose weights and indices are kept in
+    # memory across remappers
+    mappingCacheSize = 0
+
     def __init__(self, sourceDescriptor, destinationDescriptor,
                  mappingFileName=None):  # {{{
         '''
@@ -123,6 +146,23 @@ class Remapper(object):
             # a valid weight file already exists, so nothing to do
             return
 
+        with _esmfLock:
+            # another thread may have built the same mapping file while we
+            # waited for the lock
+            if not os.path.exists(self.mappingFileName):
+                self._build_mapping_file(method, additionalArgs, logger)
+        # }}}
+
+    def _build_mapping_file(self, method, additionalArgs, logger):  # {{{
+        '''
+        Build the mapping file with ``ESMF_RegridWeightGen``.  See
+        ``build_mapping_file`` for details.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
         if find_executable('ESMF_RegridWeightGen') is None:
             raise OSError('ESMF_RegridWeightGen not found. Make sure esmf '
                           'package is installed via\n'
@@ -156,36 +196,9 @@ class Remapper(object):
         if additionalArgs is not None:
             args.extend(additionalArgs)
 
-        if logger is None:
-            print 'running: {}'.format(' '.join(args))
-            # make sure any output is flushed before we add output from the
-            # subprocess
-            sys.stdout.flush()
-            sys.stderr.flush()
-
-            # throw out the standard output from ESMF_RegridWeightGen, as it's
-            # rather verbose but keep stderr
-            DEVNULL = open(os.devnull, 'wb')
-            subprocess.check_call(args, stdout=DEVNULL)
-
-        else:
-            logger.info('running: {}'.format(' '.join(args)))
-            for handler in logger.handlers:
-                handler.flush()
-
-            process = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-
-            # throw out the standard output from ESMF_RegridWeightGen, as it's
-            # rather verbose but keep stderr
-            if stderr:
-                for line in stderr.split('\n'):
-                    logger.error(line)
-
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode,
-                                                    ' '.join(args))
+        # throw out the standard output from ESMF_RegridWeightGen, as it's
+        # rather verbose but keep stderr
+        run_command(args, logger=logger, logStdout=False)
 
         # remove the temporary SCRIP files
         os.remove(self.sourceDescriptor.scripFileName)
@@ -193,6 +206,7 @@ class Remapper(object):
 
         # }}}
 
+    @traced('remap')
     def remap_file(self, inFileName, outFileName, variableList=None,
                    overwrite=False, renormalize=None, logger=None):  # {{{
         '''
@@ -298,34 +312,10 @@ class Remapper(object):
         env = os.environ.copy()
         env['NCO_PATH_OVERRIDE'] = 'No'
 
-        if logger is None:
-            print 'running: {}'.format(' '.join(args))
-            # make sure any output is flushed before we add output from the
-            # subprocess
-            sys.stdout.flush()
-            sys.stderr.flush()
-
-            subprocess.check_call(args, env=env)
-        else:
-            logger.info('running: {}'.format(' '.join(args)))
-            for handler in logger.handlers:
-                handler.flush()
-
-            process = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE, env=env)
-            stdout, stderr = process.communicate()
-
-            if stdout:
-                logger.info(stdout)
-            if stderr:
-                for line in stderr.split('\n'):
-                    logger.error(line)
-
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode,
-                                                    ' '.join(args))
+        run_command(args, logger=logger, env=env)
         # }}}
 
+    @traced('remap')
     def remap(self, ds, renormalizationThreshold=None):  # {{{
         '''
         Given a source data set, returns a remapped version of the data set,
@@ -416,14 +406,51 @@ class Remapper(object):
         if self.mappingLoaded:
             return
 
-        dsMapping = xr.open_dataset(self.mappingFileName)
-        n_a = dsMapping.dims['n_a']
-        n_b = dsMapping.dims['n_b']
+        # a mapping file that has been rebuilt since it was cached won't be
+        # found in the cache
+        cacheKey = (self.mappingFileName,
+                    os.path.getmtime(self.mappingFileName))
+        if cacheKey in _mappingCache:
+            # this is now the most recently used mapping
+            (self.src_grid_dims, self.dst_grid_dims, self.frac_b,
+             self.matrix) = _mappingCache.pop(cacheKey)
+            _mappingCache[cacheKey] = (self.src_grid_dims,
+                                       self.dst_grid_dims, self.frac_b,
+                                       self.matrix)
+        else:
+            dsMapping = xr.open_dataset(self.mappingFileName)
+            n_a = dsMapping.dims['n_a']
+            n_b = dsMapping.dims['n_b']
+
+            # grid dimensions need to be reversed because they are in Fortran
+            # order
+            self.src_grid_dims = dsMapping['src_grid_dims'].values[::-1]
+            self.dst_grid_dims = dsMapping['dst_grid_dims'].values[::-1]
+
+            self.frac_b = dsMapping['frac_b'].values
+
+            col = dsMapping['col'].values-1
+            row = dsMapping['row'].values-1
+            S = dsMapping['S'].values
+            self.matrix = csr_matrix((S, (row, col)), shape=(n_b, n_a))
+            dsMapping.close()
+
+            if Remapper.mappingCacheSize > 0:
+                # drop the least recently used mappings (and any from an
+                # older version of this mapping file) to make room
+                for key in _mappingCache.keys():
+                    if key[0] == self.mappingFileName:
+                        del _mappingCache[key]
+                while len(_mappingCache) >= Remapper.mappingCacheSize:
+                    _mappingCache.popitem(last=False)
+                _mappingCache[cacheKey] = (self.src_grid_dims,
+                                           self.dst_grid_dims, self.frac_b,
+                                           self.matrix)
 
         nSourceDims = len(self.sourceDescriptor.dims)
-        src_grid_rank = dsMapping.dims['src_grid_rank']
+        src_grid_rank = len(self.src_grid_dims)
         nDestinationDims = len(self.destinationDescriptor.dims)
-        dst_grid_rank = dsMapping.dims['dst_grid_rank']
+        dst_grid_rank = len(self.dst_grid_dims)
 
         # check that the mapping file has the right number of dimensions
         if nSourceDims != src_grid_rank or \
@@ -436,10 +463,6 @@ class Remapper(object):
                                  nSourceDims, src_grid_rank,
                                  nDestinationDims, dst_grid_rank))
 
-        # grid dimensions need to be reversed because they are in Fortran order
-        self.src_grid_dims = dsMapping['src_grid_dims'].values[::-1]
-        self.dst_grid_dims = dsMapping['dst_grid_dims'].values[::-1]
-
         # now, check that each source and destination dimension is right
         for index in range(len(self.sourceDescriptor.dims)):
             dim = self.sourceDescriptor.dims[index]
@@ -458,13 +481,6 @@ class Remapper(object):
                                  'dimension {} don\'t have the same size: \n'
                                  '{} != {}'.format(dim, dimSize, checkDimSize))
 
-        self.frac_b = dsMapping['frac_b'].values
-
-        col = dsMapping['col'].values-1
-        row = dsMapping['row'].values-1
-        S = dsMapping['S'].values
-        self.matrix = csr_matrix((S, (row, col)), shape=(n_b, n_a))
-
         self.mappingLoaded = True  # }}}
 
     def _check_drop(self, dataArray):  # {{{
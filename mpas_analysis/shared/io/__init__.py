@@ -1,4 +1,5 @@
-from .namelist_streams_interface import NameList, StreamsFile
+from .namelist_streams_interface import NameList, StreamsFile, \
+    get_namelist, get_streams_file
 from .utility import paths
 from .write_netcdf import write_netcdf
 from .mpas_reader import open_mpas_dataset
@@ -0,0 +1,146 @@
+'''
+Functions for writing and reading a small JSON "catalog" of the stores
+(NetCDF files) that together make up a data set such as a time series, with
+each store holding one variable or group of variables.  Readers use the
+catalog to open only the stores with the variables they need.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import json
+
+from .utility import write_json_atomically
+
+# the extension that identifies a catalog, rather than a NetCDF file
+catalogExtension = '.json'
+
+
+def write_catalog(catalogFileName, stores):  # {{{
+    '''
+    Write a catalog of stores
+
+    Parameters
+    ----------
+    catalogFileName : str
+        The catalog file, which must end in ``.json``
+
+    stores : dict
+        The variables in each store, with the paths of the stores as keys.
+        The stores should be in the same directory as the catalog (or a
+        subdirectory), as their paths are stored relative to the catalog.
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    catalogDirectory = os.path.dirname(os.path.abspath(catalogFileName))
+    catalog = {'stores': dict(
+        [(os.path.relpath(os.path.abspath(storeFileName), catalogDirectory),
+          list(variableList)) for storeFileName, variableList in
+         stores.items()])}
+
+    write_json_atomically(catalog, catalogFileName)  # }}}
+
+
+def read_catalog(catalogFileName):  # {{{
+    '''
+    Read a catalog of stores
+
+    Parameters
+    ----------
+    catalogFileName : str
+        The catalog file
+
+    Returns
+    -------
+    stores : dict
+        The variables in each store, with the absolute paths of the stores as
+        keys
+
+    Raises
+    ------
+    IOError
+        If the catalog doesn't exist
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    with open(catalogFileName) as catalogFile:
+        catalog = json.load(catalogFile)
+
+    catalogDirectory = os.path.dirname(os.path.abspath(catalogFileName))
+    return dict([(os.path.join(catalogDirectory, storeFileName),
+                  [str(variable) for variable in variableList]) for
+                 storeFileName, variableList in
+                 catalog['stores'].items()])  # }}}
+
+
+def get_store_files(catalogFileName, variableList=None):  # {{{
+    '''
+    Get the stores in a catalog that contain the given variables
+
+    Parameters
+    ----------
+    catalogFileName : str
+        The catalog file
+
+    variableList : list of str, optional
+        The variables to find.  By default, all stores are returned.
+
+    Returns
+    -------
+    storeFileNames : list of str
+        The absolute paths of the stores containing the variables, sorted
+        by name
+
+    Raises
+    ------
+    ValueError
+        If one of the variables isn't in any of the stores
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    stores = read_catalog(catalogFileName)
+    if variableList is None:
+        return sorted(stores.keys())
+
+    storeFileNames = set()
+    for variable in variableList:
+        found = [storeFileName for storeFileName in sorted(stores.keys())
+                 if variable in stores[storeFileName]]
+        if len(found) == 0:
+            raise ValueError('Variable {} is not in any of the stores in '
+                             'the catalog {}'.format(variable,
+                                                     catalogFileName))
+        storeFileNames.add(found[0])
+
+    return sorted(storeFileNames)  # }}}
+
+
+def is_catalog(fileName):  # {{{
+    '''
+    Whether a file name is that of a catalog, rather than a NetCDF file
+
+    Parameters
+    ----------
+    fileName : str
+        The file name
+
+    Returns
+    -------
+    isCatalog : bool
+        ``True`` if the file name ends in ``.json``
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    return fileName.endswith(catalogExtension)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
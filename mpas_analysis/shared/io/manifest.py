@@ -0,0 +1,192 @@
+'''
+Functions for writing and reading small JSON "manifest" files alongside
+NetCDF output files, recording which variables the output file contains,
+a fingerprint of the inputs it was computed from and the size, modification
+time and checksum of the file itself.  These make it possible to check if an
+output file is complete and up to date without opening it, and to detect
+files that were only partially written or were modified afterwards.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import json
+import hashlib
+
+from .utility import write_json_atomically
+
+
+def write_manifest(fileName, variableList, sourceFingerprint,
+                   **metadata):  # {{{
+    '''
+    Write the manifest for an output file that has just been written
+
+    Parameters
+    ----------
+    fileName : str
+        The output file
+
+    variableList : list of str
+        The variables in the output file
+
+    sourceFingerprint : str
+        A fingerprint of the inputs the file was computed from (see
+        ``get_fingerprint``)
+
+    **metadata
+        Other information to store in the manifest (e.g. ``startYear``,
+        ``endYear`` and ``season``), which must be JSON serializable
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    manifest = dict(metadata)
+    manifest['variables'] = list(variableList)
+    manifest['sourceFingerprint'] = sourceFingerprint
+    manifest['size'] = os.path.getsize(fileName)
+    manifest['modificationTime'] = os.path.getmtime(fileName)
+    manifest['checksum'] = _compute_checksum(fileName)
+
+    write_json_atomically(manifest, _get_manifest_file_name(fileName))
+    # }}}
+
+
+def read_manifest(fileName, verifyChecksum=False):  # {{{
+    '''
+    Read the manifest for an output file, if the file is unchanged since the
+    manifest was written
+
+    Parameters
+    ----------
+    fileName : str
+        The output file
+
+    verifyChecksum : bool, optional
+        Whether to compute the checksum of the file and compare it with the
+        one in the manifest, rather than just comparing the size and
+        modification time
+
+    Returns
+    -------
+    manifest : dict
+        The contents of the manifest, or ``None`` if the file or its manifest
+        doesn't exist or the file has changed
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    manifestFileName = _get_manifest_file_name(fileName)
+    if not os.path.exists(fileName) or not os.path.exists(manifestFileName):
+        return None
+
+    try:
+        with open(manifestFileName) as manifestFile:
+            manifest = json.load(manifestFile)
+    except ValueError:
+        # the manifest is corrupt
+        return None
+
+    if manifest['size'] != os.path.getsize(fileName) or \
+            manifest['modificationTime'] != os.path.getmtime(fileName):
+        return None
+
+    if verifyChecksum and manifest['checksum'] != _compute_checksum(fileName):
+        return None
+
+    return manifest  # }}}
+
+
+def get_missing_variables(fileName, variableList, sourceFingerprint):  # {{{
+    '''
+    Find the variables that need to be computed for an output file
+
+    Parameters
+    ----------
+    fileName : str
+        The output file
+
+    variableList : list of str
+        The variables the file should contain
+
+    sourceFingerprint : str
+        A fingerprint of the current inputs
+
+    Returns
+    -------
+    missingVariables : list of str
+        The variables missing from the file, or all of ``variableList`` if
+        the file has no valid manifest or was computed from different inputs
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    manifest = read_manifest(fileName)
+    if manifest is None or manifest['sourceFingerprint'] != sourceFingerprint:
+        return list(variableList)
+
+    return [variableName for variableName in variableList
+            if variableName not in manifest['variables']]  # }}}
+
+
+def get_fingerprint(fileNames=None, **metadata):  # {{{
+    '''
+    Compute a fingerprint of the inputs to an output file from the name,
+    size and modification time of input files (if they exist) and any other
+    information the output depends on
+
+    Parameters
+    ----------
+    fileNames : list of str, optional
+        Input files
+
+    **metadata
+        Other inputs (e.g. years or options), which must be JSON serializable
+
+    Returns
+    -------
+    fingerprint : str
+        A hash of the inputs
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    state = dict(metadata)
+    if fileNames is not None:
+        state['files'] = []
+        for fileName in fileNames:
+            if os.path.exists(fileName):
+                state['files'].append([fileName, os.path.getsize(fileName),
+                                       os.path.getmtime(fileName)])
+            else:
+                state['files'].append([fileName, None, None])
+    return hashlib.sha1(json.dumps(state, sort_keys=True)).hexdigest()
+    # }}}
+
+
+def _get_manifest_file_name(fileName):  # {{{
+    '''
+    Get the name of the manifest for an output file
+    '''
+    return '{}.json'.format(fileName)  # }}}
+
+
+def _compute_checksum(fileName):  # {{{
+    '''
+    Compute the SHA-1 checksum of the contents of a file
+    '''
+    checksum = hashlib.sha1()
+    with open(fileName, 'rb') as inFile:
+        while True:
+            chunk = inFile.read(1 << 20)
+            if not chunk:
+                break
+            checksum.update(chunk)
+    return checksum.hexdigest()  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -1,6 +1,7 @@
 """
-Utility functions for reading a single MPAS file into xarray and for removing
-all but a given list of variables from a data set.
+Utility functions for reading a single MPAS file (or the stores in a catalog)
+into xarray and for removing all but a given list of variables from a data
+set.
 
 Authors
 -------
@@ -10,8 +11,11 @@ Xylar Asay-Davis
 import xarray
 
 from ..timekeeping.utility import string_to_days_since_date, days_to_datetime
+from ..trace import traced
+from .catalog import is_catalog, get_store_files
 
 
+@traced('load')
 def open_mpas_dataset(fileName, calendar,
                       timeVariableNames=['xtime_startMonthly',
                                          'xtime_endMonthly'],
@@ -23,7 +27,11 @@ def open_mpas_dataset(fileName, calendar,
     Parameters
     ----------
     fileName : str
-        File path to read
+        File path to read.  If the file is a catalog (see
+        ``mpas_analysis.shared.io.catalog``), only the stores in the catalog
+        that contain the variables in ``variableList`` are read and merged.
+        Stores may cover different times, in which case only the times
+        found in all the stores that are read are included.
 
     calendar : {``'gregorian'``, ``'gregorian_noleap'``}, optional
         The name of one of the calendars supported by MPAS cores
@@ -56,10 +64,22 @@ def open_mpas_dataset(fileName, calendar,
     Xylar Asay-Davis
     """
 
-    ds = xarray.open_dataset(fileName, decode_cf=True, decode_times=False,
-                             lock=False)
-
-    ds = _parse_dataset_time(ds, timeVariableNames, calendar)
+    if is_catalog(fileName):
+        # the stores don't necessarily cover the same times (e.g. a store
+        # that was added after the start of the time series changed), so
+        # they are aligned on their time coordinates before merging
+        dsList = []
+        for storeFileName in get_store_files(fileName, variableList):
+            dsStore = xarray.open_dataset(storeFileName, decode_cf=True,
+                                          decode_times=False, lock=False)
+            dsList.append(_parse_dataset_time(dsStore, timeVariableNames,
+                                              calendar))
+        dsList = xarray.align(*dsList, join='inner')
+        ds = xarray.merge(dsList)
+    else:
+        ds = xarray.open_dataset(fileName, decode_cf=True,
+                                 decode_times=False, lock=False)
+        ds = _parse_dataset_time(ds, timeVariableNames, calendar)
 
     if startDate is not None and endDate is not None:
         if isinstance(startDate, str):
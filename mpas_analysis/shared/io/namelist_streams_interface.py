@@ -11,11 +11,20 @@ Phillip Wolfram, Xylar Asay-Davis
 from lxml import etree
 import re
 import os.path
+import threading
+import bisect
 
 from ..containers import ReadOnlyDict
 from .utility import paths
 from ..timekeeping.utility import string_to_datetime
 
+# parsed namelist and streams files shared by all tasks in this process, keyed
+# by file name and modification time (and streams directory)
+_nameListCache = {}
+_streamsFileCache = {}
+# tasks may be set up in several threads at once
+_cacheLock = threading.Lock()
+
 
 def convert_namelist_to_dict(fname, readonly=True):
     """
@@ -49,6 +58,85 @@ def convert_namelist_to_dict(fname, readonly=True):
     return nml
 
 
+def get_namelist(fname, path=None):  # {{{
+    """
+    Get a parsed namelist file, shared with all other callers in this process
+    that ask for the same file, so the file is only parsed again if it has
+    been modified.
+
+    Parameters
+    ----------
+    fname : str
+        The file name of the namelist file
+
+    path : str, optional
+        If ``fname`` contains a relative path, ``fname`` is
+        relative to ``path``, rather than the current working directory
+
+    Returns
+    -------
+    namelist : ``NameList``
+        The parsed namelist file
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    """
+    if not os.path.isabs(fname) and path is not None:
+        fname = '{}/{}'.format(path, fname)
+
+    if not os.path.exists(fname):
+        # let the constructor raise the usual error
+        return NameList(fname)
+
+    cacheKey = (os.path.abspath(fname), os.path.getmtime(fname))
+    with _cacheLock:
+        if cacheKey not in _nameListCache:
+            _nameListCache[cacheKey] = NameList(fname)
+        return _nameListCache[cacheKey]  # }}}
+
+
+def get_streams_file(fname, streamsdir=None):  # {{{
+    """
+    Get a parsed streams file, shared with all other callers in this process
+    that ask for the same file and streams directory, so the file is only
+    parsed again if it has been modified.  Because the object is shared, so
+    are the lists of files it finds for each stream (see
+    ``StreamsFile.readpath``).
+
+    Parameters
+    ----------
+    fname : str
+        The file name the stream file
+
+    streamsdir : str, optional
+        The base path to both the output streams data and the sreams file
+        (the latter only if ``fname`` is a relative path).
+
+    Returns
+    -------
+    streams : ``StreamsFile``
+        The parsed streams file
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    """
+    if not os.path.isabs(fname) and streamsdir is not None:
+        fname = '{}/{}'.format(streamsdir, fname)
+
+    if not os.path.exists(fname):
+        # let the constructor raise the usual error
+        return StreamsFile(fname, streamsdir=streamsdir)
+
+    cacheKey = (os.path.abspath(fname), os.path.getmtime(fname), streamsdir)
+    with _cacheLock:
+        if cacheKey not in _streamsFileCache:
+            _streamsFileCache[cacheKey] = StreamsFile(fname,
+                                                      streamsdir=streamsdir)
+        return _streamsFileCache[cacheKey]  # }}}
+
+
 class NameList:
     """
     Class for fortran manipulation of namelist files, provides
@@ -296,6 +384,10 @@ class StreamsFile:
         else:
             self.streamsdir = streamsdir
 
+        # the files found for each stream, along with their dates once these
+        # are needed
+        self._fileLists = {}
+
     def read(self, streamname, attribname):
         """
         Get the value of the given attribute in the given stream
@@ -384,7 +476,8 @@ class StreamsFile:
             # this is not an absolute path, so make it an absolute path
             path = '{}/{}'.format(self.streamsdir, path)
 
-        fileList = paths(path)
+        cachedFiles = self._get_file_list(path)
+        fileList = cachedFiles['fileList']
 
         if len(fileList) == 0:
             raise ValueError(
@@ -392,7 +485,7 @@ class StreamsFile:
                     path, self.fname, streamName))
 
         if (startDate is None) and (endDate is None):
-            return fileList
+            return list(fileList)
 
         if startDate is not None:
             # read one extra file before the start date to be on the safe side
@@ -410,25 +503,76 @@ class StreamsFile:
         if dateStartIndex == -1:
             # there is no date in the template, so we can't exclude any files
             # based on date
-            return fileList
+            return list(fileList)
         dateEndOffset = len(template) - (template.rfind('$')+2)
 
-        outFileList = []
-        for fileName in fileList:
-            # get just the
-            baseName = os.path.basename(fileName)
-            dateEndIndex = len(baseName) - dateEndOffset
-            fileDateString = baseName[dateStartIndex:dateEndIndex]
-            fileDate = string_to_datetime(fileDateString)
-            add = True
-            if startDate is not None and startDate > fileDate:
-                add = False
-            if endDate is not None and endDate < fileDate:
-                add = False
-            if add:
-                outFileList.append(fileName)
-
-        return outFileList
+        if cachedFiles['dates'] is None:
+            # parse the date of each file once, sorting the dates (along with
+            # the index of the file) so date ranges are quick to find
+            dates = []
+            for index, fileName in enumerate(fileList):
+                baseName = os.path.basename(fileName)
+                dateEndIndex = len(baseName) - dateEndOffset
+                fileDateString = baseName[dateStartIndex:dateEndIndex]
+                dates.append((string_to_datetime(fileDateString), index))
+            dates.sort()
+            cachedFiles['indices'] = [index for _, index in dates]
+            cachedFiles['dates'] = [date for date, _ in dates]
+
+        dates = cachedFiles['dates']
+        if startDate is None:
+            first = 0
+        else:
+            first = bisect.bisect_left(dates, startDate)
+        if endDate is None:
+            last = len(dates)
+        else:
+            last = bisect.bisect_right(dates, endDate)
+
+        # return the files in the same order they were found
+        indices = sorted(cachedFiles['indices'][first:last])
+        return [fileList[index] for index in indices]
+
+    def _get_file_list(self, path):  # {{{
+        """
+        Get the files matching a path (with wildcards), reusing the files
+        found in a previous call unless the directory containing them has
+        been modified since then
+
+        Parameters
+        ----------
+        path : str
+            The absolute path to the files, with wildcards for the date
+
+        Returns
+        -------
+        cachedFiles : dict
+            The list of files (``fileList``) and, if they have been parsed,
+            the sorted dates of the files (``dates``) and the index of each
+            file in the list in the same order (``indices``)
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        """
+        directory = os.path.dirname(path)
+        if '[' in directory or '*' in directory or \
+                not os.path.isdir(directory):
+            # we can't tell if the files have changed, so don't cache them
+            directoryTime = None
+        else:
+            directoryTime = os.path.getmtime(directory)
+
+        cachedFiles = self._fileLists.get(path)
+        if directoryTime is None or cachedFiles is None or \
+                cachedFiles['directoryTime'] != directoryTime:
+            cachedFiles = {'fileList': paths(path),
+                           'directoryTime': directoryTime,
+                           'dates': None,
+                           'indices': None}
+            if directoryTime is not None:
+                self._fileLists[path] = cachedFiles
+        return cachedFiles  # }}}
 
     def has_stream(self, streamName):
         """
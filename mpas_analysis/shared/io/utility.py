@@ -6,9 +6,12 @@ Phillip J. Wolfram, Xylar Asay-Davis
 
 import glob
 import os
+import json
 import random
 import string
 
+from .write_netcdf import write_netcdf
+
 
 def paths(*args):  # {{{
     """
@@ -90,6 +93,55 @@ def make_directories(path):  # {{{
     return path  # }}}
 
 
+def write_atomically(ds, fileName, unlimited_dims=None):  # {{{
+    """
+    Write a data set to a temporary file and then move it to its final name,
+    so the file is never seen half written (e.g. by another task or by a run
+    that follows one that was interrupted)
+
+    Parameters
+    ----------
+    ds : ``xarray.Dataset``
+        The data set to write
+
+    fileName : str
+        The path of the NetCDF file to write
+
+    unlimited_dims : list of str, optional
+        Dimensions (e.g. ``Time``) to write as unlimited
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    """
+    tempFileName = '{}.tmp'.format(fileName)
+    write_netcdf(ds, tempFileName, unlimited_dims=unlimited_dims)
+    os.rename(tempFileName, fileName)  # }}}
+
+
+def write_json_atomically(data, fileName):  # {{{
+    """
+    Write JSON data to a temporary file and then move it to its final name,
+    so an interrupted write doesn't leave a corrupt file
+
+    Parameters
+    ----------
+    data : object
+        The JSON-serializable data to write
+
+    fileName : str
+        The path of the JSON file to write
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    """
+    tempFileName = '{}.tmp'.format(fileName)
+    with open(tempFileName, 'w') as jsonFile:
+        json.dump(data, jsonFile, indent=2, sort_keys=True)
+    os.rename(tempFileName, fileName)  # }}}
+
+
 def build_config_full_path(config, section, relativePathOption,
                            relativePathSection=None,
                            defaultPath=None): # {{{
@@ -15,8 +15,12 @@ Xylar Asay-Davis
 import netCDF4
 import numpy
 
+from ..trace import traced
 
-def write_netcdf(ds, fileName, fillValues=netCDF4.default_fillvals):  # {{{
+
+@traced('write')
+def write_netcdf(ds, fileName, fillValues=netCDF4.default_fillvals,
+                 unlimited_dims=None):  # {{{
     '''
     Write an xarray data set to a NetCDF file using finite fill values
 
@@ -33,6 +37,10 @@ def write_netcdf(ds, fileName, fillValues=netCDF4.default_fillvals):  # {{{
         this is the dictionary used by the netCDF4 package.  Key entries should
         be of the form 'f8' (for float64), 'i4' (for int32), etc.
 
+    unlimited_dims : list of str, optional
+        Dimensions (e.g. ``Time``) to write as unlimited, so records can be
+        appended to the file later
+
     Authors
     -------
     Xylar Asay-Davis
@@ -47,7 +55,8 @@ def write_netcdf(ds, fileName, fillValues=netCDF4.default_fillvals):  # {{{
                     {'_FillValue': fillValues[fillType]}
                 break
 
-    ds.to_netcdf(fileName, encoding=encodingDict)
+    ds.to_netcdf(fileName, encoding=encodingDict,
+                 unlimited_dims=unlimited_dims)
 
     # }}}
 
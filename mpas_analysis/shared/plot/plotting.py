@@ -24,9 +24,12 @@ from ..timekeeping.utility import days_to_datetime, date_to_days
 
 from ..constants import constants
 
+from ..trace import traced
+
 import ConfigParser
 
 
+@traced('plot')
 def timeseries_analysis_plot(config, dsvalues, N, title, xlabel, ylabel,
                              fileout, lineStyles, lineWidths, legendText,
                              calendar, titleFontSize=None, figsize=(15, 6),
@@ -134,6 +137,7 @@ def timeseries_analysis_plot(config, dsvalues, N, title, xlabel, ylabel,
         plt.close()
 
 
+@traced('plot')
 def timeseries_analysis_plot_polar(config, dsvalues, N, title,
                                    fileout, lineStyles, lineWidths,
                                    legendText, titleFontSize=None,
@@ -235,6 +239,7 @@ def timeseries_analysis_plot_polar(config, dsvalues, N, title,
         plt.close()
 
 
+@traced('plot')
 def plot_polar_comparison(
         config,
         Lons,
@@ -402,6 +407,7 @@ def plot_polar_comparison(
         plt.close()
 
 
+@traced('plot')
 def plot_global_comparison(
     config,
     Lons,
@@ -564,6 +570,7 @@ def _date_tick(days, pos, calendar='gregorian', includeMonth=True):
         return '{:04d}'.format(date.year)
 
 
+@traced('plot')
 def plot_1D(config, xArrays, fieldArrays, errArrays,
             lineColors, lineWidths, legendText,
             title=None, xlabel=None, ylabel=None,
@@ -685,6 +692,7 @@ def plot_1D(config, xArrays, fieldArrays, errArrays,
     return  # }}}
 
 
+@traced('plot')
 def plot_vertical_section(
     config,
     xArray,
@@ -0,0 +1,263 @@
+'''
+Functions for measuring the resources (e.g. memory, CPU time and bytes read
+and written) used by the current process and the processes it launches
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import resource
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# the external tools whose wall-clock time is reported separately, with the
+# name of the resource for each.  The time of any other command run with
+# ``run_command`` is added to ``otherToolTime``.
+toolTimeNames = OrderedDict([('ncclimo', 'ncclimoTime'),
+                             ('ncremap', 'ncremapTime'),
+                             ('ncrcat', 'ncrcatTime'),
+                             ('ESMF_RegridWeightGen', 'esmfTime')])
+
+# the resources measured while a task runs, with units:
+#   wallTime, cpuTime: seconds
+#   peakMemory: GB
+#   bytesRead, bytesWritten: bytes
+#   ncclimoTime, ..., otherToolTime: seconds, the sum of the wall-clock times
+#   of each invocation of the tool
+resourceUsageNames = ['wallTime', 'cpuTime', 'peakMemory', 'bytesRead',
+                      'bytesWritten'] + list(toolTimeNames.values()) + \
+    ['otherToolTime']
+
+# the largest peak resident memory (in GB) of the child processes recorded
+# with ``record_child_peak_memory`` since the last ``ResourceMonitor`` was
+# constructed
+_childPeakMemory = 0.
+
+# the total wall-clock time of each external tool recorded with
+# ``record_tool_time`` since the last ``ResourceMonitor`` was constructed,
+# with the resource names in ``resourceUsageNames`` as keys
+_toolTimes = {}
+_toolTimesLock = threading.Lock()
+
+
+def reset_peak_memory():  # {{{
+    '''
+    Reset the peak resident memory of this process to its current resident
+    memory, so that a later call to ``get_peak_memory`` measures only the
+    peak since this call.  This is only supported on Linux, and has no effect
+    on other systems.
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clearRefsFile:
+            clearRefsFile.write('5')
+    except (IOError, OSError):
+        pass  # }}}
+
+
+def get_peak_memory():  # {{{
+    '''
+    Get the peak resident memory of this process
+
+    Returns
+    -------
+    peakMemory : float
+        The peak resident memory in GB, since the process began or since the
+        last call to ``reset_peak_memory``
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    try:
+        # if /proc is available, VmHWM is the peak resident memory in kB,
+        # which can be reset
+        with open('/proc/self/status') as statusFile:
+            for line in statusFile:
+                if line.startswith('VmHWM:'):
+                    return float(line.split()[1])/1024.**2
+    except (IOError, OSError):
+        pass
+
+    return _maxrss_to_gb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    # }}}
+
+
+def get_children_peak_memory():  # {{{
+    '''
+    Get the largest peak resident memory of the child processes of this
+    process that have finished and been waited on
+
+    Returns
+    -------
+    peakMemory : float
+        The peak resident memory in GB of the largest child process since
+        this process began
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    return _maxrss_to_gb(
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)  # }}}
+
+
+def record_child_peak_memory(peakMemory):  # {{{
+    '''
+    Record the peak resident memory of a child process (e.g. an external
+    command) that has finished, so that it is included in the peak memory
+    measured by ``ResourceMonitor``
+
+    Parameters
+    ----------
+    peakMemory : float
+        The peak resident memory of the child process in GB, or ``None`` if
+        it wasn't measured
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    global _childPeakMemory
+    if peakMemory is not None:
+        _childPeakMemory = max(_childPeakMemory, peakMemory)  # }}}
+
+
+def record_tool_time(commandName, wallTime):  # {{{
+    '''
+    Record the wall-clock time of an invocation of an external tool, so that
+    it is included in the time of that tool measured by ``ResourceMonitor``
+
+    Parameters
+    ----------
+    commandName : str
+        The name of the command (without its path), e.g. ``ncclimo``
+
+    wallTime : float
+        The wall-clock time of the command in seconds
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    name = toolTimeNames.get(commandName, 'otherToolTime')
+    # tools may be run from several threads of the same task
+    with _toolTimesLock:
+        _toolTimes[name] = _toolTimes.get(name, 0.) + wallTime  # }}}
+
+
+class ResourceMonitor(object):  # {{{
+    '''
+    Measures the resources used by this process (and the processes it
+    launches) between construction and a call to ``stop``.  The peak memory
+    is the largest of the peak of this process and of the child processes
+    that finished in the meantime, since most of the memory of tasks that
+    run external tools is used by those tools.  The time spent in external
+    tools is the wall-clock time of each tool run with ``run_command``,
+    summed by tool.
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def __init__(self):  # {{{
+        '''
+        Start measuring
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        global _childPeakMemory
+        reset_peak_memory()
+        _childPeakMemory = 0.
+        with _toolTimesLock:
+            _toolTimes.clear()
+        self._startChildrenPeakMemory = get_children_peak_memory()
+        self._start = _get_counters()
+        self._startTime = time.time()  # }}}
+
+    def stop(self):  # {{{
+        '''
+        Stop measuring
+
+        Returns
+        -------
+        usage : ``OrderedDict``
+            The resources used since this monitor was constructed, with the
+            names in ``resourceUsageNames`` as keys.  Values that can't be
+            measured on this system are ``None``.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        end = _get_counters()
+        usage = OrderedDict()
+        usage['wallTime'] = time.time() - self._startTime
+        # the peak of the children since the process began only tells us
+        # about children of this task if it went up while the task ran
+        childrenPeakMemory = get_children_peak_memory()
+        if childrenPeakMemory <= self._startChildrenPeakMemory:
+            childrenPeakMemory = 0.
+        usage['peakMemory'] = max(get_peak_memory(), childrenPeakMemory,
+                                  _childPeakMemory)
+        for name in end:
+            if end[name] is None or self._start[name] is None:
+                usage[name] = None
+            else:
+                usage[name] = end[name] - self._start[name]
+        with _toolTimesLock:
+            for name in list(toolTimeNames.values()) + ['otherToolTime']:
+                usage[name] = _toolTimes.get(name, 0.)
+        return OrderedDict([(name, usage[name]) for name in
+                            resourceUsageNames])  # }}}
+
+    # }}}
+
+
+def _maxrss_to_gb(maxrss):  # {{{
+    '''
+    Convert the peak resident memory from ``getrusage`` to GB
+    '''
+    if sys.platform == 'darwin':
+        # in bytes on Mac OS X
+        return maxrss/1024.**3
+    else:
+        # in kB on Linux
+        return maxrss/1024.**2  # }}}
+
+
+def _get_counters():  # {{{
+    '''
+    Get the cumulative CPU time and bytes read and written by this process
+    '''
+    counters = OrderedDict()
+    selfUsage = resource.getrusage(resource.RUSAGE_SELF)
+    counters['cpuTime'] = selfUsage.ru_utime + selfUsage.ru_stime
+
+    # bytes passed to read and write calls (including those satisfied from
+    # the page cache), only available on Linux
+    counters['bytesRead'] = None
+    counters['bytesWritten'] = None
+    try:
+        with open('/proc/self/io') as ioFile:
+            for line in ioFile:
+                name, value = line.split(':')
+                if name == 'rchar':
+                    counters['bytesRead'] = float(value)
+                elif name == 'wchar':
+                    counters['bytesWritten'] = float(value)
+    except (IOError, OSError):
+        pass
+
+    return counters  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
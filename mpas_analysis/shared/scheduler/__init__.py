@@ -0,0 +1,5 @@
+from .task_scheduler import TaskScheduler
+from .launcher import ProcessLauncher, PoolLauncher, \
+    CommandLauncher
+from .parallel_setup import setup_task, setup_tasks_in_parallel, \
+    print_setup_times
@@ -0,0 +1,80 @@
+'''
+A function for writing a timeline of a run in the Chrome trace event format,
+which can be viewed by opening ``chrome://tracing`` in Chrome or at
+https://ui.perfetto.dev
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import json
+
+
+def write_chrome_trace(fileName, spans, startTime, laneCount):  # {{{
+    '''
+    Write a trace with one lane for each slot where tasks can run.  Each task
+    is a span in the lane where it ran, with the phases recorded while it ran
+    (e.g. ``load``, ``compute``, ``remap``, ``plot`` and ``write XML``)
+    nested inside it.
+
+    Parameters
+    ----------
+    fileName : str
+        The JSON file to write
+
+    spans : list of dict
+        One entry for each task that ran, with the full task name
+        (``taskName``), the lane it ran in (``lane``), its ``status``, its
+        ``startTime`` and ``endTime`` (in seconds since the epoch) and a list
+        of ``phases``, each a tuple of the name, start time and end time of
+        the phase
+
+    startTime : float
+        The time (in seconds since the epoch) when the run started, the zero
+        point of the trace
+
+    laneCount : int
+        The number of lanes
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def to_microseconds(time):
+        return int(round(1e6*(time - startTime)))
+
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 0, 'tid': 0,
+               'args': {'name': 'mpas_analysis'}}]
+    for lane in range(laneCount):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0,
+                       'tid': lane, 'args': {'name': 'slot {}'.format(lane)}})
+        events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 0,
+                       'tid': lane, 'args': {'sort_index': lane}})
+
+    for span in spans:
+        taskStart = to_microseconds(span['startTime'])
+        taskEnd = to_microseconds(span['endTime'])
+        events.append({'name': span['taskName'], 'cat': 'task', 'ph': 'X',
+                       'pid': 0, 'tid': span['lane'], 'ts': taskStart,
+                       'dur': taskEnd - taskStart,
+                       'args': {'status': span['status']}})
+        for name, phaseStart, phaseEnd in span['phases']:
+            # keep phases inside their task in case the clock of the process
+            # running the task disagrees slightly with ours
+            phaseStart = min(max(to_microseconds(phaseStart), taskStart),
+                             taskEnd)
+            phaseEnd = min(max(to_microseconds(phaseEnd), phaseStart),
+                           taskEnd)
+            events.append({'name': name, 'cat': 'phase', 'ph': 'X',
+                           'pid': 0, 'tid': span['lane'], 'ts': phaseStart,
+                           'dur': phaseEnd - phaseStart,
+                           'args': {'taskName': span['taskName']}})
+
+    with open(fileName, 'w') as traceFile:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                  traceFile)
+    # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
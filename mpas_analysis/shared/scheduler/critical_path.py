@@ -0,0 +1,164 @@
+'''
+Functions for analyzing the graph of task dependencies: finding the longest
+(critical) chain of tasks and predicting how long a run will take.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import heapq
+
+
+def compute_priorities(durations, dependents):  # {{{
+    '''
+    Compute the priority of each task as the estimated time from when the
+    task starts until the end of the longest chain of tasks that depend on it
+    (including the task itself).  Launching tasks with the highest priority
+    first ensures that tasks on the critical path are not held up behind
+    short tasks that nothing else is waiting on.
+
+    Parameters
+    ----------
+    durations : dict of float
+        The estimated duration of each task, with task keys as keys
+
+    dependents : dict of list
+        The keys of the tasks that directly depend on each task
+
+    Returns
+    -------
+    priorities : dict of float
+        The length of the longest downstream chain starting with each task
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    priorities = {}
+    for key in durations:
+        if key in priorities:
+            continue
+        # depth-first traversal without recursion, computing the priority of
+        # each task after the priorities of all its dependents are known
+        stack = [(key, False)]
+        while len(stack) > 0:
+            currentKey, dependentsDone = stack.pop()
+            if currentKey in priorities:
+                continue
+            if dependentsDone:
+                downstream = [priorities[dependentKey] for dependentKey in
+                              dependents[currentKey]]
+                priorities[currentKey] = durations[currentKey] + \
+                    max([0.] + downstream)
+            else:
+                stack.append((currentKey, True))
+                for dependentKey in dependents[currentKey]:
+                    if dependentKey not in priorities:
+                        stack.append((dependentKey, False))
+
+    return priorities  # }}}
+
+
+def get_critical_path(priorities, durations, dependents):  # {{{
+    '''
+    Find the chain of tasks with the longest total estimated duration
+
+    Parameters
+    ----------
+    priorities : dict of float
+        The priorities of each task from ``compute_priorities``
+
+    durations : dict of float
+        The estimated duration of each task, with task keys as keys
+
+    dependents : dict of list
+        The keys of the tasks that directly depend on each task
+
+    Returns
+    -------
+    criticalPath : list
+        The keys of the tasks on the critical path, in the order they run
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    if len(priorities) == 0:
+        return []
+
+    # the task with the highest priority always heads the critical path
+    key = max(priorities, key=lambda key: priorities[key])
+    criticalPath = [key]
+    while len(dependents[key]) > 0:
+        key = max(dependents[key], key=lambda key: priorities[key])
+        criticalPath.append(key)
+
+    return criticalPath  # }}}
+
+
+def predict_makespan(durations, dependents, prereqCounts, priorities,
+                     taskCount):  # {{{
+    '''
+    Predict the total time needed to run all tasks, simulating how the
+    scheduler launches the highest-priority ready task whenever fewer than
+    ``taskCount`` tasks are running.
+
+    Parameters
+    ----------
+    durations : dict of float
+        The estimated duration of each task, with task keys as keys
+
+    dependents : dict of list
+        The keys of the tasks that directly depend on each task
+
+    prereqCounts : dict of int
+        The number of prerequisites of each task
+
+    priorities : dict of float
+        The priorities of each task from ``compute_priorities``
+
+    taskCount : int
+        The maximum number of tasks that run at the same time
+
+    Returns
+    -------
+    makespan : float
+        The predicted time from launching the first task until the last task
+        finishes
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    remainingPrereqs = dict(prereqCounts)
+    readyHeap = []
+    for order, key in enumerate(durations):
+        if remainingPrereqs[key] == 0:
+            heapq.heappush(readyHeap, (-priorities[key], order, key))
+
+    orders = dict([(key, order) for order, key in enumerate(durations)])
+
+    currentTime = 0.
+    runningHeap = []
+    while len(readyHeap) > 0 or len(runningHeap) > 0:
+        while len(readyHeap) > 0 and len(runningHeap) < taskCount:
+            _, _, key = heapq.heappop(readyHeap)
+            heapq.heappush(runningHeap, (currentTime + durations[key], key))
+
+        currentTime, key = heapq.heappop(runningHeap)
+        for dependentKey in dependents[key]:
+            if dependentKey not in remainingPrereqs:
+                continue
+            remainingPrereqs[dependentKey] -= 1
+            if remainingPrereqs[dependentKey] == 0:
+                heapq.heappush(readyHeap, (-priorities[dependentKey],
+                                           orders[dependentKey],
+                                           dependentKey))
+
+    return currentTime  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,498 @@
+'''
+Launchers used by the scheduler to start analysis tasks running in parallel,
+either as forked processes, in a pool of long-lived worker processes or as
+external commands (e.g. on the compute nodes of a job allocation).
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import subprocess
+import threading
+from multiprocessing import Process, Queue, Array
+
+from ..analysis_task import AnalysisTask
+from ..interpolation import Remapper
+
+
+class ProcessLauncher(object):  # {{{
+    '''
+    Launches each task in a forked process on the same node, the default
+    launcher
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def launch(self, analysisTask, completionQueue):  # {{{
+        '''
+        Start running a task
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task to launch
+
+        completionQueue : ``multiprocessing.Queue``
+            A queue where the (task, subtask) names of the task are put once
+            it finishes
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask._completionQueue = completionQueue
+        analysisTask.start()  # }}}
+
+    def is_alive(self, analysisTask):  # {{{
+        '''
+        Whether a task that was launched is still running
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        isAlive : bool
+            Whether the task is still running
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return analysisTask.is_alive()  # }}}
+
+    def join(self, analysisTask):  # {{{
+        '''
+        Wait for a task to finish
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        exitCode : int
+            The exit code of the process that ran the task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask.join()
+        return analysisTask.exitcode  # }}}
+
+    def close(self):  # {{{
+        '''
+        Clean up once all tasks have finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        pass  # }}}
+
+    # }}}
+
+
+class CommandLauncher(object):  # {{{
+    '''
+    Launches each task as an external command, the given command followed by
+    the full name of the task.  This is typically ``run_mpas_analysis`` with
+    the hidden ``--run-task`` flag, preceded by ``commandPrefix`` from the
+    ``execute`` section of the config file (e.g. ``srun -n 1 python``) so
+    that tasks can be spread across the nodes of a job allocation.
+
+    With the prefix ``python``, each task runs as a separate command on the
+    local node, a stand-in for a job launcher that is also used in testing.
+    (By default, without a prefix, the scheduler uses ``ProcessLauncher``
+    instead, forking a process for each task.)
+
+    The command must exit with code 0 if the task succeeded and 1 if it
+    failed.  Any other exit code is treated as an unexpected exit.  The task
+    writes its own log file, so the command line and any output the command
+    writes to stdout and stderr (e.g. from the job launcher or a crash before
+    logging starts) go to a separate ``<task>.out`` file next to the log
+    file.
+
+    Attributes
+    ----------
+    command : list of str
+        The command (and arguments) to which the full task name is appended
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def __init__(self, command):  # {{{
+        '''
+        Construct the launcher
+
+        Parameters
+        ----------
+        command : list of str
+            The command (and arguments) to which the full task name is
+            appended
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self.command = command
+        self._processes = {}
+        self._watchers = {}  # }}}
+
+    def launch(self, analysisTask, completionQueue):  # {{{
+        '''
+        Start running a task
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task to launch
+
+        completionQueue : ``multiprocessing.Queue``
+            A queue where the (task, subtask) names of the task are put once
+            it finishes
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        key = (analysisTask.taskName, analysisTask.subtaskName)
+        args = self.command + [analysisTask.fullTaskName]
+
+        # the task appends to its log file, so clear out the log of any
+        # previous run
+        open(analysisTask._logFileName, 'w').close()
+
+        # the command and its output go to a separate file, so only the task
+        # writes to the log file
+        outFileName = _get_output_file_name(analysisTask)
+        outFile = open(outFileName, 'w')
+        outFile.write('Command: {}\n'.format(' '.join(args)))
+        # make sure the command gets written before the rest of the output
+        outFile.flush()
+
+        process = subprocess.Popen(args, stdout=outFile,
+                                   stderr=subprocess.STDOUT)
+        outFile.close()
+
+        # only the watcher thread waits on the process, so the scheduler is
+        # woken up through the queue as soon as the task finishes
+        watcher = threading.Thread(target=_watch_process,
+                                   args=(process, key, completionQueue))
+        watcher.daemon = True
+        watcher.start()
+
+        self._processes[key] = process
+        self._watchers[key] = watcher  # }}}
+
+    def is_alive(self, analysisTask):  # {{{
+        '''
+        Whether a task that was launched is still running
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        isAlive : bool
+            Whether the task is still running
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        key = (analysisTask.taskName, analysisTask.subtaskName)
+        return self._watchers[key].is_alive()  # }}}
+
+    def join(self, analysisTask):  # {{{
+        '''
+        Wait for a task to finish and set its status from the exit code of
+        the command
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        exitCode : int
+            The exit code of the command that ran the task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        key = (analysisTask.taskName, analysisTask.subtaskName)
+        self._watchers.pop(key).join()
+        exitCode = self._processes.pop(key).returncode
+
+        if exitCode == 0:
+            analysisTask._runStatus.value = AnalysisTask.SUCCESS
+        else:
+            if exitCode == 1:
+                analysisTask._runStatus.value = AnalysisTask.FAIL
+            # otherwise, the status is left as RUNNING so the scheduler
+            # reports an unexpected exit
+
+            # the command has exited, so nothing else is writing to the log
+            with open(analysisTask._logFileName, 'a') as logFile:
+                logFile.write('See {} for the output of the command\n'.format(
+                    _get_output_file_name(analysisTask)))
+
+        return exitCode  # }}}
+
+    def close(self):  # {{{
+        '''
+        Clean up once all tasks have finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        pass  # }}}
+
+    # }}}
+
+
+class PoolLauncher(object):  # {{{
+    '''
+    Runs tasks in a pool of long-lived worker processes.  The workers are
+    forked once all tasks have been set up, so they start with all modules
+    imported and all tasks in memory, and then pull the (task, subtask) names
+    of tasks to run from a queue.  Each worker keeps its own caches (e.g. of
+    the weights and indices in mapping files) warm across the tasks it runs.
+    A worker that dies while running a task is replaced.
+
+    Attributes
+    ----------
+    tasks : ``OrderedDict`` of ``AnalysisTask``
+        All the tasks that may be launched, with (task, subtask) names as keys
+
+    workerCount : int
+        The number of worker processes
+
+    mappingCacheSize : int
+        The number of mapping files whose weights and indices each worker
+        keeps in memory
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def __init__(self, tasks, workerCount, mappingCacheSize=1):  # {{{
+        '''
+        Construct the launcher.  Workers are started when the first task is
+        launched.
+
+        Parameters
+        ----------
+        tasks : ``OrderedDict`` of ``AnalysisTask``
+            All the tasks that may be launched, with (task, subtask) names as
+            keys
+
+        workerCount : int
+            The number of worker processes
+
+        mappingCacheSize : int, optional
+            The number of mapping files whose weights and indices each worker
+            keeps in memory, so memory use doesn't grow with every mapping
+            file a worker reads
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self.tasks = tasks
+        self.workerCount = workerCount
+        self.mappingCacheSize = mappingCacheSize
+
+        self._order = dict([(key, order) for order, key in
+                            enumerate(tasks)])
+        self._workers = []
+        self._taskQueue = None
+        self._completionQueue = None
+        # the index of the task each worker is running, or -1 if it's idle
+        self._currentTasks = Array('i', [-1]*workerCount)  # }}}
+
+    def launch(self, analysisTask, completionQueue):  # {{{
+        '''
+        Queue a task to be run by the next available worker
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task to launch
+
+        completionQueue : ``multiprocessing.Queue``
+            A queue where the (task, subtask) names of the task are put once
+            it finishes
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if self._taskQueue is None:
+            self._taskQueue = Queue()
+            self._completionQueue = completionQueue
+            for workerIndex in range(self.workerCount):
+                self._workers.append(self._start_worker(workerIndex))
+
+        key = (analysisTask.taskName, analysisTask.subtaskName)
+        self._taskQueue.put(key)  # }}}
+
+    def is_alive(self, analysisTask):  # {{{
+        '''
+        Whether a task that was launched is still running or waiting for a
+        worker
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        isAlive : bool
+            Whether the task is still running or waiting to run
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        workerIndex = self._get_worker_index(analysisTask)
+        if workerIndex is not None:
+            return self._workers[workerIndex].is_alive()
+
+        if analysisTask._runStatus.value != AnalysisTask.RUNNING:
+            # the task has finished
+            return False
+
+        # the task is waiting for a worker
+        return any([worker.is_alive() for worker in self._workers])  # }}}
+
+    def join(self, analysisTask):  # {{{
+        '''
+        Clean up after a task has finished, replacing the worker that ran it
+        if the worker died
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            A task that was launched
+
+        Returns
+        -------
+        exitCode : int
+            0 if the task succeeded, 1 if it failed or the exit code of the
+            worker if it died while running the task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        status = analysisTask._runStatus.value
+        if status == AnalysisTask.SUCCESS:
+            return 0
+        elif status == AnalysisTask.FAIL:
+            return 1
+
+        workerIndex = self._get_worker_index(analysisTask)
+        if workerIndex is None:
+            # all workers died before the task started
+            return None
+
+        worker = self._workers[workerIndex]
+        worker.join()
+        self._currentTasks[workerIndex] = -1
+        self._workers[workerIndex] = self._start_worker(workerIndex)
+        return worker.exitcode  # }}}
+
+    def close(self):  # {{{
+        '''
+        Stop the workers once all tasks have finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        for worker in self._workers:
+            self._taskQueue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self._taskQueue = None  # }}}
+
+    def _start_worker(self, workerIndex):  # {{{
+        '''
+        Start a worker process
+        '''
+        worker = Process(target=_run_pool_worker,
+                         args=(self.tasks, workerIndex, self._taskQueue,
+                               self._completionQueue, self._currentTasks,
+                               self.mappingCacheSize))
+        worker.start()
+        return worker  # }}}
+
+    def _get_worker_index(self, analysisTask):  # {{{
+        '''
+        Get the index of the worker running a task, or ``None`` if no worker
+        is running it
+        '''
+        order = self._order[(analysisTask.taskName, analysisTask.subtaskName)]
+        for workerIndex in range(len(self._workers)):
+            if self._currentTasks[workerIndex] == order:
+                return workerIndex
+        return None  # }}}
+
+    # }}}
+
+
+def _run_pool_worker(tasks, workerIndex, taskQueue, completionQueue,
+                     currentTasks, mappingCacheSize):  # {{{
+    '''
+    Run tasks from the queue until ``None`` is received
+    '''
+    Remapper.mappingCacheSize = mappingCacheSize
+    orders = dict([(key, order) for order, key in enumerate(tasks)])
+    while True:
+        key = taskQueue.get()
+        if key is None:
+            break
+        currentTasks[workerIndex] = orders[key]
+        analysisTask = tasks[key]
+        analysisTask._completionQueue = completionQueue
+        analysisTask.run(writeLogFile=True)
+        currentTasks[workerIndex] = -1
+    # }}}
+
+
+def _watch_process(process, key, completionQueue):  # {{{
+    '''
+    Wait for a process to finish, then put its key in the completion queue
+    '''
+    process.wait()
+    completionQueue.put(key)  # }}}
+
+
+def _get_output_file_name(analysisTask):  # {{{
+    '''
+    Get the name of the file with the output of the command that runs a task
+    '''
+    return '{}.out'.format(os.path.splitext(analysisTask._logFileName)[0])
+    # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
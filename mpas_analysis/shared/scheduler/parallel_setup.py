@@ -0,0 +1,171 @@
+'''
+Functions for calling ``setup_and_check`` on analysis tasks, either one at a
+time or in several threads at once, while respecting the order in which
+tasks must be set up (prerequisites, then the task, then its subtasks).
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import threading
+import traceback
+import time
+from Queue import Queue, Empty
+
+from .task_scheduler import _format_duration
+
+# protects the creation of the lock for each task
+_taskLocksLock = threading.Lock()
+
+
+def setup_task(analysisTask):  # {{{
+    '''
+    Call ``setup_and_check`` on a task, unless this has already been done, in
+    which case the previous outcome is returned.  This function is thread
+    safe: if another thread is already setting up the task, this call waits
+    for it to finish.
+
+    Parameters
+    ----------
+    analysisTask : ``AnalysisTask``
+        The task to set up
+
+    Returns
+    -------
+    success : bool
+        Whether ``setup_and_check`` succeeded.  If not, the traceback is
+        stored in ``analysisTask._setupError``.
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    with _taskLocksLock:
+        if analysisTask._setupLock is None:
+            analysisTask._setupLock = threading.Lock()
+
+    with analysisTask._setupLock:
+        if analysisTask._setupDuration is None:
+            startTime = time.time()
+            try:
+                analysisTask.setup_and_check()
+            except (Exception, BaseException):
+                analysisTask._setupError = traceback.format_exc()
+            analysisTask._setupDuration = time.time() - startTime
+
+    return analysisTask._setupError is None  # }}}
+
+
+def setup_tasks_in_parallel(analyses, threadCount):  # {{{
+    '''
+    Set up the requested tasks, along with their prerequisites and subtasks,
+    in several threads at once.  Each task is set up only after all its
+    prerequisites (and its parent task, if it is a subtask) have been set up
+    successfully.  The outcome of each task's setup is stored in the task
+    for a later (serial) call to ``setup_task`` to pick up.
+
+    Parameters
+    ----------
+    analyses : list of ``AnalysisTask`` objects
+        A list of all analysis tasks
+
+    threadCount : int
+        The number of threads to use
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    taskQueue = Queue()
+    for analysisTask in analyses:
+        if analysisTask.check_generate():
+            taskQueue.put(analysisTask)
+
+    threads = []
+    for threadIndex in range(threadCount):
+        thread = threading.Thread(target=_setup_from_queue,
+                                  args=(taskQueue,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        # join with a timeout so a keyboard interrupt isn't blocked
+        while thread.is_alive():
+            thread.join(1.0)
+    # }}}
+
+
+def print_setup_times(analyses, setupDuration):  # {{{
+    '''
+    Print the time each task took to set up, longest first
+
+    Parameters
+    ----------
+    analyses : ``OrderedDict`` of ``AnalysisTask``
+        The analysis tasks that were set up, with (task, subtask) names as
+        keys
+
+    setupDuration : float
+        The time in seconds it took to set up all tasks
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    setupTasks = [analysisTask for analysisTask in analyses.values() if
+                  analysisTask._setupDuration is not None]
+    setupTasks.sort(key=lambda analysisTask: analysisTask._setupDuration,
+                    reverse=True)
+
+    print '\nSetup times:'
+    for analysisTask in setupTasks:
+        print '    {} ({})'.format(
+            analysisTask.printTaskName,
+            _format_duration(analysisTask._setupDuration))
+    print 'Total setup time: {}\n'.format(_format_duration(setupDuration))
+    # }}}
+
+
+def _setup_from_queue(taskQueue):  # {{{
+    '''
+    Set up tasks (and their prerequisites and subtasks) from the queue until
+    it is empty
+    '''
+    while True:
+        try:
+            analysisTask = taskQueue.get_nowait()
+        except Empty:
+            return
+        _setup_with_dependencies(analysisTask)
+    # }}}
+
+
+def _setup_with_dependencies(analysisTask):  # {{{
+    '''
+    Set up the prerequisites of a task, then the task, then its subtasks,
+    stopping at the first failure
+    '''
+    # prerequisites of the subtasks that aren't themselves subtasks also
+    # need to be set up before this task
+    prereqs = list(analysisTask.runAfterTasks)
+    for subtask in analysisTask.subtasks:
+        for prereq in subtask.runAfterTasks:
+            if prereq not in analysisTask.subtasks:
+                prereqs.append(prereq)
+
+    for prereq in prereqs:
+        if not _setup_with_dependencies(prereq):
+            return False
+
+    if not setup_task(analysisTask):
+        return False
+
+    for subtask in analysisTask.subtasks:
+        if not _setup_with_dependencies(subtask):
+            return False
+
+    return True  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,90 @@
+'''
+Functions for writing and reading a report of the resources (wall and CPU
+time, peak memory, bytes read and written and the wall-clock time of each
+external tool) used by each analysis task.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import json
+import csv
+
+from ..io.utility import build_config_full_path
+from ..resource_usage import resourceUsageNames
+
+
+def write_performance_report(config, records):  # {{{
+    '''
+    Write the report to ``performance.json`` and ``performance.csv`` in the
+    logs directory
+
+    Parameters
+    ----------
+    config : ``MpasAnalysisConfigParser``
+        Contains configuration options
+
+    records : list of ``OrderedDict``
+        One record for each task with the full task name (``taskName``), the
+        status of the task (``success``, ``fail`` or ``skipped``) and the
+        resources in ``shared.resource_usage.resourceUsageNames`` (``None``
+        if not measured)
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    jsonFileName, csvFileName = _get_file_names(config)
+
+    with open(jsonFileName, 'w') as jsonFile:
+        json.dump(records, jsonFile, indent=2)
+
+    fieldNames = ['taskName', 'status'] + resourceUsageNames
+    with open(csvFileName, 'w') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(fieldNames)
+        for record in records:
+            writer.writerow(['' if record[name] is None else record[name]
+                             for name in fieldNames])
+    # }}}
+
+
+def read_performance_report(config):  # {{{
+    '''
+    Read the report written by the most recent run, if any
+
+    Parameters
+    ----------
+    config : ``MpasAnalysisConfigParser``
+        Contains configuration options
+
+    Returns
+    -------
+    records : list of dict
+        One record for each task (see ``write_performance_report``), or
+        ``None`` if there is no report
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    jsonFileName, csvFileName = _get_file_names(config)
+    if not os.path.exists(jsonFileName):
+        return None
+
+    with open(jsonFileName) as jsonFile:
+        return json.load(jsonFile)  # }}}
+
+
+def _get_file_names(config):  # {{{
+    '''
+    Get the names of the JSON and CSV files for the report
+    '''
+    logsDirectory = build_config_full_path(config, 'output',
+                                           'logsSubdirectory')
+    return ['{}/performance.{}'.format(logsDirectory, extension) for
+            extension in ['json', 'csv']]  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
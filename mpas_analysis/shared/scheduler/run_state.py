@@ -0,0 +1,231 @@
+'''
+A persistent record of the state of each analysis task after it last ran
+successfully, used by the scheduler to skip tasks whose config options,
+inputs and outputs have not changed since then.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import json
+import hashlib
+
+from .task_history import TaskHistory
+
+
+class RunState(TaskHistory):  # {{{
+    '''
+    Stores a fingerprint of each task that succeeded, along with the size and
+    modification time of each of its output files, in a JSON file keyed by
+    the full task name.
+
+    The fingerprint of a task is a hash of:
+
+    * the config options the task may use: those in the section named after
+      the task and in all sections that aren't named after another task
+      (except ``execute`` and ``html``, and the ``generate`` option)
+
+    * the size and modification time of its input files (``inputFiles``),
+      which tasks that read files while running (rather than the outputs of
+      their prerequisites) should set during setup
+
+    * the variables and seasons it computes (``variableList`` and
+      ``seasons``), if any, regardless of the order in which they were added
+
+    * the fingerprints of its prerequisites and subtasks and the size and
+      modification time of their output files
+
+    so a task is run again if any of its prerequisites ran again and changed
+    their outputs.
+
+    Attributes
+    ----------
+    config : ``MpasAnalysisConfigParser``
+        Contains configuration options
+
+    taskNames : set of str
+        The names of all tasks, whose config sections are specific to each
+        task
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    # config sections and options that don't affect the results of tasks
+    excludedSections = ['execute', 'html']
+    excludedOptions = [('output', 'generate')]
+
+    def __init__(self, fileName, config, taskNames):  # {{{
+        '''
+        Read in the run state from a file, if it exists
+
+        Parameters
+        ----------
+        fileName : str
+            The JSON file where the run state is stored
+
+        config : ``MpasAnalysisConfigParser``
+            Contains configuration options
+
+        taskNames : list of str
+            The names of all tasks, whose config sections are specific to
+            each task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        super(RunState, self).__init__(fileName)
+        self.config = config
+        self.taskNames = set(taskNames)  # }}}
+
+    def compute_fingerprint(self, analysisTask):  # {{{
+        '''
+        Compute the fingerprint of a task, which must be done after its
+        prerequisites and subtasks have finished
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task that is ready to run
+
+        Returns
+        -------
+        fingerprint : str
+            A hash of the config options, inputs and prerequisites of the
+            task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        config = self.config
+
+        configOptions = {}
+        for section in config.sections():
+            if section in self.excludedSections or \
+                    (section in self.taskNames and
+                     section != analysisTask.taskName):
+                continue
+            configOptions[section] = \
+                dict([(option, value) for option, value in
+                      config.items(section, raw=True)
+                      if (section, option) not in self.excludedOptions])
+
+        prereqs = {}
+        for prereq in analysisTask.runAfterTasks + analysisTask.subtasks:
+            prereqs[prereq.fullTaskName] = {
+                'fingerprint': self.get(prereq.fullTaskName, 'fingerprint'),
+                'outputs': _get_file_stats(prereq.get_output_files())}
+
+        state = {'taskName': analysisTask.fullTaskName,
+                 'config': configOptions,
+                 'inputs': _get_file_stats(getattr(analysisTask, 'inputFiles',
+                                                   [])),
+                 'variableList': _get_sorted(analysisTask, 'variableList'),
+                 'seasons': _get_sorted(analysisTask, 'seasons'),
+                 'prereqs': prereqs}
+
+        return hashlib.sha1(json.dumps(state, sort_keys=True)).hexdigest()
+        # }}}
+
+    def is_unchanged(self, analysisTask, fingerprint):  # {{{
+        '''
+        Whether a task succeeded in a previous run with the same fingerprint
+        and its output files are unchanged since then
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task that is ready to run
+
+        fingerprint : str
+            The current fingerprint of the task
+
+        Returns
+        -------
+        isUnchanged : bool
+            Whether the task can be skipped
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        fullTaskName = analysisTask.fullTaskName
+        if self.get(fullTaskName, 'fingerprint') != fingerprint:
+            return False
+
+        outputs = _get_file_stats(analysisTask.get_output_files())
+        return self.get(fullTaskName, 'outputs') == outputs  # }}}
+
+    def record_success(self, analysisTask, fingerprint):  # {{{
+        '''
+        Record the fingerprint and output files of a task that succeeded
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task that succeeded
+
+        fingerprint : str
+            The fingerprint of the task computed before it ran
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        fullTaskName = analysisTask.fullTaskName
+        self.set(fullTaskName, 'fingerprint', fingerprint)
+        self.set(fullTaskName, 'outputs',
+                 _get_file_stats(analysisTask.get_output_files()))
+        # }}}
+
+    def remove(self, analysisTask):  # {{{
+        '''
+        Forget the state of a task (e.g. because it failed), so it will run
+        next time
+
+        Parameters
+        ----------
+        analysisTask : ``AnalysisTask``
+            The task to remove
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self.records.pop(analysisTask.fullTaskName, None)  # }}}
+
+    # }}}
+
+
+def _get_sorted(analysisTask, attributeName):  # {{{
+    '''
+    Get a sorted copy of a list attribute of a task (``None`` if the task
+    doesn't have it), since tasks set up in parallel threads may add entries
+    in a different order in each run
+    '''
+    values = getattr(analysisTask, attributeName, None)
+    if values is None:
+        return None
+    return sorted(values)  # }}}
+
+
+def _get_file_stats(fileNames):  # {{{
+    '''
+    Get the size and modification time of each file (``None`` for files that
+    don't exist)
+    '''
+    stats = {}
+    for fileName in fileNames:
+        if os.path.exists(fileName):
+            stats[fileName] = [os.path.getsize(fileName),
+                               os.path.getmtime(fileName)]
+        else:
+            stats[fileName] = None
+    return stats  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,126 @@
+'''
+A persistent record of how analysis tasks behaved in previous runs, used by
+the scheduler to estimate how long each task will take.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import json
+import warnings
+
+from ..io.utility import write_json_atomically
+
+
+class TaskHistory(object):  # {{{
+    '''
+    Reads and writes a JSON file with the measured properties (e.g.
+    ``runDuration`` in seconds) of each task from previous runs, keyed by the
+    full task name.
+
+    Attributes
+    ----------
+    fileName : str
+        The JSON file where the history is stored
+
+    records : dict of dict
+        The properties of each task, with full task names as keys
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    def __init__(self, fileName):  # {{{
+        '''
+        Read in the history from a file, if it exists
+
+        Parameters
+        ----------
+        fileName : str
+            The JSON file where the history is stored
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self.fileName = fileName
+        self.records = {}
+
+        if os.path.exists(fileName):
+            try:
+                with open(fileName) as historyFile:
+                    self.records = json.load(historyFile)
+            except ValueError:
+                # assuming the history file is corrupt, so starting over
+                warnings.warn('Ignoring task history file {}, which appears '
+                              'to have been corrupted.'.format(fileName))
+        # }}}
+
+    def get(self, fullTaskName, propertyName, default=None):  # {{{
+        '''
+        Get a property of a task from a previous run
+
+        Parameters
+        ----------
+        fullTaskName : str
+            The full name of the task (including the subtask name, if any)
+
+        propertyName : str
+            The name of the property (e.g. ``runDuration``)
+
+        default : object, optional
+            The value to return if the task or property isn't in the history
+
+        Returns
+        -------
+        value : object
+            The value of the property from the most recent run
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if fullTaskName not in self.records:
+            return default
+        return self.records[fullTaskName].get(propertyName, default)  # }}}
+
+    def set(self, fullTaskName, propertyName, value):  # {{{
+        '''
+        Set a property of a task measured during this run
+
+        Parameters
+        ----------
+        fullTaskName : str
+            The full name of the task (including the subtask name, if any)
+
+        propertyName : str
+            The name of the property (e.g. ``runDuration``)
+
+        value : object
+            The value of the property, which must be JSON serializable
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if fullTaskName not in self.records:
+            self.records[fullTaskName] = {}
+        self.records[fullTaskName][propertyName] = value  # }}}
+
+    def write(self):  # {{{
+        '''
+        Write the history to its file
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        # an interrupted write mustn't corrupt the history
+        write_json_atomically(self.records, self.fileName)  # }}}
+
+    # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
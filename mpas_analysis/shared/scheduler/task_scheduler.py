@@ -0,0 +1,931 @@
+'''
+An event-driven scheduler for running analysis tasks in dependency order,
+either serially or several at a time in separate processes.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+from multiprocessing import Queue
+from Queue import Empty
+from collections import OrderedDict
+import heapq
+import time
+
+from ..analysis_task import AnalysisTask
+from ..io.utility import build_config_full_path
+from ..trace import read_phases
+
+from .task_history import TaskHistory
+from .run_state import RunState
+from .performance_report import write_performance_report
+from .chrome_trace import write_chrome_trace
+from .launcher import ProcessLauncher
+from .critical_path import compute_priorities, get_critical_path, \
+    predict_makespan
+
+
+class TaskScheduler(object):  # {{{
+    '''
+    Runs a collection of analysis tasks, launching each task as soon as all
+    of its prerequisites (``runAfterTasks`` and ``subtasks``) have finished
+    successfully.
+
+    Rather than repeatedly scanning all tasks for their status, the scheduler
+    keeps a count of unfinished prerequisites for each task and a queue of
+    tasks that are ready to run.  In parallel mode, each task process posts
+    to a completion queue when it finishes, so the scheduler wakes up as soon
+    as a task is done and immediately launches any tasks it was blocking.
+
+    Ready tasks are launched in order of priority, the estimated length of
+    the longest chain of tasks starting with each task, so that tasks on the
+    critical path start first.  Durations are estimated from previous runs,
+    stored in ``task_history.json`` in the logs directory.
+
+    In parallel mode, each running task occupies ``cpuCount`` of the
+    ``taskCount`` slots and, if ``maxMemory`` is set, its estimated peak
+    memory counts against that budget.  When the highest priority task
+    doesn't fit, the slots and memory it needs are reserved for it as
+    running tasks finish, and lower priority tasks are only launched in the
+    meantime if they won't delay it: if they are expected to finish before
+    enough memory and slots free up for it, or if they fit alongside it.
+    Peak memory is measured each time a task runs and stored in the history,
+    falling back on the task's ``memoryEstimate`` for tasks without history.
+
+    A record of each task that succeeded is kept in ``run_state.json`` in the
+    output directory.  Tasks whose config options, inputs and outputs are
+    unchanged since they last succeeded are marked as successful without
+    running them, unless ``force`` is ``True``.
+
+    The resources used by each task (see
+    ``shared.resource_usage.resourceUsageNames``) are written to
+    ``performance.json`` and ``performance.csv`` in the logs directory.
+
+    A timeline of the run is written to ``trace.json`` in the logs directory
+    in the Chrome trace event format, with one lane for each slot, a span for
+    each task in the lane(s) it occupied and spans for the phases of the task
+    (``load``, ``compute``, ``remap``, ``plot``, ``write`` and ``write XML``)
+    nested inside it.
+
+    How parallel tasks are started is up to the launcher: by default, each
+    task runs in a forked process, but a ``PoolLauncher`` runs tasks in a
+    pool of long-lived worker processes and a ``CommandLauncher`` runs each
+    task as an external command.
+
+    Attributes
+    ----------
+    config : ``MpasAnalysisConfigParser``
+        Contains configuration options
+
+    tasks : ``OrderedDict`` of ``AnalysisTask``
+        The tasks to run, with (task, subtask) names as keys
+
+    taskCount : int
+        The maximum number of tasks to run at the same time
+
+    maxMemory : float
+        The maximum total estimated peak memory (in GB) of tasks running at
+        the same time, or 0 for no limit
+
+    isParallel : bool
+        Whether tasks are run in separate processes (``True``) or one after
+        the other in this process (``False``)
+
+    tasksWithErrors : list of str
+        The names of tasks that failed while running
+
+    launcher : ``ProcessLauncher``, ``PoolLauncher`` or ``CommandLauncher``
+        Starts tasks running in parallel mode
+
+    history : ``TaskHistory``
+        The durations and peak memory of tasks in previous runs, updated with
+        those from this run
+
+    runState : ``RunState``
+        The state of each task after it last succeeded
+
+    force : bool
+        Whether to run all tasks, even those that are unchanged since they
+        last succeeded
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+
+    # how often (in seconds) to check that running tasks are still alive in
+    # case one exited without reporting that it finished
+    livenessInterval = 1.0
+
+    def __init__(self, config, tasks, launcher=None, force=False):  # {{{
+        '''
+        Construct the scheduler and determine the dependencies between tasks
+
+        Parameters
+        ----------
+        config : ``MpasAnalysisConfigParser``
+            Contains configuration options
+
+        tasks : ``OrderedDict`` of ``AnalysisTask``
+            The tasks to run, with (task, subtask) names as keys
+
+        launcher : ``ProcessLauncher``, ``PoolLauncher`` or
+                   ``CommandLauncher``, optional
+            Starts tasks running in parallel mode, a ``ProcessLauncher`` by
+            default
+
+        force : bool, optional
+            Whether to run all tasks, even those that are unchanged since they
+            last succeeded
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self.config = config
+        self.tasks = tasks
+
+        self.taskCount = config.getWithDefault('execute', 'parallelTaskCount',
+                                               default=1)
+
+        self.maxMemory = config.getWithDefault('execute', 'maxMemory',
+                                               default=0.)
+
+        self.isParallel = self.taskCount > 1 and len(tasks) > 1
+
+        self.tasksWithErrors = []
+
+        if launcher is None:
+            launcher = ProcessLauncher()
+        self.launcher = launcher
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        self._logsDirectory = logsDirectory
+        self.history = TaskHistory('{}/task_history.json'.format(
+            logsDirectory))
+
+        self.force = force
+        outputDirectory = config.get('output', 'baseDirectory')
+        self.runState = RunState(
+            '{}/run_state.json'.format(outputDirectory), config,
+            [analysisTask.taskName for analysisTask in tasks.values()])
+        self._fingerprints = {}
+        self._skippedCount = 0
+        self._performanceRecords = []
+
+        self._readyQueue = []
+        self._runningTasks = OrderedDict()
+        self._completionQueue = None
+        self._startTimes = {}
+        self._usedSlots = 0
+        self._usedMemory = 0.
+
+        # each running task occupies one lane of the trace for each of its
+        # slots
+        if self.isParallel:
+            self._laneCount = self.taskCount
+        else:
+            self._laneCount = 1
+        self._freeLanes = list(range(self._laneCount))
+        self._lanes = {}
+        self._traceSpans = []
+
+        self._estimate_durations()
+        self._estimate_resources()
+        self._build_dependencies()
+        # }}}
+
+    def run(self):  # {{{
+        '''
+        Run all the tasks, returning once every task has either succeeded or
+        failed
+
+        Returns
+        -------
+        tasksWithErrors : list of str
+            The names of tasks that failed while running
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        if self.isParallel:
+            self._completionQueue = Queue()
+
+        startTime = time.time()
+
+        try:
+            while len(self._readyQueue) > 0 or len(self._runningTasks) > 0:
+                self._launch_ready_tasks()
+
+                if len(self._runningTasks) > 0:
+                    key = self._wait_for_task()
+                    self._finish_task(key)
+        finally:
+            if self.isParallel:
+                self.launcher.close()
+
+        for key, analysisTask in self.tasks.items():
+            if analysisTask._runStatus.value not in [AnalysisTask.SUCCESS,
+                                                     AnalysisTask.FAIL]:
+                print "ERROR: task {} was never run.  This may be a " \
+                      "bug.".format(analysisTask.printTaskName)
+                analysisTask._runStatus.value = AnalysisTask.FAIL
+                self.runState.remove(analysisTask)
+                self.tasksWithErrors.append(analysisTask.printTaskName)
+
+        self.history.write()
+        self.runState.write()
+        write_performance_report(self.config, self._performanceRecords)
+        write_chrome_trace('{}/trace.json'.format(self._logsDirectory),
+                           self._traceSpans, startTime, self._laneCount)
+
+        if self._skippedCount > 0:
+            print '\n{} task(s) were unchanged since they last ran ' \
+                  'successfully, so they\n' \
+                  'were skipped.  Use --force to run all ' \
+                  'tasks.'.format(self._skippedCount)
+
+        self._print_makespan_report(time.time() - startTime)
+
+        return self.tasksWithErrors  # }}}
+
+    def _estimate_durations(self):  # {{{
+        '''
+        Estimate the duration of each task from its duration in the most
+        recent previous run.  Tasks that have not run before are assumed to
+        take the mean duration of those that have.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self._durations = OrderedDict()
+        knownDurations = []
+        for key, analysisTask in self.tasks.items():
+            duration = self.history.get(analysisTask.fullTaskName,
+                                        'runDuration')
+            self._durations[key] = duration
+            if duration is not None:
+                knownDurations.append(duration)
+
+        self._knownDurationCount = len(knownDurations)
+        if len(knownDurations) > 0:
+            defaultDuration = sum(knownDurations)/len(knownDurations)
+        else:
+            # we know nothing, so all tasks are equally long
+            defaultDuration = 1.
+
+        for key in self._durations:
+            if self._durations[key] is None:
+                self._durations[key] = defaultDuration
+        # }}}
+
+    def _estimate_resources(self):  # {{{
+        '''
+        Estimate the peak memory and the number of slots each task needs.
+        Peak memory measured in the most recent previous run takes precedence
+        over the task's own ``memoryEstimate``.  Tasks with neither are
+        assumed to need the mean of the known estimates.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        self._memory = OrderedDict()
+        self._slots = OrderedDict()
+        knownMemory = []
+        for key, analysisTask in self.tasks.items():
+            memory = self.history.get(analysisTask.fullTaskName,
+                                      'peakMemory',
+                                      default=analysisTask.memoryEstimate)
+            self._memory[key] = memory
+            if memory is not None:
+                knownMemory.append(memory)
+
+            # a task can't use more slots than there are
+            self._slots[key] = max(1, min(analysisTask.cpuCount,
+                                          self.taskCount))
+
+        if len(knownMemory) > 0:
+            defaultMemory = sum(knownMemory)/len(knownMemory)
+        else:
+            defaultMemory = 0.
+
+        for key in self._memory:
+            if self._memory[key] is None:
+                self._memory[key] = defaultMemory
+        # }}}
+
+    def _build_dependencies(self):  # {{{
+        '''
+        Count the unfinished prerequisites of each task, make a list of the
+        tasks that depend on each task and put tasks without prerequisites
+        in the ready queue.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        self._prereqCounts = {}
+        self._dependents = dict([(key, []) for key in self.tasks])
+        self._order = dict([(key, order) for order, key in
+                            enumerate(self.tasks)])
+
+        for key, analysisTask in self.tasks.items():
+            prereqKeys = set()
+            missingPrereqs = []
+            for prereq in analysisTask.runAfterTasks + analysisTask.subtasks:
+                prereqKey = (prereq.taskName, prereq.subtaskName)
+                if prereqKey in self.tasks:
+                    prereqKeys.add(prereqKey)
+                else:
+                    missingPrereqs.append(prereq.printTaskName)
+
+            if len(missingPrereqs) > 0:
+                # this can't happen if tasks were set up with
+                # add_task_and_subtasks, but better safe than sorry
+                print "ERROR: prerequisite task(s) {} of analysis task {} " \
+                      "will not be run,\n" \
+                      "       so this task will not be run".format(
+                              ', '.join(missingPrereqs),
+                              analysisTask.printTaskName)
+                prereqKeys = None
+
+            self._prereqCounts[key] = prereqKeys
+            if prereqKeys is not None:
+                for prereqKey in prereqKeys:
+                    self._dependents[prereqKey].append(key)
+
+        self._priorities = compute_priorities(self._durations,
+                                              self._dependents)
+
+        failedKeys = []
+        for key, analysisTask in self.tasks.items():
+            prereqKeys = self._prereqCounts[key]
+            if prereqKeys is None:
+                failedKeys.append(key)
+                self._prereqCounts[key] = 0
+            elif len(prereqKeys) == 0:
+                analysisTask._runStatus.value = AnalysisTask.READY
+                self._push_ready(key)
+            else:
+                analysisTask._runStatus.value = AnalysisTask.BLOCKED
+
+            # from here on, we only need the number of unfinished
+            # prerequisites
+            if prereqKeys is not None:
+                self._prereqCounts[key] = len(prereqKeys)
+
+        for key in failedKeys:
+            self.tasks[key]._runStatus.value = AnalysisTask.FAIL
+            self.runState.remove(self.tasks[key])
+            self._fail_dependents(key)
+
+        # keep track of the tasks that will (try to) run and their
+        # prerequisites to predict the makespan later on
+        self._initialPrereqCounts = OrderedDict(
+            [(key, self._prereqCounts[key]) for key in self.tasks
+             if self.tasks[key]._runStatus.value != AnalysisTask.FAIL])
+        # }}}
+
+    def _push_ready(self, key):  # {{{
+        '''
+        Add a task to the ready queue, which is sorted by priority and then
+        by the order of the tasks
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that is ready to run
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        heapq.heappush(self._readyQueue, (-self._priorities[key],
+                                          self._order[key], key))
+        # }}}
+
+    def _pop_ready(self):  # {{{
+        '''
+        Remove the highest priority task from the ready queue
+
+        Returns
+        -------
+        key : tuple of str
+            The (task, subtask) names of a task that is ready to run
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        _, _, key = heapq.heappop(self._readyQueue)
+        return key  # }}}
+
+    def _launch_ready_tasks(self):  # {{{
+        '''
+        Launch tasks from the ready queue.  In parallel mode, tasks are
+        started in new processes until ``taskCount`` tasks are running.  In
+        serial mode, tasks are run one at a time in this process, and their
+        dependents are released as each finishes.
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        if not self.isParallel:
+            while len(self._readyQueue) > 0:
+                key = self._pop_ready()
+                if self._skip_if_unchanged(key):
+                    continue
+                analysisTask = self.tasks[key]
+                analysisTask._runStatus.value = AnalysisTask.RUNNING
+                self._startTimes[key] = time.time()
+                self._lanes[key] = [0]
+                analysisTask.run(writeLogFile=False)
+                self._record_history(key)
+                self._add_trace_span(key)
+                self._release_dependents(key)
+            return
+
+        # look through the ready tasks in order of priority, launching each
+        # that fits in the remaining slots and memory.  The first task that
+        # doesn't fit gets a reservation, so lower priority tasks can't keep
+        # it waiting indefinitely.
+        deferredKeys = []
+        reservation = None
+        while (len(self._readyQueue) > 0 and
+               self._usedSlots < self.taskCount):
+            key = self._pop_ready()
+            if self._skip_if_unchanged(key):
+                continue
+            if not self._fits(key):
+                if reservation is None:
+                    reservation = self._reserve(key)
+                deferredKeys.append(key)
+                continue
+            if reservation is not None and \
+                    not self._fits_reservation(key, reservation):
+                deferredKeys.append(key)
+                continue
+
+            analysisTask = self.tasks[key]
+            if self.maxMemory > 0. and self._memory[key] > self.maxMemory:
+                print 'Warning: task {} is estimated to need {:.2f} GB, ' \
+                      'more than maxMemory = {} GB.\n' \
+                      '         Running it on its own.'.format(
+                          analysisTask.printTaskName, self._memory[key],
+                          self.maxMemory)
+            print 'Running {}'.format(analysisTask.printTaskName)
+            analysisTask._runStatus.value = AnalysisTask.RUNNING
+            self._startTimes[key] = time.time()
+            self._lanes[key] = sorted([heapq.heappop(self._freeLanes) for
+                                       slot in range(self._slots[key])])
+            self.launcher.launch(analysisTask, self._completionQueue)
+            self._runningTasks[key] = analysisTask
+            self._usedSlots += self._slots[key]
+            self._usedMemory += self._memory[key]
+
+        for key in deferredKeys:
+            self._push_ready(key)
+        # }}}
+
+    def _skip_if_unchanged(self, key):  # {{{
+        '''
+        Compute the fingerprint of a task that is ready to run and, if it is
+        unchanged since the task last succeeded, mark the task as successful
+        and release its dependents without running it
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that is ready to run
+
+        Returns
+        -------
+        skipped : bool
+            Whether the task was skipped
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask = self.tasks[key]
+        fingerprint = self.runState.compute_fingerprint(analysisTask)
+        self._fingerprints[key] = fingerprint
+
+        if self.force or \
+                not self.runState.is_unchanged(analysisTask, fingerprint):
+            return False
+
+        print 'Skipping {} (unchanged)'.format(analysisTask.printTaskName)
+        analysisTask._runStatus.value = AnalysisTask.SUCCESS
+        self._skippedCount += 1
+        self._add_performance_record(key, 'skipped')
+        self._release_dependents(key)
+        return True  # }}}
+
+    def _fits(self, key):  # {{{
+        '''
+        Whether a task fits in the slots and memory not used by running tasks.
+        A task always fits if nothing else is running, so tasks larger than
+        the budget still run (on their own).
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that is ready to run
+
+        Returns
+        -------
+        fits : bool
+            Whether the task can be launched now
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if len(self._runningTasks) == 0:
+            return True
+
+        if self._usedSlots + self._slots[key] > self.taskCount:
+            return False
+
+        if self.maxMemory > 0. and \
+                self._usedMemory + self._memory[key] > self.maxMemory:
+            return False
+
+        return True  # }}}
+
+    def _reserve(self, key):  # {{{
+        '''
+        Reserve slots and memory for a task that doesn't fit now, based on
+        when running tasks are expected to finish
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of the highest priority task that
+            doesn't fit
+
+        Returns
+        -------
+        reservation : dict
+            ``startTime``, the time at which enough running tasks are
+            expected to have finished for the task to fit, and ``slots`` and
+            ``memory``, what will be left over once it is launched, which
+            lower priority tasks may use without delaying it
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        now = time.time()
+        if self.maxMemory > 0.:
+            maxMemory = self.maxMemory
+        else:
+            maxMemory = float('inf')
+
+        freeSlots = self.taskCount - self._usedSlots
+        freeMemory = maxMemory - self._usedMemory
+        startTime = now
+        endTimes = sorted([(self._startTimes[runningKey] +
+                            self._durations[runningKey], runningKey)
+                           for runningKey in self._runningTasks])
+        for endTime, runningKey in endTimes:
+            if freeSlots >= self._slots[key] and \
+                    freeMemory >= self._memory[key]:
+                break
+            freeSlots += self._slots[runningKey]
+            freeMemory += self._memory[runningKey]
+            startTime = max(startTime, endTime)
+
+        return {'startTime': startTime,
+                'slots': freeSlots - self._slots[key],
+                'memory': freeMemory - self._memory[key]}  # }}}
+
+    def _fits_reservation(self, key, reservation):  # {{{
+        '''
+        Whether a task that fits now can be launched without delaying the
+        task with the reservation, updating the reservation if the task will
+        still be running when the reserved task starts
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a lower priority task that is ready
+            to run and fits in the slots and memory not used by running tasks
+
+        reservation : dict
+            The reservation returned by ``_reserve``
+
+        Returns
+        -------
+        fits : bool
+            Whether the task can be launched now
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if time.time() + self._durations[key] <= reservation['startTime']:
+            # expected to finish before the reserved task starts
+            return True
+
+        if self._slots[key] <= reservation['slots'] and \
+                self._memory[key] <= reservation['memory']:
+            # fits alongside the reserved task
+            reservation['slots'] -= self._slots[key]
+            reservation['memory'] -= self._memory[key]
+            return True
+
+        return False  # }}}
+
+    def _wait_for_task(self):  # {{{
+        '''
+        Block until a running task finishes
+
+        Returns
+        -------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        while True:
+            try:
+                # a timeout is needed so we can still kill the whole thing
+                # with a keyboard interrupt and notice tasks that died
+                # without posting to the queue
+                key = self._completionQueue.get(
+                    timeout=self.livenessInterval)
+            except Empty:
+                key = None
+
+            if key in self._runningTasks:
+                return key
+
+            for key, analysisTask in self._runningTasks.items():
+                if not self.launcher.is_alive(analysisTask):
+                    return key  # }}}
+
+    def _finish_task(self, key):  # {{{
+        '''
+        Clean up after a task running in parallel has finished and either
+        release or fail the tasks that depend on it
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        analysisTask = self._runningTasks.pop(key)
+        exitCode = self.launcher.join(analysisTask)
+        self._usedSlots -= self._slots[key]
+        self._usedMemory -= self._memory[key]
+        self._record_history(key)
+        self._add_trace_span(key)
+        for lane in self._lanes[key]:
+            heapq.heappush(self._freeLanes, lane)
+
+        taskTitle = analysisTask.printTaskName
+
+        if analysisTask._runStatus.value == AnalysisTask.SUCCESS:
+            print "   Task {} has finished successfully.".format(taskTitle)
+        elif analysisTask._runStatus.value == AnalysisTask.FAIL:
+            print "ERROR in task {}.  See log file {} for details".format(
+                taskTitle, analysisTask._logFileName)
+        else:
+            print "ERROR: task {} exited unexpectedly with exit code {}.  " \
+                  "See log file {} for details".format(
+                      taskTitle, exitCode,
+                      analysisTask._logFileName)
+            analysisTask._runStatus.value = AnalysisTask.FAIL
+
+        self._release_dependents(key)
+        # }}}
+
+    def _release_dependents(self, key):  # {{{
+        '''
+        After a task has finished, decrement the count of unfinished
+        prerequisites of its dependents, adding those with no remaining
+        prerequisites to the ready queue.  If the task failed, its dependents
+        fail as well.
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        analysisTask = self.tasks[key]
+
+        if analysisTask._runStatus.value != AnalysisTask.SUCCESS:
+            self.tasksWithErrors.append(analysisTask.printTaskName)
+            self._fail_dependents(key)
+            return
+
+        for dependentKey in self._dependents[key]:
+            dependent = self.tasks[dependentKey]
+            if dependent._runStatus.value != AnalysisTask.BLOCKED:
+                continue
+            self._prereqCounts[dependentKey] -= 1
+            if self._prereqCounts[dependentKey] == 0:
+                dependent._runStatus.value = AnalysisTask.READY
+                self._push_ready(dependentKey)
+        # }}}
+
+    def _record_history(self, key):  # {{{
+        '''
+        Store the duration and peak memory of a task that finished
+        successfully in the history for use in future runs, and update the
+        run state of the task
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask = self.tasks[key]
+        if analysisTask._runStatus.value != AnalysisTask.SUCCESS:
+            self.runState.remove(analysisTask)
+            self._add_performance_record(key, 'fail')
+        else:
+            self.runState.record_success(analysisTask,
+                                         self._fingerprints[key])
+            duration = time.time() - self._startTimes[key]
+            self.history.set(analysisTask.fullTaskName, 'runDuration',
+                             duration)
+            peakMemory = analysisTask._get_resource_usage()['peakMemory']
+            # peak memory isn't measured for tasks run as external commands
+            if peakMemory is not None:
+                self.history.set(analysisTask.fullTaskName, 'peakMemory',
+                                 peakMemory)
+            self._add_performance_record(key, 'success')
+        # }}}
+
+    def _add_performance_record(self, key, status):  # {{{
+        '''
+        Add the resources used by a task to the performance report
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        status : {'success', 'fail', 'skipped'}
+            What became of the task
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask = self.tasks[key]
+        record = OrderedDict([('taskName', analysisTask.fullTaskName),
+                              ('status', status)])
+        record.update(analysisTask._get_resource_usage())
+        self._performanceRecords.append(record)  # }}}
+
+    def _add_trace_span(self, key):  # {{{
+        '''
+        Add a task that has finished, along with the phases it recorded, to
+        the trace
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has finished
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        analysisTask = self.tasks[key]
+        if analysisTask._runStatus.value == AnalysisTask.SUCCESS:
+            status = 'success'
+        else:
+            status = 'fail'
+        # ignore phases left over from a previous run if the task died
+        # before writing its own
+        phases = [phase for phase in
+                  read_phases(self._logsDirectory, analysisTask.fullTaskName)
+                  if phase[1] >= self._startTimes[key]]
+        # a task that uses several slots is shown in the first of its lanes
+        self._traceSpans.append({'taskName': analysisTask.fullTaskName,
+                                 'lane': self._lanes[key][0],
+                                 'status': status,
+                                 'startTime': self._startTimes[key],
+                                 'endTime': time.time(),
+                                 'phases': phases})  # }}}
+
+    def _print_makespan_report(self, achievedMakespan):  # {{{
+        '''
+        Print the critical path and the predicted and achieved time to run
+        all tasks
+
+        Parameters
+        ----------
+        achievedMakespan : float
+            The time in seconds it actually took to run all tasks
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        if not self.isParallel:
+            taskCount = 1
+        else:
+            taskCount = self.taskCount
+
+        keys = self._initialPrereqCounts.keys()
+        durations = OrderedDict([(key, self._durations[key])
+                                 for key in keys])
+        dependents = dict([(key, [dependentKey for dependentKey in
+                                  self._dependents[key]
+                                  if dependentKey in durations])
+                           for key in keys])
+
+        priorities = compute_priorities(durations, dependents)
+        criticalPath = get_critical_path(priorities, durations, dependents)
+        predictedMakespan = predict_makespan(
+            durations, dependents, self._initialPrereqCounts, priorities,
+            taskCount)
+
+        print '\nCritical path:'
+        for key in criticalPath:
+            print '    {} ({})'.format(self.tasks[key].printTaskName,
+                                       _format_duration(durations[key]))
+        if self._knownDurationCount == 0:
+            print 'Predicted makespan: unknown (no task history yet)'
+        else:
+            if self._knownDurationCount < len(self.tasks):
+                note = ' ({} of {} tasks have no history)'.format(
+                    len(self.tasks) - self._knownDurationCount,
+                    len(self.tasks))
+            else:
+                note = ''
+            print 'Predicted makespan: {}{}'.format(
+                _format_duration(predictedMakespan), note)
+        print 'Achieved makespan:  {}'.format(
+            _format_duration(achievedMakespan))
+        # }}}
+
+    def _fail_dependents(self, key):  # {{{
+        '''
+        Mark all tasks that depend (directly or indirectly) on a failed task
+        as failed, since they cannot succeed, and make sure they run next time
+
+        Parameters
+        ----------
+        key : tuple of str
+            The (task, subtask) names of a task that has failed
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        stack = list(self._dependents[key])
+        while len(stack) > 0:
+            dependentKey = stack.pop()
+            dependent = self.tasks[dependentKey]
+            if dependent._runStatus.value == AnalysisTask.FAIL:
+                continue
+            dependent._runStatus.value = AnalysisTask.FAIL
+            self.runState.remove(dependent)
+            stack.extend(self._dependents[dependentKey])
+        # }}}
+
+    # }}}
+
+
+def _format_duration(duration):  # {{{
+    '''
+    Format a duration in seconds as h:mm:ss.ss
+    '''
+    m, s = divmod(duration, 60)
+    h, m = divmod(int(m), 60)
+    return '{}:{:02d}:{:05.2f}'.format(h, m, s)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,233 @@
+'''
+A function for running external tools (e.g. ``ncclimo``, ``ncremap``,
+``ncrcat`` and ``ESMF_RegridWeightGen``) that streams their output into a
+logger as it is produced, measures the time and peak memory of each
+invocation and stops the tool (and any processes it started) if the calling
+process is interrupted.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import sys
+import time
+import errno
+import signal
+import logging
+import subprocess
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .trace import trace_phase
+from .resource_usage import record_child_peak_memory, record_tool_time
+
+# the result of running a command: its return code, wall-clock time in
+# seconds and the peak resident memory (in GB) of the command and the
+# processes it waited on, or None if that can't be measured
+CommandResult = namedtuple('CommandResult',
+                           ['returncode', 'wallTime', 'peakMemory'])
+
+# the time (in seconds) a command has to exit after it is asked to terminate
+# before it is killed
+_terminateTimeout = 5.
+
+
+def run_command(args, logger=None, env=None, printCommand=None,
+                logStdout=True):  # {{{
+    '''
+    Run an external command, logging each line of its output as it is
+    written, and raise an exception if it fails.
+
+    The command runs in its own process group, so that if this process is
+    interrupted (e.g. with ``Ctrl-C`` or by a ``SIGTERM`` from a batch
+    system), the command and all the processes it started are stopped
+    before the exception is passed on.
+
+    Parameters
+    ----------
+    args : list of str
+        The command and its arguments
+
+    logger : ``logging.Logger``, optional
+        The logger to which standard output (at level ``INFO``) and standard
+        error (at level ``ERROR``) are written.  By default, they are written
+        to ``sys.stdout`` and ``sys.stderr``.
+
+    env : dict, optional
+        The environment of the command, by default that of this process
+
+    printCommand : str, optional
+        The command as it should be logged, e.g. abbreviated if it has a
+        long list of input files
+
+    logStdout : bool, optional
+        Whether to log standard output, which can be discarded for tools
+        that are very verbose
+
+    Returns
+    -------
+    result : ``CommandResult``
+        The return code, time and peak memory of the command
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If the command returns a nonzero exit code
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    if printCommand is None:
+        printCommand = ' '.join(args)
+    _write_line(logger, logging.INFO, 'running: {}'.format(printCommand))
+
+    commandName = os.path.basename(args[0])
+    with trace_phase(commandName):
+        startTime = time.time()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env,
+                                   close_fds=True, preexec_fn=os.setsid)
+
+        stdoutLevel = logging.INFO
+        if not logStdout:
+            stdoutLevel = None
+        readers = [_start_reader(process.stdout, logger, stdoutLevel),
+                   _start_reader(process.stderr, logger, logging.ERROR)]
+
+        try:
+            with _sigterm_as_exit():
+                returncode, peakMemory = _wait(process)
+        except BaseException:
+            _write_line(logger, logging.ERROR,
+                        'interrupted, stopping {}'.format(commandName))
+            _stop(process)
+            raise
+        finally:
+            for reader in readers:
+                reader.join(_terminateTimeout)
+
+        wallTime = time.time() - startTime
+
+    record_child_peak_memory(peakMemory)
+    record_tool_time(commandName, wallTime)
+
+    message = '{} finished in {:.1f} s'.format(commandName, wallTime)
+    if peakMemory is not None:
+        message = '{} with peak memory {:.3f} GB'.format(message, peakMemory)
+    _write_line(logger, logging.INFO, message)
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, ' '.join(args))
+
+    return CommandResult(returncode, wallTime, peakMemory)  # }}}
+
+
+def _write_line(logger, level, line):  # {{{
+    '''
+    Write a line to the logger or, if there is no logger, to stdout (or
+    stderr for errors)
+    '''
+    if logger is not None:
+        logger.log(level, line)
+    else:
+        if level >= logging.ERROR:
+            stream = sys.stderr
+        else:
+            stream = sys.stdout
+        stream.write('{}\n'.format(line))
+        stream.flush()  # }}}
+
+
+def _start_reader(pipe, logger, level):  # {{{
+    '''
+    Start a thread that writes each line from the pipe at the given level
+    (or discards it if ``level`` is ``None``) until the pipe is closed
+    '''
+    def read_lines():
+        for line in iter(pipe.readline, b''):
+            if level is not None:
+                _write_line(logger, level, line.rstrip('\n'))
+        pipe.close()
+
+    reader = threading.Thread(target=read_lines)
+    reader.daemon = True
+    reader.start()
+    return reader  # }}}
+
+
+def _wait(process):  # {{{
+    '''
+    Wait for the process to finish, returning its return code and the peak
+    resident memory (in GB) of it and the processes it waited on
+    '''
+    while True:
+        try:
+            pid, status, usage = os.wait4(process.pid, 0)
+            break
+        except OSError as e:
+            # interrupted by a signal that didn't raise an exception
+            if e.errno != errno.EINTR:
+                raise
+
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    # the process has been reaped, so Popen must not wait for it again
+    process.returncode = returncode
+
+    if usage.ru_maxrss == 0:
+        peakMemory = None
+    elif sys.platform == 'darwin':
+        # in bytes on Mac OS X
+        peakMemory = usage.ru_maxrss/1024.**3
+    else:
+        # in kB on Linux
+        peakMemory = usage.ru_maxrss/1024.**2
+
+    return returncode, peakMemory  # }}}
+
+
+def _stop(process):  # {{{
+    '''
+    Terminate the process group of the command, killing it if it doesn't
+    exit in time
+    '''
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            # the process group is already gone
+            return
+        endTime = time.time() + _terminateTimeout
+        while time.time() < endTime:
+            if process.poll() is not None:
+                return
+            time.sleep(0.1)  # }}}
+
+
+@contextmanager
+def _sigterm_as_exit():  # {{{
+    '''
+    Turn ``SIGTERM`` into a ``SystemExit`` exception, so the command can be
+    stopped before this process exits.  Signal handlers can only be set in
+    the main thread, so this has no effect in other threads.
+    '''
+    def handler(signum, frame):
+        raise SystemExit('terminated by signal {}'.format(signum))
+
+    if not isinstance(threading.current_thread(), threading._MainThread):
+        yield
+        return
+
+    previousHandler = signal.signal(signal.SIGTERM, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previousHandler)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
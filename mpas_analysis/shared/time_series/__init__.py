@@ -1,2 +1,4 @@
 from .time_series import cache_time_series
+from .extract_time_series import extract_time_series, \
+    backfill_time_series, reduce_time_series, get_incomplete_variables
 from mpas_time_series_task import MpasTimeSeriesTask
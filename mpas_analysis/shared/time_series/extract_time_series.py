@@ -0,0 +1,617 @@
+"""
+A built-in alternative to ``ncrcat`` for extracting time series of variables
+from MPAS monthly output files, reading the files with a pool of processes,
+for backfilling variables into the records of an existing time series and
+for reducing variables to regional sums or means as they are read
+
+Authors
+-------
+Xylar Asay-Davis
+"""
+
+import os
+import itertools
+import multiprocessing
+from contextlib import contextmanager
+import numpy
+import netCDF4
+
+# the name of the record (unlimited) dimension of MPAS output
+_timeDimension = 'Time'
+
+# the variable used to match records in the input files with those in an
+# existing time series
+_timeVariable = 'xtime_startMonthly'
+
+# the time variables included in a time series of regional reductions
+_timeVariables = ['xtime_startMonthly', 'xtime_endMonthly']
+
+# the supported regional reductions
+_reductionOperations = ['sum', 'mean']
+
+# the global attribute listing the variables that are being backfilled into
+# a time series, which are incomplete if the backfill was interrupted
+_incompleteAttribute = 'incompleteVariables'
+
+# the weights (the region masks times the cell areas) used in regional
+# reductions, cached in each process with the mask and mesh file names and
+# their modification times as keys
+_regionWeights = {}
+
+# the target size (in bytes) of a chunk of a variable in the output file
+_chunkBytes = 4*1024**2
+
+# the maximum number of records in a chunk of a variable in the output file
+_maxTimeChunk = 12
+
+# the number of files each process reads before the records are written out,
+# which bounds the memory used for records waiting to be written
+_filesPerProcess = 4
+
+
+def extract_time_series(inputFiles, variableList, outFileName,
+                        processCount=1, logger=None):  # {{{
+    '''
+    Extract the given variables from MPAS output files, appending them in the
+    order of the input files to the time series in ``outFileName``.
+
+    The output file is created (as a chunked NetCDF4 file with an unlimited
+    ``Time`` dimension) if it doesn't already exist.  Variables that are
+    missing from an existing output file are added to it, but are only
+    filled for the appended records.  Records are appended after the last
+    one with a valid ``xtime_startMonthly``, overwriting any records left
+    incomplete by an earlier extraction that was interrupted.
+
+    Parameters
+    ----------
+    inputFiles : list of str
+        The MPAS output files, sorted in time
+
+    variableList : list of str
+        The variables to extract
+
+    outFileName : str
+        The file to which the time series is appended
+
+    processCount : int, optional
+        The number of processes used to read the input files
+
+    logger : ``logging.Logger``, optional
+        A logger to which to write progress
+
+    Returns
+    -------
+    recordCount : int
+        The number of records (entries in ``Time``) that were appended
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    if len(inputFiles) == 0:
+        return 0
+
+    # start the processes before the output file is opened so they don't
+    # inherit its open file handle
+    with _open_pool(processCount) as mapper:
+        if os.path.exists(outFileName):
+            outFile = netCDF4.Dataset(outFileName, 'a')
+        else:
+            outFile = netCDF4.Dataset(outFileName, 'w', format='NETCDF4')
+            with netCDF4.Dataset(inputFiles[0], 'r') as inFile:
+                outFile.setncatts(dict([(name, inFile.getncattr(name)) for
+                                        name in inFile.ncattrs()]))
+
+        with outFile:
+            _add_variables(outFile, inputFiles[0], variableList)
+
+            recordIndex = _get_complete_record_count(outFile)
+            firstRecordIndex = recordIndex
+            for batchFiles, records in _read_batches(
+                    mapper, inputFiles, variableList, processCount):
+                recordIndex += _write_records(outFile, records, variableList,
+                                              recordIndex)
+                _log_batch(logger, batchFiles)
+
+    return recordIndex - firstRecordIndex  # }}}
+
+
+def reduce_time_series(inputFiles, variables, outFileName, maskFileName,
+                       meshFileName, operation='sum', processCount=1,
+                       logger=None):  # {{{
+    '''
+    Compute area-weighted sums or means of variables over regions as they are
+    read from MPAS output files, appending the reduced time series (with
+    dimensions ``Time`` and ``nRegions``) in the order of the input files to
+    ``outFileName``.  The full fields are never stored.
+
+    Parameters
+    ----------
+    inputFiles : list of str
+        The MPAS output files, sorted in time
+
+    variables : dict
+        The names of the variables (with dimensions ``Time`` and ``nCells``)
+        in the MPAS output files, with the names of the reduced variables as
+        keys
+
+    outFileName : str
+        The file to which the reduced time series is appended
+
+    maskFileName : str
+        A file containing ``regionCellMasks`` with dimensions ``nCells`` and
+        ``nRegions``, e.g. as produced by the MPAS mask creator
+
+    meshFileName : str
+        A file containing ``areaCell``, e.g. an MPAS restart file.  The names
+        of the mask and mesh files and the operation are stored as the
+        ``regionMaskFile``, ``meshFile`` and ``reduction`` attributes of a
+        new output file.
+
+    operation : {'sum', 'mean'}, optional
+        Whether to compute the area-weighted sum or mean over each region.
+        Invalid values are ignored in both cases.
+
+    processCount : int, optional
+        The number of processes used to read the input files
+
+    logger : ``logging.Logger``, optional
+        A logger to which to write progress
+
+    Returns
+    -------
+    recordCount : int
+        The number of records (entries in ``Time``) that were appended
+
+    Raises
+    ------
+    ValueError
+        If ``operation`` is not supported
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    if operation not in _reductionOperations:
+        raise ValueError('Unsupported reduction {}, should be one of '
+                         '{}'.format(operation, _reductionOperations))
+
+    if len(inputFiles) == 0:
+        return 0
+
+    reducedNames = sorted(variables.keys())
+    variableList = _timeVariables + reducedNames
+
+    with _open_pool(processCount) as mapper:
+        if os.path.exists(outFileName):
+            outFile = netCDF4.Dataset(outFileName, 'a')
+        else:
+            outFile = netCDF4.Dataset(outFileName, 'w', format='NETCDF4')
+            outFile.setncatts({'regionMaskFile': maskFileName,
+                               'meshFile': meshFileName,
+                               'reduction': operation})
+
+        with outFile:
+            _add_variables(outFile, inputFiles[0], _timeVariables)
+            _add_reduced_variables(outFile, inputFiles[0], variables,
+                                   maskFileName, operation)
+
+            recordIndex = _get_complete_record_count(outFile)
+            firstRecordIndex = recordIndex
+            readerArgs = ([(name, variables[name]) for name in reducedNames],
+                          maskFileName, meshFileName, operation)
+            for batchFiles, records in _read_batches(
+                    mapper, inputFiles, readerArgs, processCount,
+                    reader=_read_reduced):
+                recordIndex += _write_records(outFile, records, variableList,
+                                              recordIndex)
+                _log_batch(logger, batchFiles)
+
+    return recordIndex - firstRecordIndex  # }}}
+
+
+def backfill_time_series(inputFiles, variableList, outFileName,
+                         processCount=1, logger=None):  # {{{
+    '''
+    Add variables to the records already in the time series in
+    ``outFileName``, reading them from the input files with the same
+    ``xtime_startMonthly``.  Input files with times that are not in the time
+    series are skipped.  Until all records have been filled, the variables
+    are listed in the ``incompleteVariables`` attribute of the time series
+    (see ``get_incomplete_variables``), so a backfill that was interrupted
+    can be done again.
+
+    Parameters
+    ----------
+    inputFiles : list of str
+        The MPAS output files covering the records in the time series
+
+    variableList : list of str
+        The variables to add to the time series
+
+    outFileName : str
+        The existing time series file
+
+    processCount : int, optional
+        The number of processes used to read the input files
+
+    logger : ``logging.Logger``, optional
+        A logger to which to write progress
+
+    Raises
+    ------
+    IOError
+        If some records of the time series can't be found in the input files,
+        in which case the time series is left unchanged
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    with _open_pool(processCount) as mapper:
+        with netCDF4.Dataset(outFileName, 'r') as outFile:
+            recordIndices = _get_record_indices(outFile)
+
+        if len(recordIndices) == 0:
+            # nothing to backfill
+            return
+
+        # find the records in each input file before making any changes, so
+        # the time series isn't left with variables that are only partly
+        # filled
+        inputTimes = list(mapper(
+            _read_variables,
+            [(fileName, [_timeVariable]) for fileName in inputFiles]))
+        inputTimes = [_get_times(record[_timeVariable]) for record in
+                      inputTimes]
+        found = set([time for times in inputTimes for time in times])
+        missingTimes = sorted(set(recordIndices.keys()) - found)
+        if len(missingTimes) > 0:
+            raise IOError('Cannot add {} to {}: no input files were found '
+                          'for {} of its {} records, starting at {}.  '
+                          'Delete the file to extract it again.'.format(
+                              ', '.join(variableList), outFileName,
+                              len(missingTimes), len(recordIndices),
+                              missingTimes[0]))
+
+        # only read the files that have records in the time series
+        inputFiles = [fileName for fileName, times in
+                      zip(inputFiles, inputTimes) if
+                      any([time in recordIndices for time in times])]
+
+        with netCDF4.Dataset(outFileName, 'a') as outFile:
+            incompleteVariables = _get_incomplete_variables(outFile)
+            outFile.setncattr(_incompleteAttribute, ','.join(sorted(
+                set(incompleteVariables + variableList))))
+            _add_variables(outFile, inputFiles[0], variableList)
+            for batchFiles, records in _read_batches(
+                    mapper, inputFiles, [_timeVariable] + variableList,
+                    processCount):
+                for record in records:
+                    times = _get_times(record[_timeVariable])
+                    for index, time in enumerate(times):
+                        if time not in recordIndices:
+                            continue
+                        for variableName in variableList:
+                            outVariable = outFile.variables[variableName]
+                            _set_raw(outVariable)
+                            outVariable[recordIndices[time]] = \
+                                record[variableName][index]
+
+                _log_batch(logger, batchFiles)
+
+            # all records have been filled
+            incompleteVariables = [
+                variableName for variableName in incompleteVariables
+                if variableName not in variableList]
+            if len(incompleteVariables) > 0:
+                outFile.setncattr(_incompleteAttribute,
+                                  ','.join(incompleteVariables))
+            else:
+                outFile.delncattr(_incompleteAttribute)
+
+    # }}}
+
+
+def get_incomplete_variables(outFileName):  # {{{
+    '''
+    Get the variables in a time series that haven't been completely filled
+    because ``backfill_time_series`` was interrupted
+
+    Parameters
+    ----------
+    outFileName : str
+        An existing time series file
+
+    Returns
+    -------
+    incompleteVariables : list of str
+        The variables that need to be backfilled again
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    with netCDF4.Dataset(outFileName, 'r') as outFile:
+        return _get_incomplete_variables(outFile)  # }}}
+
+
+@contextmanager
+def _open_pool(processCount):  # {{{
+    '''
+    Yield a function that maps a function over a list of arguments, in a
+    pool of processes if ``processCount`` is more than 1
+    '''
+    if processCount <= 1:
+        yield itertools.imap
+        return
+
+    pool = multiprocessing.Pool(processCount)
+    try:
+        yield pool.imap
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()  # }}}
+
+
+def _read_batches(mapper, inputFiles, readerArgs, processCount,
+                  reader=None):  # {{{
+    '''
+    Read the input files in batches with ``reader`` (by default, reading the
+    list of variables in ``readerArgs``), yielding the files in each batch
+    and the records read from them
+    '''
+    if reader is None:
+        reader = _read_variables
+    batchSize = _filesPerProcess*processCount
+    for batchStart in range(0, len(inputFiles), batchSize):
+        batchFiles = inputFiles[batchStart:batchStart+batchSize]
+        records = list(mapper(
+            reader, [(fileName, readerArgs) for fileName in batchFiles]))
+        yield batchFiles, records  # }}}
+
+
+def _write_records(outFile, records, variableList, recordIndex):  # {{{
+    '''
+    Write the records read from a batch of files to the output file, starting
+    at ``recordIndex``, returning the number of records written.  The time
+    used to match records is written last, so the records are only complete
+    once it has been written.
+    '''
+    if _timeVariable in variableList:
+        variableList = [variableName for variableName in variableList if
+                        variableName != _timeVariable] + [_timeVariable]
+    recordCount = 0
+    for variableName in variableList:
+        values = numpy.concatenate(
+            [record[variableName] for record in records], axis=0)
+        recordCount = values.shape[0]
+        outVariable = outFile.variables[variableName]
+        _set_raw(outVariable)
+        outVariable[recordIndex:recordIndex+recordCount] = values
+    return recordCount  # }}}
+
+
+def _get_incomplete_variables(outFile):  # {{{
+    '''
+    Get the variables listed as incomplete in an open time series file
+    '''
+    if _incompleteAttribute not in outFile.ncattrs():
+        return []
+    return [variableName for variableName in
+            outFile.getncattr(_incompleteAttribute).split(',')
+            if variableName != '']  # }}}
+
+
+def _log_batch(logger, batchFiles):  # {{{
+    '''
+    Log the range of files that have been written
+    '''
+    if logger is not None:
+        logger.info('    {} through {}'.format(
+            os.path.basename(batchFiles[0]),
+            os.path.basename(batchFiles[-1])))  # }}}
+
+
+def _get_complete_record_count(outFile):  # {{{
+    '''
+    Get the number of records up to the last one with a valid time, since
+    any records after it were left incomplete by an interrupted extraction
+    (all records if the output file has no ``xtime_startMonthly``)
+    '''
+    recordCount = len(outFile.dimensions[_timeDimension])
+    if recordCount == 0 or _timeVariable not in outFile.variables:
+        return recordCount
+    outVariable = outFile.variables[_timeVariable]
+    _set_raw(outVariable)
+    times = _get_times(outVariable[:])
+    while recordCount > 0 and times[recordCount-1] == '':
+        recordCount -= 1
+    return recordCount  # }}}
+
+
+def _get_record_indices(outFile):  # {{{
+    '''
+    Get a dictionary of the index of each complete record in the time
+    series, with the values of ``xtime_startMonthly`` as keys
+    '''
+    outVariable = outFile.variables[_timeVariable]
+    _set_raw(outVariable)
+    times = _get_times(outVariable[:])
+    return dict([(time, index) for index, time in enumerate(times)
+                 if time != ''])  # }}}
+
+
+def _get_times(chars):  # {{{
+    '''
+    Convert a character array of times to a list of strings
+    '''
+    return [str(time).strip() for time in netCDF4.chartostring(chars)]  # }}}
+
+
+def _add_variables(outFile, inFileName, variableList):  # {{{
+    '''
+    Add the dimensions, variables and attributes from the input file that
+    are not yet in the output file
+    '''
+    missingVariables = [variableName for variableName in variableList if
+                        variableName not in outFile.variables]
+    if len(missingVariables) == 0:
+        return
+
+    chunked = outFile.data_model == 'NETCDF4'
+    with netCDF4.Dataset(inFileName, 'r') as inFile:
+        for variableName in missingVariables:
+            if variableName not in inFile.variables:
+                raise ValueError('Variable {} not found in {}'.format(
+                    variableName, inFileName))
+            inVariable = inFile.variables[variableName]
+            if inVariable.dimensions[0:1] != (_timeDimension,):
+                raise ValueError('Variable {} in {} does not have {} as its '
+                                 'first dimension'.format(
+                                     variableName, inFileName,
+                                     _timeDimension))
+
+            for dim in inVariable.dimensions:
+                if dim in outFile.dimensions:
+                    continue
+                if dim == _timeDimension:
+                    outFile.createDimension(dim, None)
+                else:
+                    outFile.createDimension(dim,
+                                            len(inFile.dimensions[dim]))
+
+            attributes = dict([(name, inVariable.getncattr(name)) for name in
+                               inVariable.ncattrs()])
+            fillValue = attributes.pop('_FillValue', None)
+
+            if chunked:
+                recordShape = inVariable.shape[1:]
+                recordBytes = inVariable.dtype.itemsize * \
+                    int(numpy.prod(recordShape))
+                timeChunk = max(1, min(_maxTimeChunk,
+                                       _chunkBytes // max(recordBytes, 1)))
+                chunksizes = (timeChunk,) + recordShape
+            else:
+                chunksizes = None
+
+            outVariable = outFile.createVariable(
+                variableName, inVariable.dtype, inVariable.dimensions,
+                fill_value=fillValue, chunksizes=chunksizes)
+            outVariable.setncatts(attributes)  # }}}
+
+
+def _add_reduced_variables(outFile, inFileName, variables, maskFileName,
+                           operation):  # {{{
+    '''
+    Add the regional reductions of variables that are not yet in the output
+    file
+    '''
+    if 'nRegions' not in outFile.dimensions:
+        with netCDF4.Dataset(maskFileName, 'r') as maskFile:
+            outFile.createDimension('nRegions',
+                                    len(maskFile.dimensions['nRegions']))
+    regionCount = len(outFile.dimensions['nRegions'])
+
+    with netCDF4.Dataset(inFileName, 'r') as inFile:
+        for reducedName in sorted(variables.keys()):
+            if reducedName in outFile.variables:
+                continue
+            variableName = variables[reducedName]
+            if variableName not in inFile.variables:
+                raise ValueError('Variable {} not found in {}'.format(
+                    variableName, inFileName))
+            inVariable = inFile.variables[variableName]
+            if inVariable.dimensions != (_timeDimension, 'nCells'):
+                raise ValueError('Variable {} in {} does not have '
+                                 'dimensions ({}, nCells) needed for a '
+                                 'regional reduction'.format(
+                                     variableName, inFileName,
+                                     _timeDimension))
+
+            outVariable = outFile.createVariable(
+                reducedName, 'f8', (_timeDimension, 'nRegions'),
+                fill_value=numpy.nan,
+                chunksizes=(_maxTimeChunk, regionCount))
+            outVariable.description = \
+                'area-weighted {} of {} over each region'.format(
+                    operation, variableName)
+            if 'units' in inVariable.ncattrs():
+                units = inVariable.getncattr('units')
+                if operation == 'sum':
+                    units = '{} m^2'.format(units)
+                outVariable.units = units  # }}}
+
+
+def _read_reduced(args):  # {{{
+    '''
+    Read the time variables and the regional reductions of variables from an
+    input file, with the arguments passed as a tuple so this can be called
+    from a process pool
+    '''
+    fileName, (variables, maskFileName, meshFileName, operation) = args
+    weights = _get_region_weights(maskFileName, meshFileName)
+    record = _read_variables((fileName, _timeVariables))
+    with netCDF4.Dataset(fileName, 'r') as inFile:
+        for reducedName, variableName in variables:
+            values = inFile.variables[variableName][:]
+            values = numpy.ma.filled(numpy.ma.asarray(values, float),
+                                     numpy.nan)
+            valid = numpy.isfinite(values)
+            reduced = numpy.dot(numpy.where(valid, values, 0.), weights)
+            if operation == 'mean':
+                weightSums = numpy.dot(valid, weights)
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    reduced = numpy.where(weightSums > 0.,
+                                          reduced/weightSums, numpy.nan)
+            record[reducedName] = reduced
+    return record  # }}}
+
+
+def _get_region_weights(maskFileName, meshFileName):  # {{{
+    '''
+    Get the weights (with dimensions ``nCells`` and ``nRegions``) for
+    regional reductions, reading the mask and mesh files only if they aren't
+    already cached
+    '''
+    key = (maskFileName, os.path.getmtime(maskFileName), meshFileName,
+           os.path.getmtime(meshFileName))
+    if key not in _regionWeights:
+        with netCDF4.Dataset(maskFileName, 'r') as maskFile:
+            masks = numpy.array(maskFile.variables['regionCellMasks'][:],
+                                float)
+        with netCDF4.Dataset(meshFileName, 'r') as meshFile:
+            areaCell = numpy.array(meshFile.variables['areaCell'][:], float)
+        _regionWeights.clear()
+        _regionWeights[key] = masks*areaCell[:, numpy.newaxis]
+    return _regionWeights[key]  # }}}
+
+
+def _read_variables(args):  # {{{
+    '''
+    Read the variables from an input file, with the input file name and
+    variable list passed as a tuple so this can be called from a process
+    pool
+    '''
+    fileName, variableList = args
+    record = {}
+    with netCDF4.Dataset(fileName, 'r') as inFile:
+        for variableName in variableList:
+            inVariable = inFile.variables[variableName]
+            _set_raw(inVariable)
+            record[variableName] = inVariable[:]
+    return record  # }}}
+
+
+def _set_raw(variable):  # {{{
+    '''
+    Read and write the raw values of a variable (as ``ncrcat`` does) without
+    masking, scaling or converting character arrays to strings
+    '''
+    variable.set_auto_maskandscale(False)
+    variable.set_auto_chartostring(False)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
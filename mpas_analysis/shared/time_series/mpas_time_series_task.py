@@ -1,6 +1,7 @@
 import os
 import warnings
-import subprocess
+import threading
+from collections import OrderedDict
 from distutils.spawn import find_executable
 import xarray as xr
 import numpy
@@ -8,7 +9,19 @@ import numpy
 from ..analysis_task import AnalysisTask
 
 from ..io.utility import build_config_full_path, make_directories
+from ..io.catalog import write_catalog, catalogExtension
 from ..timekeeping.utility import get_simulation_start_time
+from ..trace import traced
+from ..subprocess_runner import run_command
+from .extract_time_series import extract_time_series, \
+    backfill_time_series, reduce_time_series, get_incomplete_variables
+
+# tasks that depend on this task add variables while they are being set up,
+# possibly in several threads at once
+_variableLock = threading.Lock()
+
+# the time variables included in each store of the time series
+_timeVariables = ['xtime_startMonthly', 'xtime_endMonthly']
 
 
 class MpasTimeSeriesTask(AnalysisTask):  # {{{
@@ -21,17 +34,46 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
 
     variableList : list of str
         A list of variable names in ``timeSeriesStatsMonthly`` to be
-        included in the time series
+        included in the time series.
+
+    variableGroups : ``OrderedDict``
+        The variables added together by each call to ``add_variables``, with
+        the first variable of each call as the name of the group.  Each group
+        is extracted in one pass over the input files into its own store
+        (see ``get_stores``).
+
+    regionalReductions : ``OrderedDict``
+        The regional reductions (see ``add_regional_reduction``) to compute
+        as the input files are read, each with its own store, with the names
+        of the reductions as keys
 
     inputFiles : list of str
         A list of input files from which to extract the time series.
 
+    outputFile : str
+        The catalog of the stores that make up the time series, which can be
+        passed to ``open_mpas_dataset`` to read only the stores with the
+        variables needed.  A single time series file ``<task>.nc`` written
+        by an earlier version of MPAS-Analysis is not used and can be
+        deleted.
+
+    storeDirectory : str
+        The directory containing the stores
+
     startDate, endDate : str
         The start and end dates of the time series as strings
 
     startYear, endYear : int
         The start and end years of the time series
 
+    useNcrcat : bool
+        Whether the time series is extracted with ``ncrcat`` or with the
+        built-in extractor
+
+    processCount : int
+        The number of processes the built-in extractor uses to read the
+        input files
+
     Authors
     -------
     Xylar Asay-Davis
@@ -64,6 +106,8 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
         Xylar Asay-Davis
         '''
         self.variableList = []
+        self.variableGroups = OrderedDict()
+        self.regionalReductions = OrderedDict()
         self.seasons = []
 
         tags = ['timeSeries']
@@ -84,7 +128,11 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
 
     def add_variables(self, variableList):  # {{{
         '''
-        Add one or more variables to extract as a time series.
+        Add one or more variables to extract as a time series.  The
+        variables are extracted together (in one pass over the input files)
+        into a store named after the first variable, separate from the
+        variables other tasks add, so tasks only read the variables they
+        need.
 
         Parameters
         ----------
@@ -97,9 +145,80 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
         Xylar Asay-Davis
         '''
 
-        for variable in variableList:
-            if variable not in self.variableList:
-                self.variableList.append(variable)
+        if len(variableList) == 0:
+            return
+
+        with _variableLock:
+            group = self.variableGroups.setdefault(variableList[0], [])
+            for variable in variableList:
+                if variable not in self.variableList:
+                    self.variableList.append(variable)
+                if variable not in group:
+                    group.append(variable)
+
+        # }}}
+
+    def add_regional_reduction(self, reductionName, variables, maskFileName,
+                               meshFileName, operation='sum'):  # {{{
+        '''
+        Add a time series of area-weighted sums or means of variables over
+        regions, computed as each input file is read, so only the reduced
+        time series (with dimensions ``Time`` and ``nRegions``) is stored.
+        The reduced variables can be read from ``outputFile`` with
+        ``open_mpas_dataset``, like other variables in the time series.
+
+        Parameters
+        ----------
+        reductionName : str
+            A unique name for the reduction, used to name its store
+
+        variables : dict
+            The names of variables (with dimensions ``Time`` and ``nCells``)
+            in ``timeSeriesStatsMonthly``, with the names of the reduced
+            variables as keys
+
+        maskFileName : str
+            A file containing ``regionCellMasks`` with dimensions ``nCells``
+            and ``nRegions``.  If the mask file changes, the reduction is
+            computed again.
+
+        meshFileName : str
+            A file containing ``areaCell``, e.g. an MPAS restart file.  If
+            the mesh file changes, the reduction is computed again.
+
+        operation : {'sum', 'mean'}, optional
+            Whether to compute the area-weighted sum or mean over each region
+
+        Raises
+        ------
+        ValueError
+            If the name of the reduction or a reduced variable is already in
+            use
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+
+        with _variableLock:
+            usedNames = set(self.variableList)
+            for reduction in self.regionalReductions.values():
+                usedNames.update(reduction['variables'].keys())
+            if reductionName in self.regionalReductions or \
+                    reductionName in usedNames:
+                raise ValueError('A time series named {} has already been '
+                                 'added'.format(reductionName))
+            for reducedName in variables:
+                if reducedName in usedNames:
+                    raise ValueError('A time series variable named {} has '
+                                     'already been added'.format(
+                                         reducedName))
+
+            self.regionalReductions[reductionName] = {
+                'variables': dict(variables),
+                'maskFileName': maskFileName,
+                'meshFileName': meshFileName,
+                'operation': operation}
 
         # }}}
 
@@ -125,8 +244,10 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
 
         make_directories(baseDirectory)
 
-        self.outputFile = '{}/{}.nc'.format(baseDirectory,
-                                            self.fullTaskName)
+        self.outputFile = '{}/{}{}'.format(baseDirectory, self.fullTaskName,
+                                           catalogExtension)
+        self.storeDirectory = '{}/{}'.format(baseDirectory, self.fullTaskName)
+        make_directories(self.storeDirectory)
 
         self.check_analysis_enabled(
             analysisOptionName='config_am_timeseriesstatsmonthly_enable',
@@ -161,6 +282,17 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
 
         self.inputFiles = sorted(self.inputFiles)
 
+        self.useNcrcat = config.getWithDefault('timeSeries', 'useNcrcat',
+                                               default=True)
+        self.processCount = config.getWithDefault(
+            'timeSeries', 'extractionProcessCount', default=1)
+        if not self.useNcrcat:
+            self.cpuCount = self.processCount
+            if self.processCount > 1:
+                # the built-in extractor reads the input files with its own
+                # pool of processes, which a daemonic process can't start
+                self.daemon = False
+
         # }}}
 
     def run_task(self):  # {{{
@@ -172,7 +304,8 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
         Xylar Asay-Davis
         '''
 
-        if len(self.variableList) == 0:
+        if len(self.variableList) == 0 and \
+                len(self.regionalReductions) == 0:
             # nothing to do
             return
 
@@ -181,10 +314,112 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
                                  os.path.basename(self.inputFiles[0]),
                                  os.path.basename(self.inputFiles[-1])))
 
-        self._compute_time_series_with_ncrcat()
+        stores = OrderedDict()
+        for storeName, variableList in self.get_stores().items():
+            storeFileName = self.get_store_file_name(storeName)
+
+            if self.useNcrcat and os.path.exists(storeFileName):
+                dates, recordCount = self._get_store_dates(storeFileName)
+                if len(dates) < recordCount:
+                    # ncrcat can only append after the incomplete records
+                    # left by an interrupted run, so start over
+                    self.logger.info('  Extracting {} again, since its store '
+                                     'is incomplete'.format(
+                                         ', '.join(variableList)))
+                    os.remove(storeFileName)
+
+            missingVariables = self._get_missing_variables(storeFileName,
+                                                           variableList)
+            if len(missingVariables) > 0:
+                self._backfill_time_series(storeFileName, missingVariables)
+
+            inputFiles = self._get_new_input_files(storeFileName)
+            if len(inputFiles) > 0:
+                if self.useNcrcat:
+                    self._compute_time_series_with_ncrcat(
+                        inputFiles, storeFileName, variableList)
+                else:
+                    self._compute_time_series_with_python(
+                        inputFiles, storeFileName, variableList)
+
+            stores[storeFileName] = variableList
+
+        for reductionName, reduction in self.regionalReductions.items():
+            storeFileName = self.get_store_file_name(reductionName)
+            self._compute_regional_reduction(storeFileName, reduction)
+            stores[storeFileName] = sorted(reduction['variables'].keys())
+
+        write_catalog(self.outputFile, stores)
+
+        # }}}
+
+    def get_output_files(self):  # {{{
+        '''
+        Get the catalog and stores of the time series this task produces
+
+        Returns
+        -------
+        outputFiles : list of str
+            The paths of the catalog and the stores
 
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return [self.outputFile] + \
+            [self.get_store_file_name(storeName) for storeName in
+             self.get_stores().keys() + self.regionalReductions.keys()]
         # }}}
 
+    def get_stores(self):  # {{{
+        '''
+        Get the variables in each store of the time series, one store for
+        each group in ``variableGroups``.  A variable in several groups is
+        only stored with the first of them in alphabetical order, so the
+        stores don't depend on the order in which tasks added variables.
+
+        Returns
+        -------
+        stores : ``OrderedDict``
+            The variables in each store, with the names of the stores as keys
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        stores = OrderedDict()
+        storedVariables = set()
+        for groupName in sorted(self.variableGroups):
+            variableList = [variable for variable in
+                            sorted(self.variableGroups[groupName]) if
+                            variable not in storedVariables]
+            if len(variableList) > 0:
+                stores[groupName] = variableList
+                storedVariables.update(variableList)
+        return stores  # }}}
+
+    def get_store_file_name(self, storeName):  # {{{
+        '''
+        Get the file containing the time series of a group of variables or a
+        regional reduction
+
+        Parameters
+        ----------
+        storeName : str
+            The name of a store from ``get_stores`` or of a reduction in
+            ``regionalReductions``
+
+        Returns
+        -------
+        storeFileName : str
+            The path of the store
+
+        Authors
+        -------
+        Xylar Asay-Davis
+        '''
+        return '{}/{}.nc'.format(self.storeDirectory, storeName)  # }}}
+
     def _update_time_series_bounds_from_file_names(self):  # {{{
         """
         Update the start and end years and dates for time series based on the
@@ -244,11 +479,242 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
 
         # }}}
 
-    def _compute_time_series_with_ncrcat(self):
+    def _get_missing_variables(self, storeFileName, variableList):  # {{{
+        '''
+        Get the variables that aren't yet in an existing store, or that
+        were only partly added because the run was interrupted
+
+        Parameters
+        ----------
+        storeFileName : str
+            The store of one or more variables
+
+        variableList : list of str
+            The variables that belong in the store
+
+        Returns
+        -------
+        missingVariables : list of str
+            The variables that need to be added to the records already in the
+            store (empty if there is no store yet)
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        if not os.path.exists(storeFileName):
+            return []
+
+        dates, recordCount = self._get_store_dates(storeFileName)
+        if len(dates) == 0:
+            return []
+
+        incompleteVariables = get_incomplete_variables(storeFileName)
+        with xr.open_dataset(storeFileName) as ds:
+            return [variable for variable in variableList if
+                    variable not in ds.data_vars or
+                    variable in incompleteVariables]  # }}}
+
+    def _get_store_dates(self, storeFileName):  # {{{
+        '''
+        Get the start dates of the complete records in a store.  Records
+        after the last one with a valid date were left incomplete by an
+        interrupted run.
+
+        Parameters
+        ----------
+        storeFileName : str
+            The store of one or more variables
+
+        Returns
+        -------
+        dates : list of str
+            The ``xtime_startMonthly`` of each complete record
+
+        recordCount : int
+            The number of records in the store, including incomplete ones
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        with xr.open_dataset(storeFileName) as ds:
+            if 'xtime_startMonthly' not in ds:
+                return [], ds.sizes.get('Time', 0)
+            dates = [str(date).strip() for date in
+                     ds.xtime_startMonthly.values]
+        recordCount = len(dates)
+        while len(dates) > 0 and dates[-1] == '':
+            dates.pop()
+        return dates, recordCount  # }}}
+
+    @traced('compute')
+    def _backfill_time_series(self, storeFileName, variableList):  # {{{
+        '''
+        Add variables to the records already in a store, e.g. because a task
+        added variables to its group since the store was extracted, reading
+        the input files that cover the dates in the store
+
+        Parameters
+        ----------
+        storeFileName : str
+            The store of one or more variables
+
+        variableList : list of str
+            The variables to add
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        dates, recordCount = self._get_store_dates(storeFileName)
+        firstDate = dates[0]
+        lastDate = dates[-1]
+
+        self.logger.info('  Adding {} to the time series from {} to '
+                         '{}:'.format(', '.join(variableList), firstDate,
+                                      lastDate))
+
+        try:
+            inputFiles = self.historyStreams.readpath(
+                'timeSeriesStatsMonthlyOutput', startDate=firstDate,
+                endDate=lastDate, calendar=self.calendar)
+        except ValueError:
+            inputFiles = []
+
+        backfill_time_series(sorted(inputFiles), variableList,
+                             storeFileName, processCount=self.processCount,
+                             logger=self.logger)
+
+        # }}}
+
+    def _get_new_input_files(self, storeFileName):  # {{{
+        '''
+        Get the input files with times that aren't already in a store
+
+        Parameters
+        ----------
+        storeFileName : str
+            The store of one or more variables
+
+        Returns
+        -------
+        inputFiles : list of str
+            The input files to be appended to the time series
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        if not os.path.exists(storeFileName):
+            return self.inputFiles
+
+        dates = sorted([fileName[-13:-6] for fileName in self.inputFiles])
+        inYears = numpy.array([int(date[0:4]) for date in dates])
+        inMonths = numpy.array([int(date[5:7]) for date in dates])
+        totalMonths = 12*inYears + inMonths
+
+        storeDates, recordCount = self._get_store_dates(storeFileName)
+        if len(storeDates) == 0:
+            return self.inputFiles
+        lastDate = storeDates[-1]
+
+        lastYear = int(lastDate[0:4])
+        lastMonth = int(lastDate[5:7])
+        lastTotalMonths = 12*lastYear + lastMonth
+
+        inputFiles = []
+        for index, inputFile in enumerate(self.inputFiles):
+            if totalMonths[index] > lastTotalMonths:
+                inputFiles.append(inputFile)
+
+        return inputFiles  # }}}
+
+    @traced('compute')
+    def _compute_regional_reduction(self, storeFileName, reduction):  # {{{
+        '''
+        Compute a regional reduction for the input files that aren't already
+        in its store.  If the store was computed with a different (or since
+        modified) mask or mesh file or a different operation, or is missing
+        variables, it is computed again from the beginning.
+
+        Parameters
+        ----------
+        storeFileName : str
+            The store of the reduction
+
+        reduction : dict
+            The variables, mask and mesh files and operation of the reduction
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
+
+        if os.path.exists(storeFileName):
+            storeTime = os.path.getmtime(storeFileName)
+            with xr.open_dataset(storeFileName) as ds:
+                upToDate = \
+                    ds.attrs.get('regionMaskFile') == \
+                    reduction['maskFileName'] and \
+                    ds.attrs.get('meshFile') == \
+                    reduction['meshFileName'] and \
+                    ds.attrs.get('reduction') == reduction['operation'] and \
+                    storeTime > \
+                    os.path.getmtime(reduction['maskFileName']) and \
+                    storeTime > \
+                    os.path.getmtime(reduction['meshFileName']) and \
+                    all([name in ds.data_vars for name in
+                         reduction['variables']])
+            if not upToDate:
+                self.logger.info('  Recomputing {}, which is out of '
+                                 'date'.format(
+                                     os.path.basename(storeFileName)))
+                os.remove(storeFileName)
+
+        inputFiles = self._get_new_input_files(storeFileName)
+        if len(inputFiles) == 0:
+            return
+
+        variables = reduction['variables']
+        self.logger.info('  Computing area-weighted regional {} of {} with '
+                         '{} process(es) from:'.format(
+                             reduction['operation'],
+                             ', '.join([variables[name] for name in
+                                        sorted(variables)]),
+                             self.processCount))
+
+        reduce_time_series(inputFiles, variables, storeFileName,
+                           reduction['maskFileName'],
+                           reduction['meshFileName'],
+                           operation=reduction['operation'],
+                           processCount=self.processCount,
+                           logger=self.logger)
+
+        # }}}
+
+    @traced('compute')
+    def _compute_time_series_with_ncrcat(self, inputFiles, storeFileName,
+                                         variableList):
         # {{{
         '''
         Uses ncrcat to extact time series from timeSeriesMonthlyOutput files
 
+        Parameters
+        ----------
+        inputFiles : list of str
+            The input files to append to the time series
+
+        storeFileName : str
+            The store to append to
+
+        variableList : list of str
+            The variables in the store
+
         Raises
         ------
         OSError
@@ -266,61 +732,54 @@ class MpasTimeSeriesTask(AnalysisTask):  # {{{
                           'Note: this presumes use of the conda-forge '
                           'channel.')
 
-        if os.path.exists(self.outputFile):
-            # add only input files wiht times that aren't already in the
-            # output file
-            dates = sorted([fileName[-13:-6] for fileName in self.inputFiles])
-            inYears = numpy.array([int(date[0:4]) for date in dates])
-            inMonths = numpy.array([int(date[5:7]) for date in dates])
-            totalMonths = 12*inYears + inMonths
-
-            with xr.open_dataset(self.outputFile) as ds:
-                lastDate = str(ds.xtime_startMonthly[-1].values)
-
-            lastYear = int(lastDate[0:4])
-            lastMonth = int(lastDate[5:7])
-            lastTotalMonths = 12*lastYear + lastMonth
-
-            inputFiles = []
-            for index, inputFile in enumerate(self.inputFiles):
-                if totalMonths[index] > lastTotalMonths:
-                    inputFiles.append(inputFile)
-
-            if len(inputFiles) == 0:
-                # nothing to do
-                return
-        else:
-            inputFiles = self.inputFiles
-
-        variableList = self.variableList + ['xtime_startMonthly',
-                                            'xtime_endMonthly']
+        variableList = variableList + _timeVariables
 
         args = ['ncrcat', '--record_append', '--no_tmp_fl',
                 '-v', ','.join(variableList)]
 
         printCommand = '{} {} ... {} {}'.format(' '.join(args), inputFiles[0],
                                                 inputFiles[-1],
-                                                self.outputFile)
+                                                storeFileName)
         args.extend(inputFiles)
-        args.append(self.outputFile)
+        args.append(storeFileName)
+
+        run_command(args, logger=self.logger, printCommand=printCommand)
+
+        # }}}
+
+    @traced('compute')
+    def _compute_time_series_with_python(self, inputFiles, storeFileName,
+                                         variableList):
+        # {{{
+        '''
+        Uses the built-in extractor to extact time series from
+        timeSeriesMonthlyOutput files, reading the files with a pool of
+        ``processCount`` processes
 
-        self.logger.info('running: {}'.format(printCommand))
-        for handler in self.logger.handlers:
-            handler.flush()
+        Parameters
+        ----------
+        inputFiles : list of str
+            The input files to append to the time series
+
+        storeFileName : str
+            The store to append to
+
+        variableList : list of str
+            The variables in the store
+
+        Author
+        ------
+        Xylar Asay-Davis
+        '''
 
-        process = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        self.logger.info('  Extracting {} with {} process(es) from:'.format(
+            ', '.join(variableList), self.processCount))
 
-        if stdout:
-            self.logger.info(stdout)
-        if stderr:
-            for line in stderr.split('\n'):
-                self.logger.error(line)
+        variableList = variableList + _timeVariables
 
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode,
-                                                ' '.join(args))
+        extract_time_series(inputFiles, variableList, storeFileName,
+                            processCount=self.processCount,
+                            logger=self.logger)
 
         # }}}
     # }}}
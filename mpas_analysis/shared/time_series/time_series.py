@@ -8,10 +8,12 @@ Xylar Asay-Davis
 
 import xarray as xr
 import numpy
+import netCDF4
 import os
 import warnings
 
 from ..timekeeping.utility import days_to_datetime
+from ..io.utility import write_atomically
 
 
 def cache_time_series(timesInDataSet, timeSeriesCalcFunction, cacheFileName,
@@ -25,6 +27,12 @@ def cache_time_series(timesInDataSet, timeSeriesCalcFunction, cacheFileName,
     Note: only works with climatologies where the mask (locations of ``NaN``
     values) doesn't vary with time.
 
+    The cache file has an unlimited ``Time`` dimension and each update only
+    appends the newly computed time entries to it, so the cost of an update
+    doesn't grow with the length of the time series.  Time entries may be
+    appended out of order (e.g. if the start year is moved earlier), so the
+    cache is put in time order when it is read back.
+
     Parameters
     ----------
     timesInDataSet : array-like
@@ -69,15 +77,15 @@ def cache_time_series(timesInDataSet, timeSeriesCalcFunction, cacheFileName,
 
     timesProcessed = numpy.zeros(len(timesInDataSet), bool)
     # figure out which files to load and which years go in each file
-    continueOutput = os.path.exists(cacheFileName)
     cacheDataSetExists = False
-    if continueOutput:
+    if os.path.exists(cacheFileName):
         if logger is not None:
             logger.info('   Read in previously computed time series')
-        # read in what we have so far
+        # read in only the times we have so far
 
         try:
-            dsCache = xr.open_dataset(cacheFileName, decode_times=False)
+            with xr.open_dataset(cacheFileName, decode_times=False) as dsCache:
+                cacheTimes = dsCache.Time.values
             cacheDataSetExists = True
         except IOError:
             # assuming the cache file is corrupt, so deleting it.
@@ -90,11 +98,7 @@ def cache_time_series(timesInDataSet, timeSeriesCalcFunction, cacheFileName,
             os.remove(cacheFileName)
 
         if cacheDataSetExists:
-            # force loading and then close so we can overwrite the file later
-            dsCache.load()
-            dsCache.close()
-            for time in dsCache.Time.values:
-                timesProcessed[timesInDataSet == time] = True
+            timesProcessed = numpy.in1d(timesInDataSet, cacheTimes)
 
     datetimes = days_to_datetime(timesInDataSet, calendar=calendar)
     yearsInDataSet = numpy.array([date.year for date in datetimes])
@@ -130,17 +134,79 @@ def cache_time_series(timesInDataSet, timeSeriesCalcFunction, cacheFileName,
         firstProcessed = False
 
         if cacheDataSetExists:
-            dsCache = xr.concat([dsCache, ds], dim='Time')
-            # now sort the Time dimension:
-            dsCache = dsCache.loc[{'Time': sorted(dsCache.Time.values)}]
+            _append_to_cache(ds, cacheFileName)
         else:
-            dsCache = ds
+            ds.to_netcdf(cacheFileName, unlimited_dims=['Time'])
             cacheDataSetExists = True
 
-        dsCache.to_netcdf(cacheFileName)
+    with xr.open_dataset(cacheFileName, decode_times=False) as dsCache:
+        timeIndices = _get_sorted_time_indices(dsCache.Time.values,
+                                               timesInDataSet[0],
+                                               timesInDataSet[-1])
+        dsCache = dsCache.isel(Time=timeIndices)
+        # force loading and then close so the file can be updated later
+        dsCache.load()
 
-    return dsCache.sel(Time=slice(timesInDataSet[0], timesInDataSet[-1]))
+    return dsCache
 
     # }}}
 
+
+def _append_to_cache(ds, cacheFileName):  # {{{
+    '''
+    Append the time entries in ``ds`` to the end of the cache file, writing
+    only the variables with a ``Time`` dimension.  ``Time`` itself is written
+    last, so entries from an append that was interrupted have no valid time
+    and are ignored when the cache is read back.
+    '''
+    variableNames = [name for name in ds.variables if
+                     'Time' in ds[name].dims and name != 'Time'] + ['Time']
+
+    with netCDF4.Dataset(cacheFileName, 'r') as ncFile:
+        isUnlimited = ncFile.dimensions['Time'].isunlimited()
+    if not isUnlimited:
+        # a cache written before ``Time`` was unlimited can't be appended to,
+        # so it gets rewritten once
+        _make_time_unlimited(cacheFileName)
+
+    with netCDF4.Dataset(cacheFileName, 'a') as ncFile:
+        start = len(ncFile.dimensions['Time'])
+        count = ds.sizes['Time']
+        for name in variableNames:
+            if name not in ncFile.variables:
+                raise ValueError('Variable {} is not in the cache file {}, '
+                                 'which should be deleted'.format(
+                                     name, cacheFileName))
+            ncVariable = ncFile.variables[name]
+            values = ds[name].transpose(*ncVariable.dimensions).values
+            indices = [slice(None)]*len(ncVariable.dimensions)
+            indices[ncVariable.dimensions.index('Time')] = \
+                slice(start, start+count)
+            ncVariable[tuple(indices)] = values  # }}}
+
+
+def _make_time_unlimited(cacheFileName):  # {{{
+    '''
+    Rewrite the cache file with an unlimited ``Time`` dimension, replacing the
+    original only once the new file is complete
+    '''
+    with xr.open_dataset(cacheFileName, decode_times=False) as dsCache:
+        dsCache.load()
+    write_atomically(dsCache, cacheFileName, unlimited_dims=['Time'])  # }}}
+
+
+def _get_sorted_time_indices(times, firstTime, lastTime):  # {{{
+    '''
+    Get the indices that put the entries of the cache between ``firstTime``
+    and ``lastTime`` in time order, skipping invalid and duplicate times
+    '''
+    valid = numpy.logical_and(numpy.isfinite(times),
+                              numpy.logical_and(times >= firstTime,
+                                                times <= lastTime))
+    validIndices = numpy.nonzero(valid)[0]
+    # unique times (keeping the first entry of each), in sorted order
+    uniqueTimes, uniqueIndices = numpy.unique(times[validIndices],
+                                              return_index=True)
+    return validIndices[uniqueIndices]  # }}}
+
 # vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
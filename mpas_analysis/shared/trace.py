@@ -0,0 +1,180 @@
+'''
+Functions for recording when the major phases (e.g. loading, computing,
+remapping, plotting) of an analysis task start and end, so they can be shown
+nested inside the task in a timeline of the run.
+
+Phases are only recorded between calls to ``start_phase_recording`` and
+``stop_phase_recording``, which ``AnalysisTask.run`` makes around
+``run_task``.  Otherwise, ``trace_phase`` and ``traced`` do nothing.
+
+Authors
+-------
+Xylar Asay-Davis
+'''
+
+import os
+import time
+import json
+import functools
+from contextlib import contextmanager
+
+# the phases recorded so far in this process, or None if not recording
+_phases = None
+
+
+def start_phase_recording():  # {{{
+    '''
+    Start recording phases in this process
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    global _phases
+    _phases = []  # }}}
+
+
+def stop_phase_recording():  # {{{
+    '''
+    Stop recording phases in this process
+
+    Returns
+    -------
+    phases : list of tuple
+        The name, start time and end time (in seconds since the epoch) of
+        each phase, in the order the phases ended
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    global _phases
+    phases = _phases
+    _phases = None
+    if phases is None:
+        phases = []
+    return phases  # }}}
+
+
+@contextmanager
+def trace_phase(name):  # {{{
+    '''
+    A context manager that records the code inside it as a phase
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase (e.g. ``load``, ``compute``, ``remap``,
+        ``plot`` or ``write XML``)
+
+    Examples
+    --------
+    >>> with trace_phase('compute'):
+    ...     ds = ds.mean(dim='Time')
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    if _phases is None:
+        yield
+        return
+
+    startTime = time.time()
+    try:
+        yield
+    finally:
+        if _phases is not None:
+            _phases.append((name, startTime, time.time()))
+    # }}}
+
+
+def traced(name):  # {{{
+    '''
+    A decorator that records each call to a function as a phase
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace_phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator  # }}}
+
+
+def write_phases(logsDirectory, fullTaskName, phases):  # {{{
+    '''
+    Write the phases recorded while a task ran to a JSON file in the
+    ``phases`` subdirectory of the logs directory, where the scheduler can
+    find them
+
+    Parameters
+    ----------
+    logsDirectory : str
+        The directory where log files are written
+
+    fullTaskName : str
+        The name of the task (and subtask, if any)
+
+    phases : list of tuple
+        The phases returned by ``stop_phase_recording``
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    # imported here because the readers and writers in ``io`` trace their
+    # phases, so ``io`` imports this module
+    from .io.utility import make_directories
+
+    make_directories('{}/phases'.format(logsDirectory))
+    fileName = _get_phases_file_name(logsDirectory, fullTaskName)
+    with open(fileName, 'w') as phasesFile:
+        json.dump(phases, phasesFile)  # }}}
+
+
+def read_phases(logsDirectory, fullTaskName):  # {{{
+    '''
+    Read the phases written by ``write_phases`` the last time a task ran
+
+    Parameters
+    ----------
+    logsDirectory : str
+        The directory where log files are written
+
+    fullTaskName : str
+        The name of the task (and subtask, if any)
+
+    Returns
+    -------
+    phases : list of tuple
+        The name, start time and end time of each phase, or an empty list if
+        the task didn't write any phases
+
+    Authors
+    -------
+    Xylar Asay-Davis
+    '''
+    fileName = _get_phases_file_name(logsDirectory, fullTaskName)
+    if not os.path.exists(fileName):
+        return []
+    with open(fileName) as phasesFile:
+        return [tuple(phase) for phase in json.load(phasesFile)]  # }}}
+
+
+def _get_phases_file_name(logsDirectory, fullTaskName):  # {{{
+    '''
+    Get the name of the file where the phases of a task are written
+    '''
+    return '{}/phases/{}.json'.format(logsDirectory, fullTaskName)  # }}}
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -21,7 +21,9 @@ from mpas_analysis.shared.climatology import \
     get_comparison_descriptor, get_remapper, \
     get_observation_climatology_file_names, \
     add_years_months_days_in_month, compute_climatology, \
-    compute_monthly_climatology
+    compute_monthly_climatology, MonthlyAccumulator
+from mpas_analysis.shared.climatology import \
+    climatology as climatology_module
 from mpas_analysis.shared.grid import MpasMeshDescriptor, LatLonGridDescriptor
 from mpas_analysis.shared.constants import constants
 
@@ -272,5 +274,168 @@ class TestClimatology(TestCase):
         self.assertArrayApproxEqual(monthlyClimatology.month.values,
                                     refClimatology.month.values)
 
+    def test_compute_climatology_mask_varies(self):
+        # two years of monthly data on 4 cells with a different mask in each
+        # month
+        ds = xarray.Dataset()
+        ds.coords['month'] = ('Time', numpy.tile(numpy.arange(1, 13), 2))
+        ds.coords['year'] = ('Time', numpy.repeat([1, 2], 12))
+        days = numpy.tile(numpy.array(constants.daysInMonth, float), 2)
+        ds.coords['daysInMonth'] = ('Time', days)
+        values = numpy.arange(24*4, dtype=float).reshape(24, 4)
+        values[numpy.arange(24) % 3 == 0, 1] = numpy.nan
+        values[numpy.arange(24) % 12 == 0, 2] = numpy.nan
+        ds['sst'] = (('Time', 'nCells'), values)
+
+        def expected_mean(monthValues):
+            mask = numpy.logical_and(
+                numpy.in1d(ds.month.values, monthValues)[:, numpy.newaxis],
+                numpy.isfinite(values))
+            weights = mask*days[:, numpy.newaxis]
+            weightSum = weights.sum(axis=0)
+            mean = numpy.nansum(weights*values, axis=0)/weightSum
+            mean[weightSum == 0.] = numpy.nan
+            return mean
+
+        for monthNames in ['JFM', 'DJF', 'ANN', 'Jan']:
+            monthValues = constants.monthDictionary[monthNames]
+            climatology = compute_climatology(ds, monthValues,
+                                              maskVaries=True)
+            assert('Time' not in climatology.dims.keys())
+            self.assertArrayApproxEqual(climatology.sst.values,
+                                        expected_mean(monthValues))
+
+        # read the data a few times at a time
+        maxChunkElements = climatology_module._maxChunkElements
+        climatology_module._maxChunkElements = 10
+        try:
+            monthValues = constants.monthDictionary['ANN']
+            climatology = compute_climatology(ds, monthValues,
+                                              maskVaries=True)
+            self.assertArrayApproxEqual(climatology.sst.values,
+                                        expected_mean(monthValues))
+        finally:
+            climatology_module._maxChunkElements = maxChunkElements
+
+        monthlyClimatology = compute_monthly_climatology(ds, maskVaries=True)
+        self.assertArrayEqual(monthlyClimatology.month.values,
+                              numpy.arange(1, 13))
+        for month in range(1, 13):
+            self.assertArrayApproxEqual(
+                monthlyClimatology.sst.sel(month=month).values,
+                expected_mean([month]))
+        # January of both years is masked out in the third cell
+        assert(numpy.isnan(monthlyClimatology.sst.values[0, 2]))
+
+    def test_compute_climatology_variability(self):
+        # three years of monthly data on 2 cells, with the second cell
+        # masked out in one January
+        ds = xarray.Dataset()
+        ds.coords['month'] = ('Time', numpy.tile(numpy.arange(1, 13), 3))
+        ds.coords['year'] = ('Time', numpy.repeat([1, 2, 3], 12))
+        days = numpy.tile(numpy.array(constants.daysInMonth, float), 3)
+        ds.coords['daysInMonth'] = ('Time', days)
+        values = numpy.cos(numpy.arange(36*2, dtype=float)).reshape(36, 2)
+        values[12, 1] = numpy.nan
+        ds['sst'] = (('Time', 'nCells'), values)
+
+        monthValues = constants.monthDictionary['JFM']
+        climatology = compute_climatology(ds, monthValues, maskVaries=True,
+                                          computeVariability=True)
+
+        yearlyMeans = []
+        for year in [1, 2, 3]:
+            yearDs = ds.isel(Time=numpy.nonzero(ds.year.values == year)[0])
+            yearlyMeans.append(compute_climatology(
+                yearDs, monthValues, maskVaries=True).sst.values)
+        yearlyMeans = numpy.array(yearlyMeans)
+
+        self.assertArrayApproxEqual(climatology.sst_std.values,
+                                    numpy.std(yearlyMeans, axis=0, ddof=1))
+        self.assertArrayEqual(climatology.sst_count.values, [3, 3])
+        self.assertArrayApproxEqual(
+            climatology.sst.values,
+            compute_climatology(ds, monthValues).sst.values)
+
+    def test_monthly_accumulator_variability(self):
+        random = numpy.random.RandomState(seed=0)
+        seasons = ['ANN', 'JFM']
+        yearlyValues = 1e6 + random.rand(4, 12, 5)
+
+        def accumulate(years):
+            accumulator = MonthlyAccumulator(['sst'], seasons)
+            for year in years:
+                yearly = MonthlyAccumulator(['sst'])
+                for month in range(1, 13):
+                    ds = xarray.Dataset()
+                    ds['sst'] = ('nCells', yearlyValues[year, month-1])
+                    yearly.add(ds, month)
+                accumulator.add_year(yearly)
+            return accumulator
+
+        # accumulate the years in two groups, as the climatology task does
+        # with cached sums, and merge the groups
+        accumulator = accumulate([0, 1, 2])
+        accumulator.merge(MonthlyAccumulator.from_dataset(
+            accumulate([3]).to_dataset(), ['sst']))
+
+        for season in seasons:
+            monthIndices = [month-1 for month in
+                            constants.monthDictionary[season]]
+            weights = numpy.array(constants.daysInMonth,
+                                  float)[monthIndices]
+            means = numpy.sum(yearlyValues[:, monthIndices] *
+                              weights[numpy.newaxis, :, numpy.newaxis],
+                              axis=1)/weights.sum()
+            variability = accumulator.get_variability(season)
+            assert(variability.sst_std.dims == ('Time', 'nCells'))
+            self.assertArrayApproxEqual(
+                variability.sst_std.values[0],
+                numpy.std(means, axis=0, ddof=1))
+            self.assertArrayEqual(variability.sst_count.values[0],
+                                  4*numpy.ones(5))
+
+        # remove the first year, as for a sliding window, and compare with
+        # the accumulated sums over the remaining years
+        accumulator.subtract(accumulate([0]))
+        expected = accumulate([1, 2, 3])
+        self.assertArrayApproxEqual(accumulator.days, expected.days)
+        self.assertArrayApproxEqual(accumulator.sums['sst'],
+                                    expected.sums['sst'])
+        for season in seasons:
+            variability = accumulator.get_variability(season)
+            expectedVariability = expected.get_variability(season)
+            self.assertArrayApproxEqual(variability.sst_std.values,
+                                        expectedVariability.sst_std.values)
+            self.assertArrayEqual(variability.sst_count.values,
+                                  expectedVariability.sst_count.values)
+
+        # no variability is merged into an accumulator with other seasons
+        with self.assertRaises(ValueError):
+            MonthlyAccumulator(['sst'], ['DJF']).merge(accumulator)
+
+    def test_monthly_accumulator_partial_years(self):
+        # June of one year through May of the next, so no year has all the
+        # months of either season
+        accumulator = MonthlyAccumulator(['sst'], ['ANN', 'JFM'])
+        for months in [range(6, 13), range(1, 6)]:
+            yearly = MonthlyAccumulator(['sst'])
+            for month in months:
+                ds = xarray.Dataset()
+                ds['sst'] = ('nCells', numpy.ones(5))
+                yearly.add(ds, month)
+            accumulator.add_year(yearly)
+
+        for season in ['ANN', 'JFM']:
+            climatology = accumulator.get_climatology(
+                constants.monthDictionary[season])
+            self.assertArrayApproxEqual(climatology.sst.values[0],
+                                        numpy.ones(5))
+            variability = accumulator.get_variability(season)
+            assert(variability.sst_std.dims == ('Time', 'nCells'))
+            assert(numpy.all(numpy.isnan(variability.sst_std.values)))
+            self.assertArrayEqual(variability.sst_count.values[0],
+                                  numpy.zeros(5))
+
 
 # vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -14,6 +14,7 @@ import xarray
 import pyproj
 
 from mpas_analysis.shared.interpolation import Remapper
+from mpas_analysis.shared.interpolation import remapper as remapperModule
 from mpas_analysis.shared.grid import MpasMeshDescriptor, \
     LatLonGridDescriptor, ProjectionGridDescriptor
 from mpas_analysis.test import TestCase, loaddatadir
@@ -182,6 +183,48 @@ class TestInterp(TestCase):
         self.check_remap(latLonGridFileName, outFileName, refFileName,
                          remapper, remap_file=True)
 
+    def test_mapping_cache_size(self):
+        '''
+        test that only the most recently used mapping files are cached
+
+        Xylar Asay-Davis
+        '''
+
+        sourceDescriptor, mpasMeshFileName, timeSeriesFileName = \
+            self.get_mpas_descriptor()
+        latLonDescriptor, latLonGridFileName = \
+            self.get_latlon_file_descriptor()
+        destinationDescriptor = self.get_latlon_array_descriptor()
+
+        remappers = []
+        for suffix, source, inFileName in [
+                ('mpas_to_latlon_array', sourceDescriptor,
+                 timeSeriesFileName),
+                ('latlon_file_to_latlon_array', latLonDescriptor,
+                 latLonGridFileName)]:
+            weightFileName, outFileName, refFileName = \
+                self.get_file_names(suffix=suffix)
+            remapper = self.build_remapper(source, destinationDescriptor,
+                                           weightFileName)
+            remappers.append((remapper, inFileName))
+
+        Remapper.mappingCacheSize = 1
+        try:
+            for remapper, inFileName in remappers:
+                # a new remapper for the same mapping file, so the mapping
+                # isn't already loaded
+                remapper = Remapper(remapper.sourceDescriptor,
+                                    remapper.destinationDescriptor,
+                                    remapper.mappingFileName)
+                remapper.remap(xarray.open_dataset(inFileName),
+                               self.renormalizationThreshold)
+                cache = remapperModule._mappingCache
+                assert([fileName for fileName, mtime in cache] ==
+                       [remapper.mappingFileName])
+        finally:
+            Remapper.mappingCacheSize = 0
+            remapperModule._mappingCache.clear()
+
     def test_mpas_to_stereographic_array(self):
         '''
         test horizontal interpolation from an MPAS mesh to a destination
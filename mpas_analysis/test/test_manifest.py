@@ -0,0 +1,78 @@
+"""
+Unit tests for the manifests written alongside output files
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import tempfile
+import shutil
+import os
+import numpy
+import xarray
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.shared.io.manifest import write_manifest, read_manifest, \
+    get_missing_variables, get_fingerprint
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        self.fileName = '{}/climo.nc'.format(self.test_dir)
+
+    def tearDown(self):
+        # Remove the directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def write_file(self, variableList):
+        ds = xarray.Dataset()
+        for variableName in variableList:
+            ds[variableName] = ('nCells', numpy.arange(10.))
+        ds.to_netcdf(self.fileName)
+
+    def test_missing_variables(self):
+        fingerprint = get_fingerprint(startYear=1, endYear=2)
+
+        # no file, so everything is missing
+        assert(get_missing_variables(self.fileName, ['a', 'b'],
+                                     fingerprint) == ['a', 'b'])
+
+        self.write_file(['a'])
+        # no manifest, so everything is missing
+        assert(get_missing_variables(self.fileName, ['a', 'b'],
+                                     fingerprint) == ['a', 'b'])
+
+        write_manifest(self.fileName, ['a'], fingerprint, startYear=1)
+        manifest = read_manifest(self.fileName, verifyChecksum=True)
+        assert(manifest['variables'] == ['a'])
+        assert(manifest['startYear'] == 1)
+        assert(get_missing_variables(self.fileName, ['a', 'b'],
+                                     fingerprint) == ['b'])
+
+        # computed from different inputs
+        assert(get_missing_variables(
+            self.fileName, ['a', 'b'],
+            get_fingerprint(startYear=1, endYear=3)) == ['a', 'b'])
+
+    def test_changed_file(self):
+        self.write_file(['a'])
+        write_manifest(self.fileName, ['a'], 'fingerprint')
+
+        # the file was replaced (e.g. by a write that didn't finish) after
+        # the manifest was written
+        self.write_file(['a', 'b'])
+        os.utime(self.fileName, (0, os.path.getmtime(self.fileName) + 10.))
+        assert(read_manifest(self.fileName) is None)
+
+    def test_fingerprint(self):
+        inFileName = '{}/input.nc'.format(self.test_dir)
+        fingerprint = get_fingerprint([inFileName])
+        with open(inFileName, 'w') as inFile:
+            inFile.write('data')
+        assert(get_fingerprint([inFileName]) != fingerprint)
+        assert(get_fingerprint([inFileName]) == get_fingerprint([inFileName]))
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
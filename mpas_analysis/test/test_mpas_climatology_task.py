@@ -8,12 +8,16 @@ import pytest
 import tempfile
 import shutil
 import os
+import numpy
+import xarray
 
 from mpas_analysis.test import TestCase, loaddatadir
 from mpas_analysis.configuration import MpasAnalysisConfigParser
 from mpas_analysis.shared.climatology import MpasClimatologyTask, \
     RemapMpasClimatologySubtask
 from mpas_analysis.shared import AnalysisTask
+from mpas_analysis.shared.constants import constants
+from mpas_analysis.shared.io.manifest import read_manifest, write_manifest
 from mpas_analysis.shared.io.utility import build_config_full_path, \
     make_directories
 
@@ -69,6 +73,23 @@ class TestMpasClimatologyTask(TestCase):
 
         return variableList, seasons
 
+    def set_input_times(self, inputFiles):
+        # give the input files whole-second modification times, so they can
+        # be restored exactly after the files are overwritten
+        for fileName in inputFiles:
+            mtime = int(os.path.getmtime(fileName))
+            os.utime(fileName, (mtime, mtime))
+
+    def overwrite_input_files(self, inputFiles):
+        # overwrite the input files with zeros, keeping their sizes and
+        # modification times, so they appear unchanged but can't be read
+        for fileName in inputFiles:
+            size = os.path.getsize(fileName)
+            mtime = os.path.getmtime(fileName)
+            with open(fileName, 'wb') as outFile:
+                outFile.write(b'\0'*size)
+            os.utime(fileName, (mtime, mtime))
+
     def test_add_variables(self):
         mpasClimatologyTask = self.setup_task()
         variableList, seasons = self.add_variables(mpasClimatologyTask)
@@ -109,6 +130,251 @@ class TestMpasClimatologyTask(TestCase):
             fileName = mpasClimatologyTask.get_file_name(season=season)
             assert(os.path.exists(fileName))
 
+    def test_run_analysis_python(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        for season in seasons:
+            monthValues = constants.monthDictionary[season]
+            variableName = variableList[0]
+            total = 0.
+            days = 0.
+            for fileName in mpasClimatologyTask.inputFiles:
+                month = int(fileName[-8:-6])
+                if month in monthValues:
+                    ds = xarray.open_dataset(fileName)
+                    total += constants.daysInMonth[month-1] * \
+                        ds[variableName].isel(Time=0).values
+                    days += constants.daysInMonth[month-1]
+
+            dsClimatology = xarray.open_dataset(
+                mpasClimatologyTask.get_file_name(season=season))
+            assert(dsClimatology.dims['Time'] == 1)
+            self.assertArrayApproxEqual(
+                dsClimatology[variableName].isel(Time=0).values,
+                total/days)
+
+    def test_run_analysis_python_cached(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+        self.set_input_times(mpasClimatologyTask.inputFiles)
+        mpasClimatologyTask.run(writeLogFile=False)
+
+        fileName = mpasClimatologyTask.get_file_name(season='ANN')
+        dsFirst = xarray.open_dataset(fileName).load()
+
+        # with the monthly sums cached, the input files aren't read again
+        # to compute the climatologies, as long as they are unchanged
+        for season in seasons:
+            os.remove(mpasClimatologyTask.get_file_name(season=season))
+        self.overwrite_input_files(mpasClimatologyTask.inputFiles)
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        dsSecond = xarray.open_dataset(fileName)
+        for variableName in variableList:
+            self.assertArrayApproxEqual(dsFirst[variableName].values,
+                                        dsSecond[variableName].values)
+
+    def test_run_analysis_python_cache_stale(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+        mpasClimatologyTask.run(writeLogFile=False)
+
+        fileName = mpasClimatologyTask.get_file_name(season='ANN')
+        dsFirst = xarray.open_dataset(fileName).load()
+
+        # the input files are replaced, so the cached monthly sums (and the
+        # climatologies computed from them) are out of date
+        for inputFileName in mpasClimatologyTask.inputFiles:
+            with xarray.open_dataset(inputFileName) as ds:
+                ds = ds.load()
+            ds['timeMonthly_avg_ssh'] = ds.timeMonthly_avg_ssh + 1.
+            ds.to_netcdf(inputFileName)
+            mtime = os.path.getmtime(inputFileName) + 10.
+            os.utime(inputFileName, (mtime, mtime))
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        dsSecond = xarray.open_dataset(fileName)
+        self.assertArrayApproxEqual(dsFirst.timeMonthly_avg_ssh.values + 1.,
+                                    dsSecond.timeMonthly_avg_ssh.values)
+
+    def test_run_analysis_python_add_variable(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        mpasClimatologyTask.add_variables(['timeMonthly_avg_ssh'], ['ANN'])
+        mpasClimatologyTask.run(writeLogFile=False)
+
+        # mark the existing variable so we can tell it wasn't recomputed,
+        # updating the manifest so the file is still considered up to date
+        fileName = mpasClimatologyTask.get_file_name(season='ANN')
+        manifest = read_manifest(fileName)
+        with xarray.open_dataset(fileName) as ds:
+            ds = ds.load()
+        ds['timeMonthly_avg_ssh'][:] = 0.
+        ds.to_netcdf(fileName)
+        write_manifest(fileName, manifest['variables'],
+                       manifest['sourceFingerprint'])
+
+        mpasClimatologyTask.add_variables(['timeMonthly_avg_tThreshMLD'])
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        with xarray.open_dataset(fileName) as ds:
+            assert(numpy.all(ds.timeMonthly_avg_ssh.values == 0.))
+            assert(numpy.all(ds.timeMonthly_avg_tThreshMLD.values != 0.))
+
+        manifest = read_manifest(fileName)
+        assert(manifest['variables'] == ['timeMonthly_avg_ssh',
+                                         'timeMonthly_avg_tThreshMLD'])
+
+        # no temporary files were left behind
+        directory = os.path.dirname(fileName)
+        assert(sorted(os.listdir(directory)) ==
+               [os.path.basename(fileName),
+                '{}.json'.format(os.path.basename(fileName))])
+
+    def test_run_analysis_python_variability(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        config.set('climatology', 'computeVariability', 'True')
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        for season in seasons:
+            fileName = mpasClimatologyTask.get_file_name(season=season)
+            with xarray.open_dataset(fileName) as dsClimatology:
+                for variableName in variableList:
+                    # there is only one year, so the standard deviation is
+                    # undefined
+                    count = dsClimatology['{}_count'.format(variableName)]
+                    std = dsClimatology['{}_std'.format(variableName)]
+                    assert(numpy.all(count.values == 1))
+                    assert(numpy.all(numpy.isnan(std.values)))
+            manifest = read_manifest(fileName)
+            assert('{}_std'.format(variableList[0]) in manifest['variables'])
+
+        # variability can't be computed with ncclimo
+        config.set('climatology', 'useNcclimo', 'True')
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        with self.assertRaises(ValueError):
+            mpasClimatologyTask.setup_and_check()
+
+    def test_run_analysis_python_windows(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        config.set('climatology', 'windowLengthYears', '1')
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+
+        # there is only one year of data, so one window
+        assert(mpasClimatologyTask.windows == [(2, 2)])
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        for season in seasons:
+            fileName = mpasClimatologyTask.get_window_file_name(season, 2, 2)
+            assert(fileName in mpasClimatologyTask.get_output_files())
+            assert(read_manifest(fileName)['variables'] == variableList)
+            with xarray.open_dataset(fileName) as dsWindow, \
+                    xarray.open_dataset(mpasClimatologyTask.get_file_name(
+                        season=season)) as dsClimatology:
+                for variableName in variableList:
+                    self.assertArrayApproxEqual(
+                        dsWindow[variableName].values,
+                        dsClimatology[variableName].values)
+
+    def test_run_analysis_python_shards(self):
+        config = self.setup_config()
+        config.set('climatology', 'useNcclimo', 'False')
+        config.set('climatology', 'shardCount', '2')
+        mpasClimatologyTask = MpasClimatologyTask(config=config,
+                                                  componentName='ocean')
+        mpasClimatologyTask.setup_and_check()
+        variableList, seasons = self.add_variables(mpasClimatologyTask)
+        self.set_input_times(mpasClimatologyTask.inputFiles)
+
+        # there is only one year of data, so only one shard
+        assert(len(mpasClimatologyTask.subtasks) == 1)
+        shard = mpasClimatologyTask.subtasks[0]
+        assert(shard.yearGroups == [[2]])
+        assert(shard.variableList == variableList)
+        shard.setup_and_check()
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+
+        shard.run(writeLogFile=False)
+        assert(shard._runStatus.value == AnalysisTask.SUCCESS)
+        cacheFileName = shard.get_output_files()[0]
+        assert(os.path.exists(cacheFileName))
+
+        # the climatology task merges the cached sums, without reading the
+        # input files again
+        self.overwrite_input_files(mpasClimatologyTask.inputFiles)
+
+        mpasClimatologyTask.run(writeLogFile=False)
+        assert(mpasClimatologyTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        for season in seasons:
+            fileName = mpasClimatologyTask.get_file_name(season=season)
+            assert(read_manifest(fileName)['variables'] == variableList)
+
     def test_update_climatology_bounds_from_file_names(self):
         mpasClimatologyTask = self.setup_task()
         config = mpasClimatologyTask.config
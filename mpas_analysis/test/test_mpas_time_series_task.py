@@ -0,0 +1,381 @@
+"""
+Unit test infrastructure for MpasTimeSeriesTask.
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import tempfile
+import shutil
+import os
+import numpy
+import xarray
+import netCDF4
+from multiprocessing import Queue
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.configuration import MpasAnalysisConfigParser
+from mpas_analysis.shared.time_series import MpasTimeSeriesTask, \
+    extract_time_series, backfill_time_series, get_incomplete_variables
+from mpas_analysis.shared.io.utility import build_config_full_path, \
+    make_directories
+from mpas_analysis.shared.io import open_mpas_dataset
+from mpas_analysis.shared.io.catalog import read_catalog
+from mpas_analysis.shared.scheduler.launcher import ProcessLauncher
+
+
+class TestMpasTimeSeriesTask(TestCase):
+    def setUp(self):
+        # Create a temporary directory and copy in the monthly files used to
+        # test MpasClimatologyTask
+        self.test_dir = tempfile.mkdtemp()
+        self.datadir = '{}/data'.format(self.test_dir)
+        shutil.copytree('{}/test_mpas_climatology_task'.format(
+            os.path.dirname(__file__)), self.datadir)
+
+        # the restart file needs the simulation start time so the first year
+        # can be included in the time series
+        restartFileName = '{}/mpaso.rst.0001-01-06_00000.nc'.format(
+            self.datadir)
+        with netCDF4.Dataset(restartFileName, 'a') as ncFile:
+            startTime = '0001-01-01_00:00:00'.ljust(64)
+            ncFile.createDimension('StrLen', 64)
+            variable = ncFile.createVariable('simulationStartTime', 'S1',
+                                             ('StrLen',))
+            variable[:] = netCDF4.stringtochar(numpy.array([startTime],
+                                                           'S64'))[0]
+
+    def tearDown(self):
+        # Remove the directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def setup_task(self, processCount=1, variableLists=None):
+        config = MpasAnalysisConfigParser()
+        config.read('{}/config.QU240'.format(self.datadir))
+        config.set('input', 'baseDirectory', self.datadir)
+        config.set('output', 'baseDirectory',
+                   '{}/output'.format(self.test_dir))
+        config.set('output', 'timeSeriesSubdirectory', 'timeseries')
+        config.add_section('timeSeries')
+        config.set('timeSeries', 'startYear', '2')
+        config.set('timeSeries', 'endYear', '2')
+        config.set('timeSeries', 'useNcrcat', 'False')
+        config.set('timeSeries', 'extractionProcessCount',
+                   str(processCount))
+
+        mpasTimeSeriesTask = MpasTimeSeriesTask(config=config,
+                                                componentName='ocean')
+        if variableLists is None:
+            variableLists = [['timeMonthly_avg_ssh',
+                              'timeMonthly_avg_tThreshMLD']]
+        for variableList in variableLists:
+            mpasTimeSeriesTask.add_variables(variableList)
+        mpasTimeSeriesTask.setup_and_check()
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+        return mpasTimeSeriesTask
+
+    def check_output(self, mpasTimeSeriesTask):
+        inputFiles = mpasTimeSeriesTask.inputFiles
+        catalog = read_catalog(mpasTimeSeriesTask.outputFile)
+        stores = mpasTimeSeriesTask.get_stores()
+        assert(len(catalog) == len(stores))
+        for storeName, variableList in stores.items():
+            storeFileName = mpasTimeSeriesTask.get_store_file_name(storeName)
+            assert(catalog[storeFileName] == variableList)
+            with xarray.open_dataset(storeFileName) as dsOut:
+                assert(dsOut.sizes['Time'] == len(inputFiles))
+                for index, fileName in enumerate(inputFiles):
+                    with xarray.open_dataset(fileName) as dsIn:
+                        for variableName in variableList + \
+                                ['xtime_startMonthly', 'xtime_endMonthly']:
+                            assert(numpy.all(
+                                dsOut[variableName][index].values ==
+                                dsIn[variableName][0].values))
+
+    def test_run_analysis_python(self):
+        mpasTimeSeriesTask = self.setup_task(processCount=2)
+        assert(mpasTimeSeriesTask.cpuCount == 2)
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+
+    def test_run_analysis_python_launcher(self):
+        # the extractor starts a pool of processes from within the task's own
+        # process, as it does when tasks run in parallel
+        mpasTimeSeriesTask = self.setup_task(processCount=2)
+        assert(not mpasTimeSeriesTask.daemon)
+
+        launcher = ProcessLauncher()
+        completionQueue = Queue()
+        launcher.launch(mpasTimeSeriesTask, completionQueue)
+        assert(completionQueue.get() == (mpasTimeSeriesTask.taskName, None))
+        assert(launcher.join(mpasTimeSeriesTask) == 0)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+
+    def test_run_analysis_python_stores(self):
+        variableLists = [['timeMonthly_avg_tThreshMLD',
+                          'timeMonthly_avg_ssh'],
+                         ['timeMonthly_avg_ssh']]
+        # each variable is stored once, with the first group (in alphabetical
+        # order) that contains it, regardless of the order the groups were
+        # added in
+        for groupOrder in [variableLists, variableLists[::-1]]:
+            mpasTimeSeriesTask = self.setup_task(variableLists=groupOrder)
+            assert(mpasTimeSeriesTask.get_stores() ==
+                   {'timeMonthly_avg_ssh': ['timeMonthly_avg_ssh'],
+                    'timeMonthly_avg_tThreshMLD':
+                        ['timeMonthly_avg_tThreshMLD']})
+        assert(mpasTimeSeriesTask.get_output_files()[1:] ==
+               [mpasTimeSeriesTask.get_store_file_name(storeName) for
+                storeName in ['timeMonthly_avg_ssh',
+                              'timeMonthly_avg_tThreshMLD']])
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+
+        # reading one variable only opens its own store
+        ds = open_mpas_dataset(fileName=mpasTimeSeriesTask.outputFile,
+                               calendar=mpasTimeSeriesTask.calendar,
+                               variableList=['timeMonthly_avg_tThreshMLD'])
+        assert(ds.data_vars.keys() == ['timeMonthly_avg_tThreshMLD'])
+        assert(ds.sizes['Time'] == len(mpasTimeSeriesTask.inputFiles))
+
+        ds = open_mpas_dataset(fileName=mpasTimeSeriesTask.outputFile,
+                               calendar=mpasTimeSeriesTask.calendar,
+                               variableList=mpasTimeSeriesTask.variableList)
+        assert(sorted(ds.data_vars.keys()) ==
+               sorted(mpasTimeSeriesTask.variableList))
+
+    def test_run_analysis_regional_reduction(self):
+        mpasTimeSeriesTask = self.setup_task(processCount=2,
+                                             variableLists=[])
+        restartFileName = '{}/mpaso.rst.0001-01-06_00000.nc'.format(
+            self.datadir)
+        with xarray.open_dataset(restartFileName) as dsMesh:
+            dsMesh.load()
+        masks = numpy.array([dsMesh.latCell.values > 0,
+                             dsMesh.latCell.values < 0], 'i4').T
+        maskFileName = '{}/masks.nc'.format(self.test_dir)
+        dsMask = xarray.Dataset()
+        dsMask['regionCellMasks'] = (('nCells', 'nRegions'), masks)
+        dsMask.to_netcdf(maskFileName)
+
+        for operation in ['sum', 'mean']:
+            mpasTimeSeriesTask.add_regional_reduction(
+                reductionName='ssh_{}'.format(operation),
+                variables={'ssh{}'.format(operation.title()):
+                           'timeMonthly_avg_ssh'},
+                maskFileName=maskFileName, meshFileName=restartFileName,
+                operation=operation)
+
+        with self.assertRaises(ValueError):
+            mpasTimeSeriesTask.add_regional_reduction(
+                reductionName='duplicate',
+                variables={'sshSum': 'timeMonthly_avg_ssh'},
+                maskFileName=maskFileName, meshFileName=restartFileName)
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+
+        ds = open_mpas_dataset(fileName=mpasTimeSeriesTask.outputFile,
+                               calendar=mpasTimeSeriesTask.calendar,
+                               variableList=['sshSum', 'sshMean'])
+        # only the reductions are stored
+        with xarray.open_dataset(mpasTimeSeriesTask.get_store_file_name(
+                'ssh_sum')) as dsStore:
+            assert(dsStore.sshSum.dims == ('Time', 'nRegions'))
+            assert('timeMonthly_avg_ssh' not in dsStore)
+
+        inputFiles = mpasTimeSeriesTask.inputFiles
+        assert(ds.sshSum.shape == (len(inputFiles), 2))
+        for index, fileName in enumerate(inputFiles):
+            with xarray.open_dataset(fileName) as dsIn:
+                ssh = dsIn.timeMonthly_avg_ssh[0].values
+            for region in range(2):
+                weights = masks[:, region]*dsMesh.areaCell.values
+                self.assertApproxEqual(ds.sshSum[index, region].values,
+                                       numpy.sum(weights*ssh))
+                self.assertApproxEqual(ds.sshMean[index, region].values,
+                                       numpy.sum(weights*ssh) /
+                                       numpy.sum(weights))
+
+        # the reduction is computed again if the mesh file changes
+        storeFileName = mpasTimeSeriesTask.get_store_file_name('ssh_sum')
+        with xarray.open_dataset(storeFileName) as dsStore:
+            assert(dsStore.attrs['meshFile'] == restartFileName)
+        with netCDF4.Dataset(storeFileName, 'a') as ncFile:
+            ncFile.setncattr('computedBefore', 'True')
+        meshTime = os.path.getmtime(storeFileName) + 10.
+        os.utime(restartFileName, (meshTime, meshTime))
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        with xarray.open_dataset(storeFileName) as dsStore:
+            assert('computedBefore' not in dsStore.attrs)
+            assert(dsStore.sizes['Time'] == len(inputFiles))
+
+    def test_run_analysis_python_append(self):
+        mpasTimeSeriesTask = self.setup_task()
+        inputFiles = mpasTimeSeriesTask.inputFiles
+
+        # extract the first months, as if from an earlier run
+        storeFileNames = []
+        for storeName, variableList in \
+                mpasTimeSeriesTask.get_stores().items():
+            storeFileName = mpasTimeSeriesTask.get_store_file_name(storeName)
+            extract_time_series(inputFiles[0:5],
+                                variableList + ['xtime_startMonthly',
+                                                'xtime_endMonthly'],
+                                storeFileName)
+            assert(mpasTimeSeriesTask._get_new_input_files(storeFileName) ==
+                   inputFiles[5:])
+            storeFileNames.append(storeFileName)
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        self.check_output(mpasTimeSeriesTask)
+        for storeFileName in storeFileNames:
+            assert(mpasTimeSeriesTask._get_new_input_files(storeFileName) ==
+                   [])
+
+    def test_run_analysis_python_resume(self):
+        mpasTimeSeriesTask = self.setup_task()
+        inputFiles = mpasTimeSeriesTask.inputFiles
+
+        # extract the first months, then remove the times of the last few,
+        # as if the run was interrupted before the times of a batch were
+        # written
+        for storeName, variableList in \
+                mpasTimeSeriesTask.get_stores().items():
+            storeFileName = mpasTimeSeriesTask.get_store_file_name(storeName)
+            extract_time_series(inputFiles[0:8],
+                                variableList + ['xtime_startMonthly',
+                                                'xtime_endMonthly'],
+                                storeFileName)
+            with netCDF4.Dataset(storeFileName, 'a') as ncFile:
+                ncVariable = ncFile.variables['xtime_startMonthly']
+                ncVariable.set_auto_chartostring(False)
+                ncVariable[5:8] = numpy.zeros(ncVariable[5:8].shape, 'S1')
+            assert(mpasTimeSeriesTask._get_new_input_files(storeFileName) ==
+                   inputFiles[5:])
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+
+    def test_run_analysis_python_backfill(self):
+        mpasTimeSeriesTask = self.setup_task()
+        inputFiles = mpasTimeSeriesTask.inputFiles
+
+        # extract the first months of only the first variable of the group,
+        # as if the task requested fewer variables in an earlier run
+        storeFileName = mpasTimeSeriesTask.get_store_file_name(
+            'timeMonthly_avg_ssh')
+        extract_time_series(inputFiles[0:5],
+                            ['timeMonthly_avg_ssh', 'xtime_startMonthly',
+                             'xtime_endMonthly'],
+                            storeFileName)
+        assert(mpasTimeSeriesTask._get_missing_variables(
+            storeFileName, mpasTimeSeriesTask.variableList) ==
+            ['timeMonthly_avg_tThreshMLD'])
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+
+    def test_run_analysis_python_backfill_added_variable(self):
+        # a run in which the task only requested the first variable of its
+        # group
+        mpasTimeSeriesTask = self.setup_task(
+            variableLists=[['timeMonthly_avg_ssh']])
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        storeFileName = mpasTimeSeriesTask.get_store_file_name(
+            'timeMonthly_avg_ssh')
+
+        # change a value of the variable that was already extracted, so we
+        # can tell that it is kept rather than extracted again
+        with netCDF4.Dataset(storeFileName, 'a') as ncFile:
+            ncFile.variables['timeMonthly_avg_ssh'][0, 0] = 1e6
+
+        # the task now requests another variable, which is backfilled into
+        # the same store
+        mpasTimeSeriesTask = self.setup_task()
+        assert(mpasTimeSeriesTask._get_missing_variables(
+            storeFileName, mpasTimeSeriesTask.variableList) ==
+            ['timeMonthly_avg_tThreshMLD'])
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+
+        assert(read_catalog(mpasTimeSeriesTask.outputFile) ==
+               {storeFileName: ['timeMonthly_avg_ssh',
+                                'timeMonthly_avg_tThreshMLD']})
+        with xarray.open_dataset(storeFileName) as dsOut:
+            assert(dsOut.timeMonthly_avg_ssh[0, 0].values == 1e6)
+            for index, fileName in enumerate(mpasTimeSeriesTask.inputFiles):
+                with xarray.open_dataset(fileName) as dsIn:
+                    assert(numpy.all(
+                        dsOut.timeMonthly_avg_tThreshMLD[index].values ==
+                        dsIn.timeMonthly_avg_tThreshMLD[0].values))
+        assert(get_incomplete_variables(storeFileName) == [])
+
+    def test_run_analysis_python_backfill_interrupted(self):
+        mpasTimeSeriesTask = self.setup_task()
+        inputFiles = mpasTimeSeriesTask.inputFiles
+        variable = 'timeMonthly_avg_tThreshMLD'
+        storeFileName = mpasTimeSeriesTask.get_store_file_name(
+            'timeMonthly_avg_ssh')
+
+        # backfill the variable, then mark it as incomplete and remove some
+        # of its records, as if the backfill had been interrupted
+        extract_time_series(inputFiles[0:5],
+                            ['timeMonthly_avg_ssh', 'xtime_startMonthly',
+                             'xtime_endMonthly'],
+                            storeFileName)
+        backfill_time_series(inputFiles, [variable], storeFileName)
+        assert(get_incomplete_variables(storeFileName) == [])
+        with netCDF4.Dataset(storeFileName, 'a') as ncFile:
+            ncFile.incompleteVariables = variable
+            ncVariable = ncFile.variables[variable]
+            ncVariable[3:5] = numpy.nan
+        assert(mpasTimeSeriesTask._get_missing_variables(
+            storeFileName, [variable]) == [variable])
+
+        mpasTimeSeriesTask.run(writeLogFile=False)
+        assert(mpasTimeSeriesTask._runStatus.value ==
+               mpasTimeSeriesTask.SUCCESS)
+        self.check_output(mpasTimeSeriesTask)
+        assert(get_incomplete_variables(storeFileName) == [])
+
+    def test_backfill_missing_input(self):
+        mpasTimeSeriesTask = self.setup_task()
+        inputFiles = mpasTimeSeriesTask.inputFiles
+        outFileName = mpasTimeSeriesTask.get_store_file_name(
+            'timeMonthly_avg_ssh')
+
+        extract_time_series(inputFiles, ['timeMonthly_avg_ssh',
+                                         'xtime_startMonthly'],
+                            outFileName)
+
+        # the first month is no longer available, so the time series can't
+        # be backfilled and should be left unchanged
+        with self.assertRaises(IOError):
+            backfill_time_series(inputFiles[1:],
+                                 ['timeMonthly_avg_tThreshMLD'],
+                                 outFileName)
+        with xarray.open_dataset(outFileName) as ds:
+            assert('timeMonthly_avg_tThreshMLD' not in ds.data_vars)
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
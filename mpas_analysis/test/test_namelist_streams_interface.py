@@ -7,8 +7,10 @@ Phillip J. Wolfram, Xylar Asay-Davis
 """
 
 import pytest
+import os
 from mpas_analysis.test import TestCase, loaddatadir
-from mpas_analysis.shared.io import NameList, StreamsFile
+from mpas_analysis.shared.io import NameList, StreamsFile, get_namelist, \
+    get_streams_file
 
 
 @pytest.mark.usefixtures("loaddatadir")
@@ -105,4 +107,32 @@ class TestNamelist(TestCase):
         expectedFiles = ['{}/mesh.nc'.format(self.sf.streamsdir)]
         self.assertEqual(files, expectedFiles)
 
+    def test_shared_streams_file(self):
+        sfpath = bytes(self.datadir.join('streams.ocean'))
+        nlpath = bytes(self.datadir.join('namelist.ocean'))
+
+        # the same file is only parsed once
+        self.assertIs(get_namelist(nlpath), get_namelist(nlpath))
+        sf = get_streams_file(sfpath)
+        self.assertIs(get_streams_file(sfpath), sf)
+        self.assertIsNot(get_streams_file(sfpath, streamsdir='/'), sf)
+
+        kwargs = {'startDate': '0001-01-02', 'calendar': 'gregorian_noleap'}
+        expectedFiles = ['{}/output/output.{}_00.00.00.nc'.format(
+            sf.streamsdir, date) for date in ['0001-01-02', '0001-02-01',
+                                              '0002-01-01']]
+        for attempt in range(2):
+            self.assertEqual(sf.readpath('output', **kwargs), expectedFiles)
+
+        # a new file shows up once its directory has been modified
+        outputDirectory = '{}/output'.format(sf.streamsdir)
+        newFileName = '{}/output.0003-01-01_00.00.00.nc'.format(
+            outputDirectory)
+        open(newFileName, 'w').close()
+        os.utime(outputDirectory,
+                 (0, os.path.getmtime(outputDirectory) + 10.))
+        self.assertEqual(sf.readpath('output', **kwargs),
+                         expectedFiles + [newFileName])
+
+
 # vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
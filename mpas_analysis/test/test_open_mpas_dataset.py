@@ -6,8 +6,10 @@ Xylar Asay-Davis
 """
 
 import pytest
+import xarray
 from mpas_analysis.test import TestCase, loaddatadir
 from mpas_analysis.shared.io import open_mpas_dataset
+from mpas_analysis.shared.io.catalog import write_catalog
 
 
 @pytest.mark.usefixtures("loaddatadir")
@@ -73,4 +75,41 @@ class TestOpenMpasDataset(TestCase):
             timeVariableNames=['xtime_startMonthly', 'xtime_endMonthly'],
             variableList=['timeMonthly_avg_tThreshMLD'])
 
+    def test_open_catalog_different_times(self):
+        fileName = str(self.datadir.join('timeSeries.nc'))
+        calendar = 'gregorian_noleap'
+        timeVariableNames = ['xtime_startMonthly', 'xtime_endMonthly']
+        with xarray.open_dataset(fileName) as ds:
+            ds = ds[['timeMonthly_avg_tThreshMLD'] +
+                    timeVariableNames].load()
+        timeCount = ds.sizes['Time']
+
+        # the second store is missing the first record, as if it were added
+        # after the time series was first extracted
+        fullFileName = str(self.datadir.join('full.nc'))
+        ds.to_netcdf(fullFileName)
+        partialFileName = str(self.datadir.join('partial.nc'))
+        ds.rename({'timeMonthly_avg_tThreshMLD': 'mld'}).isel(
+            Time=slice(1, None)).to_netcdf(partialFileName)
+
+        catalogFileName = str(self.datadir.join('timeSeries.json'))
+        write_catalog(catalogFileName,
+                      {fullFileName: ['timeMonthly_avg_tThreshMLD'],
+                       partialFileName: ['mld']})
+
+        dsFull = open_mpas_dataset(
+            fileName=catalogFileName, calendar=calendar,
+            timeVariableNames=timeVariableNames,
+            variableList=['timeMonthly_avg_tThreshMLD'])
+        self.assertEqual(len(dsFull.Time), timeCount)
+
+        dsBoth = open_mpas_dataset(
+            fileName=catalogFileName, calendar=calendar,
+            timeVariableNames=timeVariableNames,
+            variableList=['timeMonthly_avg_tThreshMLD', 'mld'])
+        self.assertEqual(len(dsBoth.Time), timeCount-1)
+        self.assertArrayEqual(dsBoth.Time.values, dsFull.Time.values[1:])
+        self.assertArrayEqual(dsBoth.mld.values,
+                              dsBoth.timeMonthly_avg_tThreshMLD.values)
+
 # vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
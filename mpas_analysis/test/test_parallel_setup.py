@@ -0,0 +1,116 @@
+"""
+Unit tests for setting up analysis tasks in several threads at once
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import time
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.shared import AnalysisTask
+from mpas_analysis.shared.scheduler import setup_task, \
+    setup_tasks_in_parallel
+from mpas_analysis.configuration import MpasAnalysisConfigParser
+
+
+class SetupRecordingTask(AnalysisTask):
+    '''
+    A task that records when its setup starts and finishes and optionally
+    fails during setup
+    '''
+
+    def __init__(self, config, taskName, record, subtaskName=None,
+                 fail=False):
+        super(SetupRecordingTask, self).__init__(config=config,
+                                                 taskName=taskName,
+                                                 componentName='ocean',
+                                                 subtaskName=subtaskName)
+        self.record = record
+        self.fail = fail
+        self.setupCount = 0
+
+    def setup_and_check(self):
+        self.setupCount += 1
+        self.record.append(('start', self.fullTaskName))
+        time.sleep(0.1)
+        if self.fail:
+            raise ValueError('setup of {} failed on purpose'.format(
+                self.fullTaskName))
+        self.record.append(('end', self.fullTaskName))
+
+    def check_generate(self):
+        # only tasks that aren't subtasks or prerequisites are requested
+        return self.taskName.startswith('requested')
+
+
+class TestParallelSetup(TestCase):
+
+    def setup_tasks(self, failingTasks=[]):
+        config = MpasAnalysisConfigParser()
+        self.record = []
+
+        def make_task(taskName, subtaskName=None):
+            task = SetupRecordingTask(config, taskName, self.record,
+                                      subtaskName=subtaskName,
+                                      fail=(taskName in failingTasks))
+            return task
+
+        # two requested tasks share a prerequisite, and each has a subtask
+        prereq = make_task('prereq')
+        tasks = []
+        for index in range(2):
+            taskName = 'requested{}'.format(index)
+            task = make_task(taskName)
+            task.run_after(prereq)
+            task.add_subtask(make_task(taskName, subtaskName='sub'))
+            tasks.append(task)
+        # and one is independent
+        tasks.append(make_task('requestedIndependent'))
+
+        return [prereq] + tasks
+
+    def check_before(self, firstTaskName, secondTaskName):
+        assert(self.record.index(('end', firstTaskName)) <
+               self.record.index(('start', secondTaskName)))
+
+    def test_parallel_setup(self):
+        analyses = self.setup_tasks()
+        setup_tasks_in_parallel(analyses, threadCount=3)
+
+        for analysisTask in analyses:
+            assert(analysisTask.setupCount == 1)
+            assert(analysisTask._setupError is None)
+            for subtask in analysisTask.subtasks:
+                assert(subtask.setupCount == 1)
+
+        self.check_before('prereq', 'requested0')
+        self.check_before('prereq', 'requested1')
+        self.check_before('requested0', 'requested0_sub')
+        self.check_before('requested1', 'requested1_sub')
+
+        # the independent task was set up alongside the prerequisite
+        assert(self.record.index(('start', 'requestedIndependent')) <
+               self.record.index(('end', 'prereq')))
+
+        # later calls don't set up the task again
+        assert(setup_task(analyses[1]))
+        assert(analyses[1].setupCount == 1)
+
+    def test_failed_prerequisite(self):
+        analyses = self.setup_tasks(failingTasks=['prereq'])
+        setup_tasks_in_parallel(analyses, threadCount=3)
+
+        prereq = analyses[0]
+        assert(prereq.setupCount == 1)
+        assert('failed on purpose' in prereq._setupError)
+        assert(not setup_task(prereq))
+
+        # tasks that depend on the failed task are never set up
+        for analysisTask in analyses[1:3]:
+            assert(analysisTask.setupCount == 0)
+            assert(analysisTask.subtasks[0].setupCount == 0)
+        assert(analyses[3].setupCount == 1)
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
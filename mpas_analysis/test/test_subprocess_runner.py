@@ -0,0 +1,140 @@
+"""
+Unit tests for running external commands
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import os
+import sys
+import time
+import shutil
+import tempfile
+import signal
+import logging
+import subprocess
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.shared.subprocess_runner import run_command
+from mpas_analysis.shared.resource_usage import ResourceMonitor
+
+
+class ListHandler(logging.Handler):
+    """
+    A logging handler that keeps the messages and the times they were
+    logged
+    """
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((time.time(), record.levelno,
+                             record.getMessage()))
+
+
+class TestSubprocessRunner(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_subprocess_runner')
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def get_messages(self, level):
+        return [message for logTime, levelno, message in
+                self.handler.records if levelno == level]
+
+    def test_streaming(self):
+        script = 'import sys, time\n' \
+                 'print "first"\n' \
+                 'sys.stdout.flush()\n' \
+                 'time.sleep(1.)\n' \
+                 'sys.stderr.write("warning\\n")\n' \
+                 'print "second"\n'
+        startTime = time.time()
+        result = run_command([sys.executable, '-c', script],
+                             logger=self.logger)
+        assert(result.returncode == 0)
+        assert(result.wallTime >= 1.)
+        assert(result.peakMemory is None or result.peakMemory > 0.)
+
+        infoMessages = self.get_messages(logging.INFO)
+        assert('first' in infoMessages)
+        assert('second' in infoMessages)
+        assert(self.get_messages(logging.ERROR) == ['warning'])
+
+        # the first line was logged while the command was still running
+        firstTime = [logTime for logTime, levelno, message in
+                     self.handler.records if message == 'first'][0]
+        assert(firstTime - startTime < result.wallTime)
+
+    def test_discard_stdout(self):
+        run_command(['echo', 'verbose'], logger=self.logger,
+                    logStdout=False)
+        assert('verbose' not in self.get_messages(logging.INFO))
+
+    def test_failure(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_command([sys.executable, '-c', 'import sys; sys.exit(3)'],
+                        logger=self.logger)
+
+    def test_cancel(self):
+        class Interrupt(Exception):
+            pass
+
+        def handler(signum, frame):
+            raise Interrupt()
+
+        previousHandler = signal.signal(signal.SIGALRM, handler)
+        signal.alarm(1)
+        startTime = time.time()
+        try:
+            with self.assertRaises(Interrupt):
+                # a shell that starts a long-running child of its own
+                run_command(['sh', '-c', 'sleep 30; echo done'],
+                            logger=self.logger)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previousHandler)
+
+        # the command was stopped, rather than waited for
+        assert(time.time() - startTime < 10.)
+        assert('done' not in self.get_messages(logging.INFO))
+
+    def test_child_peak_memory(self):
+        # the command uses far more memory than this process
+        monitor = ResourceMonitor()
+        script = 'data = bytearray(500*1024**2)\n'
+        result = run_command([sys.executable, '-c', script],
+                             logger=self.logger)
+        usage = monitor.stop()
+        assert(result.peakMemory is None or result.peakMemory > 0.45)
+        assert(usage['peakMemory'] > 0.45)
+
+    def test_tool_time(self):
+        # the wall-clock time of each command is added up by tool
+        tempDirectory = tempfile.mkdtemp()
+        try:
+            toolName = '{}/ncrcat'.format(tempDirectory)
+            with open(toolName, 'w') as toolFile:
+                toolFile.write('#!/bin/sh\nsleep 0.5\n')
+            os.chmod(toolName, 0o755)
+
+            monitor = ResourceMonitor()
+            run_command([toolName], logger=self.logger)
+            run_command([toolName], logger=self.logger)
+            run_command(['sleep', '0.5'], logger=self.logger)
+            usage = monitor.stop()
+        finally:
+            shutil.rmtree(tempDirectory)
+
+        assert(usage['ncrcatTime'] >= 1.)
+        assert(usage['otherToolTime'] >= 0.5)
+        assert(usage['otherToolTime'] < 1.)
+        assert(usage['ncclimoTime'] == 0.)
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
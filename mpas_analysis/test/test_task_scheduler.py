@@ -0,0 +1,552 @@
+"""
+Unit tests for the TaskScheduler used to run analysis tasks
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import tempfile
+import shutil
+import os
+import json
+import time
+import sys
+from collections import OrderedDict
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.shared import AnalysisTask
+from mpas_analysis.shared.scheduler import TaskScheduler, PoolLauncher, \
+    CommandLauncher
+from mpas_analysis.shared.scheduler.critical_path import \
+    compute_priorities, get_critical_path, predict_makespan
+from mpas_analysis.shared.scheduler.performance_report import \
+    read_performance_report
+from mpas_analysis.shared.scheduler.run_state import RunState
+from mpas_analysis.shared.trace import trace_phase
+from mpas_analysis.configuration import MpasAnalysisConfigParser
+from mpas_analysis.shared.io.utility import build_config_full_path, \
+    make_directories
+
+
+class RecordingTask(AnalysisTask):
+    '''
+    A task that appends its name to a file when it runs and optionally fails
+    '''
+
+    def __init__(self, config, taskName, recordFileName, fail=False):
+        super(RecordingTask, self).__init__(config=config,
+                                            taskName=taskName,
+                                            componentName='ocean')
+        self.recordFileName = recordFileName
+        self.fail = fail
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        self._logFileName = '{}/{}.log'.format(logsDirectory,
+                                               self.fullTaskName)
+
+    def run_task(self):
+        if self.fail:
+            raise ValueError('task {} failed on purpose'.format(
+                self.taskName))
+        with open(self.recordFileName, 'a') as recordFile:
+            recordFile.write('{}\n'.format(self.taskName))
+
+
+class SleepingTask(RecordingTask):
+    '''
+    A task that records when it starts and finishes, sleeping in between
+    '''
+
+    def run_task(self):
+        with open(self.recordFileName, 'a') as recordFile:
+            recordFile.write('start {}\n'.format(self.taskName))
+        time.sleep(0.5)
+        with open(self.recordFileName, 'a') as recordFile:
+            recordFile.write('end {}\n'.format(self.taskName))
+
+
+class PidTask(RecordingTask):
+    '''
+    A task that records its name and the ID of the process it runs in, or
+    exits abruptly
+    '''
+
+    def run_task(self):
+        if self.fail:
+            # simulate a crash that the task can't catch
+            os._exit(3)
+        with open(self.recordFileName, 'a') as recordFile:
+            recordFile.write('{} {}\n'.format(self.taskName, os.getpid()))
+
+
+class PhasedTask(RecordingTask):
+    '''
+    A task with a ``compute`` phase and a ``plot`` phase
+    '''
+
+    def run_task(self):
+        with trace_phase('compute'):
+            time.sleep(0.2)
+        with trace_phase('plot'):
+            time.sleep(0.1)
+
+
+class RecordingLauncher(object):
+    '''
+    A launcher that records the names of the tasks it is asked to launch
+    without running them
+    '''
+
+    def __init__(self):
+        self.launched = []
+
+    def launch(self, analysisTask, completionQueue):
+        self.launched.append(analysisTask.taskName)
+
+
+# a stand-in for ``run_mpas_analysis --run-task`` that records the task name
+# and fails for tasks named in the arguments
+runTaskScript = '''
+import sys
+recordFileName, failingTasks, taskName = sys.argv[1:]
+if taskName in failingTasks.split(','):
+    print('task {} failed on purpose'.format(taskName))
+    sys.exit(1)
+with open(recordFileName, 'a') as recordFile:
+    recordFile.write('{}\\n'.format(taskName))
+'''
+
+
+class TestTaskScheduler(TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        self.recordFileName = '{}/record.txt'.format(self.test_dir)
+
+    def tearDown(self):
+        # Remove the directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def setup_config(self, parallelTaskCount, maxMemory=0.):
+        config = MpasAnalysisConfigParser()
+        config.add_section('execute')
+        config.set('execute', 'parallelTaskCount', str(parallelTaskCount))
+        config.set('execute', 'maxMemory', str(maxMemory))
+        config.add_section('output')
+        config.set('output', 'baseDirectory', self.test_dir)
+        config.set('output', 'logsSubdirectory', 'logs')
+        config.add_section('plot')
+        config.set('plot', 'displayToScreen', 'False')
+
+        logsDirectory = build_config_full_path(config, 'output',
+                                               'logsSubdirectory')
+        make_directories('{}/configs/'.format(logsDirectory))
+        return config
+
+    def setup_tasks(self, config, failingTasks=[]):
+        '''
+        Make a diamond of tasks: ``first`` must run before ``left`` and
+        ``right``, which must run before ``last``.  ``other`` is independent.
+        '''
+        tasks = OrderedDict()
+        for taskName in ['last', 'left', 'right', 'first', 'other']:
+            tasks[(taskName, None)] = RecordingTask(
+                config, taskName, self.recordFileName,
+                fail=(taskName in failingTasks))
+
+        tasks[('left', None)].run_after(tasks[('first', None)])
+        tasks[('right', None)].run_after(tasks[('first', None)])
+        tasks[('last', None)].run_after(tasks[('left', None)])
+        tasks[('last', None)].run_after(tasks[('right', None)])
+        return tasks
+
+    def read_record(self):
+        if not os.path.exists(self.recordFileName):
+            return []
+        with open(self.recordFileName) as recordFile:
+            return [line.strip() for line in recordFile.readlines()]
+
+    def check_order(self, record):
+        assert(set(record) == set(['first', 'left', 'right', 'last',
+                                   'other']))
+        assert(record.index('first') < record.index('left'))
+        assert(record.index('first') < record.index('right'))
+        assert(record.index('left') < record.index('last'))
+        assert(record.index('right') < record.index('last'))
+
+    def test_serial(self):
+        config = self.setup_config(parallelTaskCount=1)
+        tasks = self.setup_tasks(config)
+
+        scheduler = TaskScheduler(config, tasks)
+        assert(not scheduler.isParallel)
+        tasksWithErrors = scheduler.run()
+
+        assert(tasksWithErrors == [])
+        self.check_order(self.read_record())
+        for analysisTask in tasks.values():
+            assert(analysisTask._runStatus.value == AnalysisTask.SUCCESS)
+
+    def test_parallel(self):
+        config = self.setup_config(parallelTaskCount=2)
+        tasks = self.setup_tasks(config)
+
+        scheduler = TaskScheduler(config, tasks)
+        assert(scheduler.isParallel)
+        tasksWithErrors = scheduler.run()
+
+        assert(tasksWithErrors == [])
+        self.check_order(self.read_record())
+        for analysisTask in tasks.values():
+            assert(analysisTask._runStatus.value == AnalysisTask.SUCCESS)
+
+    def test_failed_prerequisite(self):
+        for parallelTaskCount in [1, 3]:
+            if os.path.exists(self.recordFileName):
+                os.remove(self.recordFileName)
+            config = self.setup_config(parallelTaskCount=parallelTaskCount)
+            tasks = self.setup_tasks(config, failingTasks=['left'])
+
+            scheduler = TaskScheduler(config, tasks, force=True)
+            tasksWithErrors = scheduler.run()
+
+            # only the task that actually failed is reported, but the task
+            # that depends on it also fails without being run
+            assert(tasksWithErrors == ['left'])
+            record = self.read_record()
+            assert(set(record) == set(['first', 'right', 'other']))
+            assert(tasks[('left', None)]._runStatus.value ==
+                   AnalysisTask.FAIL)
+            assert(tasks[('last', None)]._runStatus.value ==
+                   AnalysisTask.FAIL)
+            assert(tasks[('other', None)]._runStatus.value ==
+                   AnalysisTask.SUCCESS)
+
+    def test_critical_path(self):
+        durations = OrderedDict([('first', 1.), ('left', 5.), ('right', 2.),
+                                 ('last', 1.), ('other', 4.)])
+        dependents = {'first': ['left', 'right'], 'left': ['last'],
+                      'right': ['last'], 'last': [], 'other': []}
+        prereqCounts = {'first': 0, 'left': 1, 'right': 1, 'last': 2,
+                        'other': 0}
+
+        priorities = compute_priorities(durations, dependents)
+        assert(priorities == {'first': 7., 'left': 6., 'right': 3.,
+                              'last': 1., 'other': 4.})
+
+        criticalPath = get_critical_path(priorities, durations, dependents)
+        assert(criticalPath == ['first', 'left', 'last'])
+
+        # in serial, the makespan is the sum of all durations
+        makespan = predict_makespan(durations, dependents, prereqCounts,
+                                    priorities, taskCount=1)
+        self.assertApproxEqual(makespan, 13.)
+
+        # with 2 slots, 'other' fits alongside the critical path, so the
+        # makespan is the length of the critical path
+        makespan = predict_makespan(durations, dependents, prereqCounts,
+                                    priorities, taskCount=2)
+        self.assertApproxEqual(makespan, 7.)
+
+    def test_priority_from_history(self):
+        config = self.setup_config(parallelTaskCount=1)
+        tasks = self.setup_tasks(config)
+
+        # 'other' took much longer than the diamond of tasks in a previous
+        # run, so it should run first
+        historyFileName = '{}/logs/task_history.json'.format(self.test_dir)
+        with open(historyFileName, 'w') as historyFile:
+            json.dump({'first': {'runDuration': 1.},
+                       'left': {'runDuration': 1.},
+                       'right': {'runDuration': 1.},
+                       'last': {'runDuration': 1.},
+                       'other': {'runDuration': 100.}}, historyFile)
+
+        scheduler = TaskScheduler(config, tasks)
+        scheduler.run()
+
+        record = self.read_record()
+        self.check_order(record)
+        assert(record[0] == 'other')
+
+        # the history should have been updated with the new durations
+        with open(historyFileName) as historyFile:
+            history = json.load(historyFile)
+        assert(history['other']['runDuration'] < 100.)
+        assert(history['other']['peakMemory'] > 0.)
+
+    def test_command_launcher(self):
+        scriptFileName = '{}/run_task.py'.format(self.test_dir)
+        with open(scriptFileName, 'w') as scriptFile:
+            scriptFile.write(runTaskScript)
+
+        for failingTasks in [[], ['left']]:
+            if os.path.exists(self.recordFileName):
+                os.remove(self.recordFileName)
+            config = self.setup_config(parallelTaskCount=2)
+            tasks = self.setup_tasks(config)
+            launcher = CommandLauncher([sys.executable, scriptFileName,
+                                        self.recordFileName,
+                                        ','.join(failingTasks)])
+
+            scheduler = TaskScheduler(config, tasks, launcher=launcher,
+                                      force=True)
+            tasksWithErrors = scheduler.run()
+
+            record = self.read_record()
+            if len(failingTasks) == 0:
+                assert(tasksWithErrors == [])
+                self.check_order(record)
+            else:
+                assert(tasksWithErrors == ['left'])
+                assert(set(record) == set(['first', 'right', 'other']))
+                assert(tasks[('last', None)]._runStatus.value ==
+                       AnalysisTask.FAIL)
+
+                # the output of the command goes to its own file, which the
+                # log file points to
+                logFileName = tasks[('left', None)]._logFileName
+                outFileName = '{}.out'.format(os.path.splitext(
+                    logFileName)[0])
+                with open(outFileName) as outFile:
+                    output = outFile.read()
+                assert(output.startswith('Command: '))
+                assert('task left failed on purpose' in output)
+                with open(logFileName) as logFile:
+                    log = logFile.read()
+                assert(outFileName in log)
+
+    def test_pool_launcher(self):
+        config = self.setup_config(parallelTaskCount=2)
+        tasks = OrderedDict()
+        for index in range(6):
+            taskName = 'task{}'.format(index)
+            tasks[(taskName, None)] = PidTask(config, taskName,
+                                              self.recordFileName,
+                                              fail=(taskName == 'task2'))
+        tasks[('task5', None)].run_after(tasks[('task2', None)])
+
+        launcher = PoolLauncher(tasks, workerCount=2)
+        scheduler = TaskScheduler(config, tasks, launcher=launcher)
+        tasksWithErrors = scheduler.run()
+
+        # the crashed worker was replaced, so the remaining tasks still ran
+        assert(tasksWithErrors == ['task2'])
+        record = [line.split() for line in self.read_record()]
+        assert(sorted([taskName for taskName, pid in record]) ==
+               ['task0', 'task1', 'task3', 'task4'])
+        assert(tasks[('task5', None)]._runStatus.value == AnalysisTask.FAIL)
+
+        # tasks ran in (at most) 3 workers: the original 2 and the
+        # replacement, not in a new process for each task
+        assert(len(set([pid for taskName, pid in record])) <= 3)
+
+    def test_skip_unchanged(self):
+        config = self.setup_config(parallelTaskCount=2)
+        scheduler = TaskScheduler(config, self.setup_tasks(config))
+        scheduler.run()
+        self.check_order(self.read_record())
+        os.remove(self.recordFileName)
+
+        # nothing has changed, so no tasks run
+        tasks = self.setup_tasks(config)
+        scheduler = TaskScheduler(config, tasks)
+        tasksWithErrors = scheduler.run()
+        assert(tasksWithErrors == [])
+        assert(self.read_record() == [])
+        for analysisTask in tasks.values():
+            assert(analysisTask._runStatus.value == AnalysisTask.SUCCESS)
+
+        # changing a config option in the section for 'left' means it and
+        # the task that depends on it run again
+        config.add_section('left')
+        config.set('left', 'option', 'value')
+        scheduler = TaskScheduler(config, self.setup_tasks(config))
+        scheduler.run()
+        assert(sorted(self.read_record()) == ['last', 'left'])
+        os.remove(self.recordFileName)
+
+        # forcing all tasks to run
+        scheduler = TaskScheduler(config, self.setup_tasks(config),
+                                  force=True)
+        scheduler.run()
+        self.check_order(self.read_record())
+        os.remove(self.recordFileName)
+
+        # a failed task runs again next time, along with its dependents
+        scheduler = TaskScheduler(config, self.setup_tasks(
+            config, failingTasks=['right']), force=True)
+        scheduler.run()
+        os.remove(self.recordFileName)
+        scheduler = TaskScheduler(config, self.setup_tasks(config))
+        scheduler.run()
+        assert(sorted(self.read_record()) == ['last', 'right'])
+
+    def test_fingerprint_order(self):
+        config = self.setup_config(parallelTaskCount=1)
+        runState = RunState('{}/run_state.json'.format(self.test_dir),
+                            config, ['first'])
+
+        # tasks set up in parallel threads may add variables and seasons in
+        # any order, which doesn't change the fingerprint
+        fingerprints = []
+        for variableList, seasons in [(['a', 'b'], ['JFM', 'ANN']),
+                                      (['b', 'a'], ['ANN', 'JFM'])]:
+            analysisTask = RecordingTask(config, 'first',
+                                         self.recordFileName)
+            analysisTask.variableList = variableList
+            analysisTask.seasons = seasons
+            fingerprints.append(runState.compute_fingerprint(analysisTask))
+        assert(fingerprints[0] == fingerprints[1])
+
+        analysisTask.variableList = ['a', 'b', 'c']
+        assert(runState.compute_fingerprint(analysisTask) != fingerprints[0])
+
+    def test_performance_report(self):
+        config = self.setup_config(parallelTaskCount=2)
+        tasks = self.setup_tasks(config, failingTasks=['right'])
+        scheduler = TaskScheduler(config, tasks)
+        scheduler.run()
+
+        records = read_performance_report(config)
+        statuses = dict([(record['taskName'], record['status']) for record
+                         in records])
+        # 'last' never ran, so it isn't in the report
+        assert(statuses == {'first': 'success', 'left': 'success',
+                            'right': 'fail', 'other': 'success'})
+        for record in records:
+            assert(record['wallTime'] >= 0.)
+            assert(record['cpuTime'] >= 0.)
+            assert(record['peakMemory'] > 0.)
+
+        with open('{}/logs/performance.csv'.format(self.test_dir)) as \
+                csvFile:
+            lines = csvFile.readlines()
+        assert(lines[0].startswith('taskName,status,wallTime'))
+        assert(len(lines) == 5)
+
+    def run_sleeping_tasks(self, config):
+        tasks = OrderedDict()
+        for taskName in ['big1', 'big2']:
+            tasks[(taskName, None)] = SleepingTask(config, taskName,
+                                                   self.recordFileName)
+            tasks[(taskName, None)].memoryEstimate = 3.
+
+        scheduler = TaskScheduler(config, tasks, force=True)
+        tasksWithErrors = scheduler.run()
+        assert(tasksWithErrors == [])
+        return self.read_record()
+
+    def test_memory_budget(self):
+        # both tasks fit in the memory budget, so they run at the same time
+        config = self.setup_config(parallelTaskCount=2, maxMemory=8.)
+        record = self.run_sleeping_tasks(config)
+        assert(record[0].startswith('start'))
+        assert(record[1].startswith('start'))
+
+        os.remove(self.recordFileName)
+        os.remove('{}/logs/task_history.json'.format(self.test_dir))
+
+        # only one task fits in the memory budget at a time
+        config = self.setup_config(parallelTaskCount=2, maxMemory=4.)
+        record = self.run_sleeping_tasks(config)
+        assert(record[0].startswith('start'))
+        assert(record[1].startswith('end'))
+        assert(record[2].startswith('start'))
+        assert(record[3].startswith('end'))
+
+    def test_memory_reservation(self):
+        # 'big' has the highest priority but doesn't fit in memory alongside
+        # 'running', which is expected to finish in about 10 seconds.
+        # 'short' can run in the meantime, but 'long' would keep 'big'
+        # waiting long after 'running' has finished
+        config = self.setup_config(parallelTaskCount=3, maxMemory=8.)
+        historyFileName = '{}/logs/task_history.json'.format(self.test_dir)
+        history = OrderedDict([('running', (10., 3.)), ('big', (20., 6.)),
+                               ('long', (100., 3.)), ('short', (1., 1.))])
+        with open(historyFileName, 'w') as historyFile:
+            json.dump({taskName: {'runDuration': duration,
+                                  'peakMemory': memory}
+                       for taskName, (duration, memory) in history.items()},
+                      historyFile)
+
+        tasks = OrderedDict()
+        for taskName in history:
+            tasks[(taskName, None)] = RecordingTask(config, taskName,
+                                                    self.recordFileName)
+
+        launcher = RecordingLauncher()
+        scheduler = TaskScheduler(config, tasks, launcher=launcher,
+                                  force=True)
+
+        runningKey = ('running', None)
+        scheduler._runningTasks[runningKey] = tasks[runningKey]
+        scheduler._startTimes[runningKey] = time.time()
+        scheduler._usedSlots = 1
+        scheduler._usedMemory = 3.
+        scheduler._freeLanes.pop(0)
+
+        scheduler._priorities = {('big', None): 3., ('long', None): 2.,
+                                 ('short', None): 1.}
+        scheduler._readyQueue = []
+        for taskName in ['big', 'long', 'short']:
+            scheduler._push_ready((taskName, None))
+
+        scheduler._launch_ready_tasks()
+        assert(launcher.launched == ['short'])
+        assert(sorted([key for _, _, key in scheduler._readyQueue]) ==
+               [('big', None), ('long', None)])
+
+    def test_cpu_count(self):
+        # a task that uses all the slots runs on its own
+        config = self.setup_config(parallelTaskCount=2)
+        tasks = OrderedDict()
+        for taskName in ['wide', 'narrow']:
+            tasks[(taskName, None)] = SleepingTask(config, taskName,
+                                                   self.recordFileName)
+        tasks[('wide', None)].cpuCount = 12
+
+        scheduler = TaskScheduler(config, tasks)
+        tasksWithErrors = scheduler.run()
+        assert(tasksWithErrors == [])
+        assert(self.read_record() == ['start wide', 'end wide',
+                                      'start narrow', 'end narrow'])
+
+    def test_chrome_trace(self):
+        config = self.setup_config(parallelTaskCount=2)
+        tasks = OrderedDict()
+        for taskName in ['phased1', 'phased2', 'phased3']:
+            tasks[(taskName, None)] = PhasedTask(config, taskName,
+                                                 self.recordFileName)
+        scheduler = TaskScheduler(config, tasks)
+        scheduler.run()
+
+        with open('{}/logs/trace.json'.format(self.test_dir)) as traceFile:
+            events = json.load(traceFile)['traceEvents']
+
+        laneNames = [event['args']['name'] for event in events
+                     if event['name'] == 'thread_name']
+        assert(laneNames == ['slot 0', 'slot 1'])
+
+        taskSpans = dict([(event['name'], event) for event in events
+                          if event.get('cat') == 'task'])
+        assert(sorted(taskSpans.keys()) == ['phased1', 'phased2', 'phased3'])
+        # the first two tasks ran at the same time in different lanes
+        assert(taskSpans['phased1']['tid'] != taskSpans['phased2']['tid'])
+
+        phaseSpans = [event for event in events
+                      if event.get('cat') == 'phase']
+        assert(len(phaseSpans) == 6)
+        for phaseSpan in phaseSpans:
+            taskSpan = taskSpans[phaseSpan['args']['taskName']]
+            assert(phaseSpan['name'] in ['compute', 'plot'])
+            assert(phaseSpan['tid'] == taskSpan['tid'])
+            assert(phaseSpan['ts'] >= taskSpan['ts'])
+            assert(phaseSpan['ts'] + phaseSpan['dur'] <=
+                   taskSpan['ts'] + taskSpan['dur'])
+            if phaseSpan['name'] == 'compute':
+                assert(phaseSpan['dur'] >= 200000)
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python
@@ -0,0 +1,121 @@
+"""
+Unit tests for caching time series
+
+Xylar Asay-Davis
+"""
+
+import pytest
+import tempfile
+import shutil
+import numpy
+import xarray
+import netCDF4
+
+from mpas_analysis.test import TestCase
+from mpas_analysis.shared.time_series import cache_time_series
+from mpas_analysis.shared.constants import constants
+
+
+class TestTimeSeries(TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        self.cacheFileName = '{}/cache.nc'.format(self.test_dir)
+
+    def tearDown(self):
+        # Remove the directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def get_times(self, startYear, endYear):
+        # the middle of each month in days since 0001-01-01 on a noleap
+        # calendar
+        daysInMonth = numpy.array(constants.daysInMonth, float)
+        monthStarts = numpy.cumsum(daysInMonth) - daysInMonth
+        years = numpy.arange(startYear, endYear+1)
+        return (365.*(years[:, numpy.newaxis]-1) + monthStarts +
+                0.5*daysInMonth).ravel()
+
+    def cache(self, times, callTimes):
+        def compute(timeIndices, firstCall):
+            callTimes.append(times[timeIndices])
+            ds = xarray.Dataset()
+            ds['Time'] = ('Time', times[timeIndices])
+            ds['index'] = ('Time', 2.*times[timeIndices])
+            ds['field'] = (('nCells', 'Time'),
+                           numpy.outer(numpy.arange(3.), times[timeIndices]))
+            ds['area'] = ('nCells', numpy.ones(3))
+            return ds
+
+        return cache_time_series(times, compute, self.cacheFileName,
+                                 calendar='gregorian_noleap',
+                                 yearsPerCacheUpdate=2)
+
+    def check(self, ds, times):
+        assert(numpy.all(ds.Time.values == times))
+        assert(numpy.all(ds.index.values == 2.*times))
+        assert(numpy.all(ds.field.values ==
+                         numpy.outer(numpy.arange(3.), times)))
+
+    def test_cache_time_series(self):
+        callTimes = []
+        ds = self.cache(self.get_times(3, 7), callTimes)
+        self.check(ds, self.get_times(3, 7))
+        # years 3-4, 5-6 and 7
+        assert(len(callTimes) == 3)
+
+        # extending the time series in both directions only computes the new
+        # years, which are appended to the cache out of order
+        callTimes = []
+        ds = self.cache(self.get_times(1, 9), callTimes)
+        self.check(ds, self.get_times(1, 9))
+        assert(numpy.all(numpy.concatenate(callTimes) ==
+                         numpy.concatenate([self.get_times(1, 2),
+                                            self.get_times(8, 9)])))
+
+        with xarray.open_dataset(self.cacheFileName,
+                                 decode_times=False) as dsCache:
+            assert(dsCache.sizes['Time'] == 9*12)
+            assert(not numpy.all(numpy.diff(dsCache.Time.values) > 0.))
+
+        # a subset is read from the cache without computing anything
+        callTimes = []
+        ds = self.cache(self.get_times(2, 4), callTimes)
+        self.check(ds, self.get_times(2, 4))
+        assert(len(callTimes) == 0)
+
+    def test_interrupted_append(self):
+        callTimes = []
+        self.cache(self.get_times(1, 2), callTimes)
+
+        # an append that was interrupted before Time was written
+        with netCDF4.Dataset(self.cacheFileName, 'a') as ncFile:
+            ncFile.variables['index'][24:36] = numpy.zeros(12)
+
+        callTimes = []
+        ds = self.cache(self.get_times(1, 3), callTimes)
+        self.check(ds, self.get_times(1, 3))
+        assert(numpy.all(numpy.concatenate(callTimes) ==
+                         self.get_times(3, 3)))
+
+    def test_fixed_time_cache(self):
+        # a cache written before Time was unlimited
+        times = self.get_times(1, 2)
+        ds = xarray.Dataset()
+        ds['Time'] = ('Time', times)
+        ds['index'] = ('Time', 2.*times)
+        ds['field'] = (('nCells', 'Time'),
+                       numpy.outer(numpy.arange(3.), times))
+        ds['area'] = ('nCells', numpy.ones(3))
+        ds.to_netcdf(self.cacheFileName)
+
+        callTimes = []
+        ds = self.cache(self.get_times(1, 3), callTimes)
+        self.check(ds, self.get_times(1, 3))
+        assert(numpy.all(numpy.concatenate(callTimes) ==
+                         self.get_times(3, 3)))
+
+        with netCDF4.Dataset(self.cacheFileName, 'r') as ncFile:
+            assert(ncFile.dimensions['Time'].isunlimited())
+
+
+# vim: foldmethod=marker ai ts=4 sts=4 et sw=4 ft=python